@@ -22,7 +22,6 @@
 #            Michael Fulbright <msf@redhat.com>
 #
 
-import inspect
 import logging
 from logging.handlers import SysLogHandler, SYSLOG_UDP_PORT
 import os
@@ -59,20 +58,42 @@ def setHandlersLevel(logger, level):
     map(lambda hdlr: hdlr.setLevel(level),
         filter (lambda hdlr: hasattr(hdlr, "autoSetLevel") and hdlr.autoSetLevel, logger.handlers))
 
+# set to False (see set_method_tracing) to skip storage call tracing entirely
+trace_method_calls = True
+
+storage_log = logging.getLogger("storage")
+
+TRACE_IGNORED_FUNCS = frozenset(["function_name_and_depth",
+                                 "log_method_call",
+                                 "log_method_return"])
+
+def set_method_tracing(enabled):
+    """ Turn log_method_call and log_method_return on or off. """
+    global trace_method_calls
+    trace_method_calls = enabled
+
 def function_name_and_depth():
-    IGNORED_FUNCS = ["function_name_and_depth",
-                     "log_method_call",
-                     "log_method_return"]
-    stack = inspect.stack()
+    # walking the frames is all we need; inspect.stack() would also read
+    # the source for every one of them
+    frame = sys._getframe(1)
+    while frame and frame.f_code.co_name in TRACE_IGNORED_FUNCS:
+        frame = frame.f_back
 
-    for i, frame in enumerate(stack):
-        methodname = frame[3]
-        if methodname not in IGNORED_FUNCS:
-            return (methodname, len(stack) - i)
+    if frame is None:
+        return ("unknown function?", 0)
 
-    return ("unknown function?", 0)
+    methodname = frame.f_code.co_name
+    depth = 0
+    while frame:
+        depth += 1
+        frame = frame.f_back
+
+    return (methodname, depth)
 
 def log_method_call(d, *args, **kwargs):
+    if not trace_method_calls or not storage_log.isEnabledFor(logging.DEBUG):
+        return
+
     classname = d.__class__.__name__
     (methodname, depth) = function_name_and_depth()
     spaces = depth * ' '
@@ -87,15 +108,18 @@ def log_method_call(d, *args, **kwargs):
         fmt += " %s: %s ;"
         fmt_args.extend([k, v])
 
-    logging.getLogger("storage").debug(fmt % tuple(fmt_args))
+    # the message only gets formatted if a handler wants it
+    storage_log.debug(fmt, *fmt_args)
 
 def log_method_return(d, retval):
+    if not trace_method_calls or not storage_log.isEnabledFor(logging.DEBUG):
+        return
+
     classname = d.__class__.__name__
     (methodname, depth) = function_name_and_depth()
     spaces = depth * ' '
     fmt = "%s%s.%s returned %s"
-    fmt_args = (spaces, classname, methodname, retval)
-    logging.getLogger("storage").debug(fmt % fmt_args)
+    storage_log.debug(fmt, spaces, classname, methodname, retval)
 
 class AnacondaSyslogHandler(SysLogHandler):
     def __init__(self,
@@ -163,6 +163,14 @@ class AnacondaBackend:
     def deselectPackage(self, pkg, *args):
         log.warning("deselectPackage not implemented for backend!")
 
+    # select and exclude whole lists of packages and groups, as found in a
+    # kickstart %packages section, and return the (packages, groups) that
+    # don't exist
+    def selectPackages(self, packages, groups, excludedPackages=[],
+                       excludedGroups=[]):
+        log.warning("selectPackages not implemented for backend!")
+        return ([], [])
+
     def getDefaultGroups(self, anaconda):
         log.warning("getDefaultGroups not implemented for backend!")
         return []
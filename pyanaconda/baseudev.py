@@ -22,7 +22,9 @@
 #
 
 import iutil
+import timing
 import os
+import time
 
 import pyudev
 global_udev = pyudev.Udev()
@@ -76,13 +78,61 @@ def udev_parse_uevent_file(dev):
 
     return dev
 
+# udev_settle bookkeeping, see udev_settle_stats
+_settle_seqnum = None       # kernel uevent seqnum udev was last settled at
+_settle_calls = 0
+_settle_skipped = 0
+_settle_time = 0.0
+
+def udev_get_uevent_seqnum():
+    """ Return the number of the last uevent the kernel sent, or None. """
+    try:
+        with open("/sys/kernel/uevent_seqnum") as f:
+            return int(f.read().strip())
+    except (IOError, ValueError):
+        return None
+
+@timing.timed("udev")
 def udev_settle():
+    global _settle_seqnum, _settle_calls, _settle_skipped, _settle_time
+    _settle_calls += 1
+
+    # if the kernel has not sent a single uevent since we last waited for
+    # udev to process them all, there is nothing to wait for
+    seqnum = udev_get_uevent_seqnum()
+    if seqnum is not None and seqnum == _settle_seqnum:
+        _settle_skipped += 1
+        return
+
     # wait maximal 300 seconds for udev to be done running blkid, lvm,
     # mdadm etc. This large timeout is needed when running on machines with
     # lots of disks, or with slow disks
     argv = ["settle", "--timeout=300"]
 
-    iutil.execWithRedirect("udevadm", argv, stderr="/dev/null")
+    start = time.time()
+    rc = iutil.execWithRedirect("udevadm", argv, stderr="/dev/null")
+    _settle_time += time.time() - start
+
+    # udev is done with everything up to seqnum, unless we timed out
+    if rc == 0:
+        _settle_seqnum = seqnum
+    else:
+        _settle_seqnum = None
+
+def udev_settle_stats():
+    """ Return a (calls, skipped, seconds) tuple describing udev_settle use.
+
+        calls is the number of times udev_settle has been called, skipped
+        is how many of those calls returned without waiting, and seconds
+        is the total wall time spent waiting for udev.
+    """
+    return (_settle_calls, _settle_skipped, _settle_time)
+
+def udev_log_settle_stats():
+    """ Write the udev_settle statistics to the log. """
+    (calls, skipped, seconds) = udev_settle_stats()
+    log.info("udev settle: %d calls, %d skipped, %.2f seconds waited"
+             % (calls, skipped, seconds))
 
 def udev_trigger(subsystem=None, action="add"):
     argv = ["trigger", "--action=%s" % action]
@@ -68,6 +68,18 @@ class Flags(object):
         # device is
         self.virtpconsole = None
         self.gpt = False
+        # number of threads used to probe storage devices, 0 to probe them
+        # one at a time while building the device tree
+        self.probeThreads = 0
+        # number of format actions executed at once while committing the
+        # storage configuration
+        self.actionWorkers = 1
+        # number of threads downloading repository metadata, 0 to download
+        # it one repository at a time while setting them up
+        self.repoThreads = 0
+        # directory (or nfs:server:/path) where repository metadata is
+        # kept between installs, None for no such cache
+        self.repoCache = None
         # parse the boot commandline
         self.cmdline = BootArgs()
         # Lock it down: no more creating new flags!
@@ -88,6 +100,27 @@ class Flags(object):
         if "gpt" in self.cmdline:
             self.gpt = True
 
+        if "probethreads" in self.cmdline:
+            try:
+                self.probeThreads = int(self.cmdline.get("probethreads"))
+            except (TypeError, ValueError):
+                pass
+
+        if "actionworkers" in self.cmdline:
+            try:
+                self.actionWorkers = int(self.cmdline.get("actionworkers"))
+            except (TypeError, ValueError):
+                pass
+
+        if "repothreads" in self.cmdline:
+            try:
+                self.repoThreads = int(self.cmdline.get("repothreads"))
+            except (TypeError, ValueError):
+                pass
+
+        if "repocache" in self.cmdline:
+            self.repoCache = self.cmdline.get("repocache")
+
 cmdline_files = ['/proc/cmdline', '/run/initramfs/etc/cmdline',
                  '/run/initramfs/etc/cmdline.d/*.conf', '/etc/cmdline']
 class BootArgs(OrderedDict):
@@ -31,6 +31,7 @@ import threading
 
 from flags import flags
 from constants import *
+import timing
 
 import gettext
 _ = lambda x: gettext.ldgettext("anaconda", x)
@@ -45,6 +46,9 @@ class ExecProduct(object):
         self.stdout = stdout
         self.stderr = stderr
 
+def _commandLine(command, argv, *args, **kwargs):
+    return " ".join([command] + list(argv))
+
 #Python reimplementation of the shell tee process, so we can
 #feed the pipe output into two places at the same time
 class tee(threading.Thread):
@@ -82,6 +86,7 @@ class tee(threading.Thread):
 # @param stderr The file descriptor to redirect stderr to.
 # @param root The directory to chroot to before running command.
 # @return The return code of command.
+@timing.timed("exec", name=_commandLine)
 def execWithRedirect(command, argv, stdin = None, stdout = None,
                      stderr = None, root = '/', env_prune=[]):
     def chroot ():
@@ -189,6 +194,7 @@ def execWithRedirect(command, argv, stdin = None, stdout = None,
 # @param stderr The file descriptor to redirect stderr to.
 # @param root The directory to chroot to before running command.
 # @return The output of command from stdout.
+@timing.timed("exec", name=_commandLine)
 def execWithCapture(command, argv, stdin = None, stderr = None, root='/'):
     def chroot():
         os.chroot(root)
@@ -251,6 +257,7 @@ def execWithCapture(command, argv, stdin = None, stderr = None, root='/'):
     closefds()
     return rc
 
+@timing.timed("exec", name=_commandLine)
 def execWithCallback(command, argv, stdin = None, stdout = None,
                      stderr = None, echo = True, callback = None,
                      callback_data = None, root = '/'):
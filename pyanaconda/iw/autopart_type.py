@@ -31,6 +31,7 @@ from pixmapRadioButtonGroup_gui import pixmapRadioButtonGroup
 from iw_gui import *
 from pyanaconda.flags import flags
 from pyanaconda.storage.deviceaction import *
+from pyanaconda.storage.formats.fs import prefetchMinSizes
 
 import gettext
 _ = lambda x: gettext.ldgettext("anaconda", x)
@@ -63,6 +64,10 @@ def whichToShrink(storage, intf):
     combo.set_attributes(crt, text = 0)
     combo.connect("changed", comboCB, dxml.get_widget("shrinkSB"))
 
+    # the minimum size is needed as soon as a partition gets picked
+    prefetchMinSizes([p.format for p in storage.partitions
+                        if p.exists and p.resizable and p.format.resizable])
+
     biggest = -1
     for part in storage.partitions:
         if not part.exists:
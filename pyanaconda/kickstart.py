@@ -29,7 +29,6 @@ import storage.iscsi
 import storage.fcoe
 import storage.zfcp
 
-from yuminstall import NoSuchGroup
 import iutil
 import isys
 import os
@@ -1499,7 +1498,6 @@ def runTracebackScripts(anaconda):
 
 def selectPackages(anaconda):
     ksdata = anaconda.ksdata
-    ignoreAll = False
 
     # If no %packages header was seen, use the installclass's default group
     # selections.  This can also be explicitly specified with %packages
@@ -1509,27 +1507,6 @@ def selectPackages(anaconda):
         if not packagesSeen:
             return
 
-    for pkg in ksdata.packages.packageList:
-        num = anaconda.backend.selectPackage(pkg)
-        if ksdata.packages.handleMissing == KS_MISSING_IGNORE or ignoreAll:
-            continue
-        if num > 0:
-            continue
-        rc = anaconda.intf.messageWindow(_("Missing Package"),
-                                _("You have specified that the "
-                                  "package '%s' should be installed.  "
-                                  "This package does not exist. "
-                                  "Would you like to continue or "
-                                  "abort this installation?") %(pkg,),
-                                type="custom",
-                                custom_buttons=[_("_Abort"),
-                                                _("_Ignore All"),
-                                                _("_Continue")])
-        if rc == 0:
-            sys.exit(1)
-        elif rc == 1:
-            ignoreAll = True
-
     ksdata.packages.groupList.insert(0, Group("Core"))
 
     if ksdata.packages.addBase:
@@ -1537,6 +1514,7 @@ def selectPackages(anaconda):
     else:
         log.warning("not adding Base group")
 
+    groups = []
     for grp in ksdata.packages.groupList:
         default = False
         optional = False
@@ -1547,31 +1525,30 @@ def selectPackages(anaconda):
             default = True
             optional = True
 
-        try:
-            anaconda.backend.selectGroup(grp.name, (default, optional))
-        except NoSuchGroup as e:
-            if ksdata.packages.handleMissing == KS_MISSING_IGNORE or ignoreAll:
-                pass
-            else:
-                rc = anaconda.intf.messageWindow(_("Missing Group"),
-                                        _("You have specified that the "
-                                          "group '%s' should be installed. "
-                                          "This group does not exist. "
-                                          "Would you like to continue or "
-                                          "abort this installation?")
-                                        %(grp.name,),
-                                        type="custom",
-                                        custom_buttons=[_("_Abort"),
-                                                        _("_Ignore All"),
-                                                        _("_Continue")])
-                if rc == 0:
-                    sys.exit(1)
-                elif rc == 1:
-                    ignoreAll = True
-
-    map(anaconda.backend.deselectPackage, ksdata.packages.excludedList)
-    map(lambda g: anaconda.backend.deselectGroup(g.name),
-        ksdata.packages.excludedGroupList)
+        groups.append((grp.name, (default, optional)))
+
+    (missingPackages, missingGroups) = anaconda.backend.selectPackages(
+                            ksdata.packages.packageList, groups,
+                            ksdata.packages.excludedList,
+                            [g.name for g in ksdata.packages.excludedGroupList])
+
+    if ksdata.packages.handleMissing == KS_MISSING_IGNORE:
+        return
+
+    missing = missingPackages + ["@" + g for g in missingGroups]
+    if missing:
+        rc = anaconda.intf.messageWindow(_("Missing Packages"),
+                                _("You have specified that the following "
+                                  "packages and groups should be installed, "
+                                  "but they do not exist:\n\n%s\n\n"
+                                  "Would you like to continue or abort "
+                                  "this installation?")
+                                % ("\n".join(missing),),
+                                type="custom",
+                                custom_buttons=[_("_Abort"),
+                                                _("_Continue")])
+        if rc == 0:
+            sys.exit(1)
 
 def setSteps(anaconda):
     def havePackages(packages):
@@ -25,10 +25,14 @@
 #
 
 import os, sys
+import errno
 import stat
 import shutil
 import time
 import subprocess
+import threading
+import Queue
+import ctypes
 import storage
 
 import selinux
@@ -50,63 +54,536 @@ log = logging.getLogger("anaconda")
 
 class Error(EnvironmentError):
     pass
-def copytree(src, dst, symlinks=False, preserveOwner=False,
-             preserveSelinux=False):
-    def tryChown(src, dest):
+# size of the blocks files are read and written in when the kernel cannot
+# copy them; blocks of a sparse file that are all zeros are skipped, leaving
+# a hole in the copy
+COPY_BLOCK_SIZE = 64 * 1024
+
+# number of directories copied at once when moving the live image's
+# content onto separate filesystems
+COPY_THREADS = 4
+
+try:
+    _copy_file_range = ctypes.CDLL(None, use_errno=True).copy_file_range
+    _copy_file_range.restype = ctypes.c_ssize_t
+    _copy_file_range.argtypes = [ctypes.c_int, ctypes.c_void_p, ctypes.c_int,
+                                 ctypes.c_void_p, ctypes.c_size_t,
+                                 ctypes.c_uint]
+except (OSError, AttributeError):
+    _copy_file_range = None
+
+try:
+    _sendfile = ctypes.CDLL(None, use_errno=True).sendfile64
+    _sendfile.restype = ctypes.c_ssize_t
+    _sendfile.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.c_void_p,
+                          ctypes.c_size_t]
+except (OSError, AttributeError):
+    _sendfile = None
+
+def _copyFileRange(infd, outfd, count):
+    return _copy_file_range(infd, None, outfd, None, count, 0)
+
+def _sendfileCopy(infd, outfd, count):
+    return _sendfile(outfd, infd, None, count)
+
+class KernelCopy(object):
+    """ Copy data from one file descriptor to another inside the kernel.
+
+        copy_file_range is tried first, then sendfile.  Once one of them
+        fails with ENOSYS, EXDEV or EINVAL, because the kernel, the
+        filesystems or the kinds of files involved do not support it, it is
+        not tried again.
+    """
+    def __init__(self, infd, outfd):
+        self.infd = infd
+        self.outfd = outfd
+        self.methods = []
+        if _copy_file_range:
+            self.methods.append(_copyFileRange)
+        if _sendfile:
+            self.methods.append(_sendfileCopy)
+
+    def copy(self, count):
+        """ Copy up to count bytes from and advancing both file offsets.
+
+            Return the number of bytes copied, which is 0 at the end of the
+            input, or None if the kernel cannot copy between the two files
+            and read and write have to.
+        """
+        while self.methods:
+            ret = self.methods[0](self.infd, self.outfd, count)
+            if ret >= 0:
+                return ret
+
+            err = ctypes.get_errno()
+            if err == errno.EINTR:
+                continue
+            elif err not in (errno.ENOSYS, errno.EXDEV, errno.EINVAL):
+                raise OSError(err, os.strerror(err))
+
+            self.methods.pop(0)
+
+        return None
+
+class TreeCopier(object):
+    """ Copy a directory tree on a pool of threads, one directory at a time.
+
+        File data is copied by the kernel where it can be.  Files with more
+        than one link are copied once and then linked to from the copy once
+        all the threads are done, and holes in sparse files stay holes.  The metadata of the directories is set once
+        everything has been copied, since copying into a directory changes
+        its mtime.
+    """
+    def __init__(self, symlinks=False, preserveOwner=False,
+                 preserveSelinux=False, threads=1):
+        self.symlinks = symlinks
+        self.preserveOwner = preserveOwner
+        self.preserveSelinux = preserveSelinux
+        self.threads = max(threads, 1)
+
+        self.files = 0
+        self.bytes = 0
+        self._errors = []
+        self._dirs = []             # (src, dst) of every directory copied
+        self._links = {}            # (st_dev, st_ino) -> first copy's path
+        self._linksLater = []       # (src, dst, key) of the other links
+        self._queue = Queue.Queue()
+        self._pending = 0           # directories queued or being copied
+        self._cond = threading.Condition()
+
+    def _error(self, src, dst, why):
+        with self._cond:
+            self._errors.append((src, dst, why))
+
+    def _tryChown(self, src, dest):
         try:
-            os.chown(dest, os.stat(src)[stat.ST_UID], os.stat(src)[stat.ST_GID])
+            st = os.stat(src)
+            os.chown(dest, st[stat.ST_UID], st[stat.ST_GID])
         except OverflowError:
             log.error("Could not set owner and group on file %s" % dest)
 
-    def trySetfilecon(src, dest):
+    def _trySetfilecon(self, src, dest):
         try:
             selinux.lsetfilecon(dest, selinux.lgetfilecon(src)[1])
         except OSError:
             log.error("Could not set selinux context on file %s" % dest)
 
-    # copy of shutil.copytree which doesn't require dst to not exist
-    # and which also has options to preserve the owner and selinux contexts
-    names = os.listdir(src)
-    if not os.path.isdir(dst):
-        os.makedirs(dst)
-    errors = []
-    for name in names:
-        srcname = os.path.join(src, name)
-        dstname = os.path.join(dst, name)
+    def _copyData(self, src, dst, st):
+        # the holes of a sparse file are found by reading it block by block;
+        # anything else is copied by the kernel, if it can
+        sparse = st.st_blocks * 512 < st.st_size
+        zeros = "\0" * COPY_BLOCK_SIZE
+        copied = 0
+
+        infd = os.open(src, os.O_RDONLY)
         try:
-            if symlinks and os.path.islink(srcname):
-                linkto = os.readlink(srcname)
-                os.symlink(linkto, dstname)
-                if preserveSelinux:
-                    trySetfilecon(srcname, dstname)
-            elif os.path.isdir(srcname):
-                copytree(srcname, dstname, symlinks, preserveOwner, preserveSelinux)
-            else:
-                shutil.copyfile(srcname, dstname)
-                if preserveOwner:
-                    tryChown(srcname, dstname)
+            outfd = os.open(dst, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0666)
+            try:
+                if not sparse:
+                    kernel = KernelCopy(infd, outfd)
+                    while True:
+                        length = kernel.copy(max(st.st_size, COPY_BLOCK_SIZE))
+                        if not length:
+                            break
+                        copied += length
+
+                    if length == 0:
+                        return copied
+
+                while True:
+                    buf = os.read(infd, COPY_BLOCK_SIZE)
+                    if not buf:
+                        break
+
+                    copied += len(buf)
+                    if sparse and buf == zeros[:len(buf)]:
+                        os.lseek(outfd, len(buf), os.SEEK_CUR)
+                        continue
+
+                    while buf:
+                        buf = buf[os.write(outfd, buf):]
+
+                # a trailing hole needs the file extended over it
+                if sparse:
+                    os.ftruncate(outfd, copied)
+            finally:
+                os.close(outfd)
+        finally:
+            os.close(infd)
+
+        return copied
+
+    def _copyFile(self, src, dst):
+        st = os.stat(src)
+        if not stat.S_ISREG(st.st_mode):
+            raise shutil.SpecialFileError("`%s` is not a regular file" % src)
+
+        if st.st_nlink > 1:
+            # the first copy may still be in the works, so only claim it
+            key = (st.st_dev, st.st_ino)
+            with self._cond:
+                if key in self._links:
+                    self._linksLater.append((src, dst, key))
+                    return
+                self._links[key] = None
+
+            try:
+                self._copyRegular(src, dst, st)
+            except:
+                with self._cond:
+                    del self._links[key]
+                raise
 
-                if preserveSelinux:
-                    trySetfilecon(srcname, dstname)
+            with self._cond:
+                self._links[key] = dst
+            return
 
-                shutil.copystat(srcname, dstname)
-        except (IOError, OSError) as why:
-            errors.append((srcname, dstname, str(why)))
-        # catch the Error from the recursive copytree so that we can
-        # continue with other files
-        except Error as err:
-            errors.extend(err.args[0])
-    try:
-        if preserveOwner:
-            tryChown(src, dst)
-        if preserveSelinux:
-            trySetfilecon(src, dst)
+        self._copyRegular(src, dst, st)
+
+    def _copyRegular(self, src, dst, st):
+        copied = self._copyData(src, dst, st)
+        if self.preserveOwner:
+            self._tryChown(src, dst)
+
+        if self.preserveSelinux:
+            self._trySetfilecon(src, dst)
 
         shutil.copystat(src, dst)
-    except OSError as e:
-        errors.extend((src, dst, e.strerror))
-    if errors:
-        raise Error, errors
+        with self._cond:
+            self.files += 1
+            self.bytes += copied
+
+    def _copyLinks(self):
+        """ Link the files with more than one link to their first copy. """
+        for (src, dst, key) in self._linksLater:
+            try:
+                # if the first copy failed, this one becomes the first
+                first = self._links.get(key)
+                if first is None:
+                    self._copyFile(src, dst)
+                    continue
+
+                if os.path.lexists(dst):
+                    os.unlink(dst)
+                os.link(first, dst)
+            except EnvironmentError as why:
+                self._errors.append((src, dst, str(why)))
+
+    def _copyDir(self, src, dst):
+        try:
+            names = os.listdir(src)
+            if not os.path.isdir(dst):
+                os.makedirs(dst)
+        except (IOError, OSError) as why:
+            self._error(src, dst, str(why))
+            return
+
+        with self._cond:
+            self._dirs.append((src, dst))
+
+        for name in names:
+            srcname = os.path.join(src, name)
+            dstname = os.path.join(dst, name)
+            try:
+                if self.symlinks and os.path.islink(srcname):
+                    linkto = os.readlink(srcname)
+                    os.symlink(linkto, dstname)
+                    if self.preserveSelinux:
+                        self._trySetfilecon(srcname, dstname)
+                elif os.path.isdir(srcname):
+                    self._put(srcname, dstname)
+                else:
+                    self._copyFile(srcname, dstname)
+            except EnvironmentError as why:
+                self._error(srcname, dstname, str(why))
+
+    def _put(self, src, dst):
+        with self._cond:
+            self._pending += 1
+        self._queue.put((src, dst))
+
+    def _worker(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+
+            try:
+                self._copyDir(*item)
+            except Exception as e:
+                self._error(item[0], item[1], str(e))
+
+            with self._cond:
+                self._pending -= 1
+                self._cond.notifyAll()
+
+    def copy(self, src, dst, callback=None):
+        """ Copy the tree at src to dst, which need not exist yet.
+
+            Arguments:
+
+                src -- the directory to copy
+                dst -- the directory to copy it to
+
+            Keyword Arguments:
+
+                callback -- a function called with the number of bytes
+                            copied so far every now and then while copying
+
+            Raise Error with a list of (src, dst, why) tuples if anything
+            could not be copied.
+        """
+        # just like shutil.copytree, fail right away on a missing source
+        os.listdir(src)
+
+        start = time.time()
+        pool = [threading.Thread(target=self._worker, name="copytree-%d" % i)
+                    for i in range(self.threads)]
+        for thread in pool:
+            thread.daemon = True
+            thread.start()
+
+        self._put(src, dst)
+        while True:
+            with self._cond:
+                if not self._pending:
+                    break
+                self._cond.wait(0.25)
+                copied = self.bytes
+
+            if callback:
+                callback(copied)
+
+        for thread in pool:
+            self._queue.put(None)
+        for thread in pool:
+            thread.join()
+
+        self._copyLinks()
+
+        # now that nothing gets copied into them anymore, set the metadata
+        # of the directories
+        for (dirsrc, dirdst) in self._dirs:
+            try:
+                if self.preserveOwner:
+                    self._tryChown(dirsrc, dirdst)
+                if self.preserveSelinux:
+                    self._trySetfilecon(dirsrc, dirdst)
+
+                shutil.copystat(dirsrc, dirdst)
+            except OSError as e:
+                self._errors.append((dirsrc, dirdst, e.strerror))
+
+        elapsed = max(time.time() - start, 0.001)
+        log.info("copied %d files (%d MB) from %s in %.1f seconds, %.1f MB/s"
+                 % (self.files, self.bytes / 1024 / 1024, src, elapsed,
+                    self.bytes / 1024.0 / 1024.0 / elapsed))
+
+        if self._errors:
+            raise Error, self._errors
+
+# posix_fadvise advice values from <fcntl.h>
+POSIX_FADV_SEQUENTIAL = 2
+POSIX_FADV_DONTNEED = 4
+
+try:
+    _posix_fadvise = ctypes.CDLL(None).posix_fadvise64
+    _posix_fadvise.argtypes = [ctypes.c_int, ctypes.c_longlong,
+                               ctypes.c_longlong, ctypes.c_int]
+except (OSError, AttributeError):
+    _posix_fadvise = None
+
+def fadvise(fd, offset, length, advice):
+    """ Tell the kernel how fd is going to be accessed, if we can. """
+    if _posix_fadvise:
+        _posix_fadvise(fd, offset, length, advice)
+
+class ImageReader(threading.Thread):
+    """ Read a file in chunks ahead of whoever is writing them out. """
+    def __init__(self, fd, offset, chunkSize, depth):
+        threading.Thread.__init__(self, name="image-reader")
+        self.daemon = True
+        self.fd = fd
+        self.offset = offset
+        self.chunkSize = chunkSize
+        self.chunks = Queue.Queue(depth)
+        self.stopped = False
+
+    def run(self):
+        # an error is handed over in place of a chunk; an empty chunk means
+        # we hit the end of the file
+        try:
+            os.lseek(self.fd, self.offset, 0)
+            while not self.stopped:
+                buf = os.read(self.fd, self.chunkSize)
+                self.chunks.put(buf)
+                if not buf:
+                    return
+        except (IOError, OSError) as e:
+            self.chunks.put(e)
+
+    def stop(self):
+        self.stopped = True
+        # make room for a chunk the thread may be waiting to hand over
+        try:
+            while True:
+                self.chunks.get_nowait()
+        except Queue.Empty:
+            pass
+
+        self.join()
+
+class ImageCopier(object):
+    """ Copy an image file or device to another one, chunk by chunk.
+
+        The kernel does the copying where it can.  Otherwise, and if the
+        target is a regular file, in which chunks of zeros are skipped to
+        leave holes, the image is read on a separate thread, a few chunks
+        ahead of the writes.  Every syncInterval bytes the target is
+        synced, and a copy that failed can be resumed from the last offset
+        that was synced.
+    """
+    def __init__(self, srcfd, dstfd, chunkSize=8 * 1024 * 1024,
+                 readAhead=2, syncInterval=256 * 1024 * 1024):
+        self.srcfd = srcfd
+        self.dstfd = dstfd
+        self.chunkSize = chunkSize
+        self.readAhead = readAhead
+        self.syncInterval = syncInterval
+        self.sparse = stat.S_ISREG(os.fstat(dstfd).st_mode)
+        self.offset = 0             # where the last copy attempt got to
+        self.synced = 0             # everything up to here is on the disk
+
+    def _sync(self):
+        os.fdatasync(self.dstfd)
+        if self.offset > self.synced:
+            # neither side of what we have copied is needed again
+            length = self.offset - self.synced
+            fadvise(self.srcfd, self.synced, length, POSIX_FADV_DONTNEED)
+            fadvise(self.dstfd, self.synced, length, POSIX_FADV_DONTNEED)
+
+        self.synced = self.offset
+
+    def _copied(self, length, callback):
+        self.offset += length
+        if self.offset - self.synced >= self.syncInterval:
+            self._sync()
+
+        if callback:
+            callback(self.offset)
+
+    def _copyInKernel(self, callback):
+        """ Copy the rest of the image with KernelCopy.
+
+            Return False if the kernel cannot copy between the two.
+        """
+        os.lseek(self.srcfd, self.offset, 0)
+        kernel = KernelCopy(self.srcfd, self.dstfd)
+        while True:
+            length = kernel.copy(self.chunkSize)
+            if length is None:
+                return False
+            elif not length:
+                return True
+
+            self._copied(length, callback)
+
+    def _copyWithReader(self, callback):
+        """ Copy the rest of the image with read and write. """
+        zeros = "\0" * self.chunkSize
+        reader = ImageReader(self.srcfd, self.offset, self.chunkSize,
+                             self.readAhead)
+        reader.start()
+        try:
+            while True:
+                buf = reader.chunks.get()
+                if isinstance(buf, EnvironmentError):
+                    raise buf
+                elif not buf:
+                    break
+
+                if self.sparse and buf == zeros[:len(buf)]:
+                    os.lseek(self.dstfd, len(buf), 1)
+                else:
+                    data = buf
+                    while data:
+                        written = os.write(self.dstfd, data)
+                        if not written:
+                            raise IOError("short write to image target")
+                        data = data[written:]
+
+                self._copied(len(buf), callback)
+        finally:
+            reader.stop()
+
+    def copy(self, callback=None):
+        """ Copy everything from the last synced offset on.
+
+            Keyword Arguments:
+
+                callback -- a function called with the number of bytes
+                            copied so far after each chunk
+
+            IOError and OSError are passed on to the caller, who can call
+            copy again to resume.
+        """
+        start = time.time()
+        resumed = self.offset = self.synced
+        if resumed:
+            log.info("resuming image copy at %d MB" % (resumed / 1024 / 1024))
+
+        fadvise(self.srcfd, resumed, 0, POSIX_FADV_SEQUENTIAL)
+        os.lseek(self.dstfd, resumed, 0)
+        if self.sparse or not self._copyInKernel(callback):
+            self._copyWithReader(callback)
+
+        if self.sparse:
+            os.ftruncate(self.dstfd, self.offset)
+
+        self._sync()
+
+        elapsed = max(time.time() - start, 0.001)
+        copied = self.offset - resumed
+        log.info("copied %d MB of image in %.1f seconds, %.1f MB/s"
+                 % (copied / 1024 / 1024, elapsed,
+                    copied / 1024.0 / 1024.0 / elapsed))
+
+def treeSize(path):
+    """ Return the number of bytes in the regular files under path.
+
+        Files with more than one link are counted once, and symlinks are
+        not followed, just like TreeCopier does when copying symlinks.
+    """
+    size = 0
+    seen = set()
+    for (dirpath, dirnames, filenames) in os.walk(path):
+        for name in filenames:
+            try:
+                st = os.lstat(os.path.join(dirpath, name))
+            except OSError:
+                continue
+
+            if not stat.S_ISREG(st.st_mode):
+                continue
+            elif st.st_nlink > 1:
+                if (st.st_dev, st.st_ino) in seen:
+                    continue
+                seen.add((st.st_dev, st.st_ino))
+
+            size += st.st_size
+
+    return size
+
+def copytree(src, dst, symlinks=False, preserveOwner=False,
+             preserveSelinux=False, threads=1, callback=None):
+    """ Copy the tree at src to dst, which may already exist.
+
+        symlinks, preserveOwner and preserveSelinux say whether symlinks
+        are copied as symlinks rather than followed, and whether owners and
+        SELinux contexts are copied.  See TreeCopier for the rest.
+    """
+    copier = TreeCopier(symlinks, preserveOwner, preserveSelinux, threads)
+    copier.copy(src, dst, callback=callback)
 
 class LiveCDCopyBackend(backend.AnacondaBackend):
     def __init__(self, anaconda):
@@ -149,15 +626,20 @@ class LiveCDCopyBackend(backend.AnacondaBackend):
         rootDevice.setup()
         rootfd = os.open(rootDevice.path, os.O_WRONLY)
 
-        readamt = 1024 * 1024 * 8 # 8 megs at a time
         size = self.anaconda.storage.liveImage.format.currentSize * 1024 * 1024
-        copied = 0
+        def copyCB(copied):
+            progress.set_fraction(pct = copied / float(size))
+            progress.processEvents()
+
+        copier = ImageCopier(osfd, rootfd)
         done = False
         while not done:
             try:
-                buf = os.read(osfd, readamt)
-                written = os.write(rootfd, buf)
-            except (IOError, OSError):
+                copier.copy(callback=copyCB)
+                done = True
+            except (IOError, OSError) as e:
+                log.error("error copying live image at %d MB: %s"
+                          % (copier.offset / 1024 / 1024, e))
                 rc = anaconda.intf.messageWindow(_("Error"),
                         _("There was an error installing the live image to "
                           "your hard drive.  This could be due to bad media.  "
@@ -169,22 +651,6 @@ class LiveCDCopyBackend(backend.AnacondaBackend):
 
                 if rc == 0:
                     sys.exit(0)
-                else:
-                    os.lseek(osfd, 0, 0)
-                    os.lseek(rootfd, 0, 0)
-                    copied = 0
-                    continue
-
-            if (written < readamt):
-                # Either something went wrong with the write
-                if (written < len(buf)):
-                    raise RuntimeError, "error copying filesystem!"
-                else:
-                    # Or we're done
-                    done = True
-            copied += written
-            progress.set_fraction(pct = copied / float(size))
-            progress.processEvents()
 
         os.close(osfd)
         os.close(rootfd)
@@ -278,8 +744,21 @@ class LiveCDCopyBackend(backend.AnacondaBackend):
                 log.info("failed to get stat info for mountpoint %s: %s"
                             % (source, e))
 
-            log.info("Copying %s to %s" % (source, dest))
-            copytree(source, dest, True, True, flags.selinux)
+            size = max(treeSize(source), 1)
+            log.info("Copying %s (%d MB) to %s"
+                     % (source, size / 1024 / 1024, dest))
+            progress = anaconda.intf.progressWindow(_("Post-Installation"),
+                            _("Copying the content of %s to its own "
+                              "filesystem.") % (tocopy,), 1.0)
+            def copyCB(copied):
+                progress.set(min(copied / float(size), 1.0))
+                progress.refresh()
+
+            try:
+                copytree(source, dest, True, True, flags.selinux,
+                         threads=COPY_THREADS, callback=copyCB)
+            finally:
+                progress.pop()
             wait.refresh()
 
             log.info("Removing %s" % (source,))
@@ -38,6 +38,7 @@ from flags import flags
 from product import *
 from constants import *
 from upgrade import bindMountDevDirectory
+from relabel import Relabeler
 from storage.errors import *
 
 import logging
@@ -199,40 +200,24 @@ def setupTimezone(anaconda):
 # FIXME: this is a huge gross hack.  hard coded list of files
 # created by anaconda so that we can not be killed by selinux
 def setFileCons(anaconda):
-    def contextCB(arg, directory, files):
-        for file in files:
-            path = os.path.join(directory, file)
-
-            if not os.access(path, os.R_OK):
-                log.warning("%s doesn't exist" % path)
-                continue
-
-            # If the path begins with rootPath, matchPathCon will never match
-            # anything because policy doesn't contain that path.
-            if path.startswith(ROOT_PATH):
-                path = path.replace(ROOT_PATH, "")
-
-            ret = isys.resetFileContext(path, ROOT_PATH)
-
     if flags.selinux:
         log.info("setting SELinux contexts for anaconda created files")
+        relabeler = Relabeler(ROOT_PATH)
 
         # Add "/mnt/sysimage" to the front of every path so the glob works.
         # Then run glob on each element of the list and flatten it into a
-        # single list we can run contextCB across.
+        # single list we can relabel.
         files = itertools.chain(*map(lambda f: glob.glob("%s%s" % (ROOT_PATH, f)),
                                      relabelFiles))
-        contextCB(None, "", files)
+        for path in files:
+            relabeler.relabel(path)
 
         for dir in relabelDirs + ["/dev/%s" % vg.name for vg in anaconda.storage.vgs]:
             # Add "/mnt/sysimage" for similar reasons to above.
-            dir = "%s%s" % (ROOT_PATH, dir)
-
-            os.path.walk(dir, contextCB, None)
+            relabeler.relabelTree("%s%s" % (ROOT_PATH, dir))
 
-            # os.path.walk won't include the directory we start walking at,
-            # so that needs its context set separtely.
-            contextCB(None, "", [dir])
+        relabeler.close()
+        relabeler.logStats()
 
     return
 
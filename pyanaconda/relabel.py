@@ -0,0 +1,141 @@
+#
+# relabel.py: resetting SELinux file contexts of installed files
+#
+# Copyright (C) 2012  Red Hat, Inc.  All rights reserved.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import os
+import stat
+import selinux
+
+import logging
+log = logging.getLogger("anaconda")
+
+class Relabeler(object):
+    """ Reset the SELinux contexts of files under an install root to the
+        defaults from the loaded policy's file contexts.
+
+        The file contexts spec is loaded once, when the Relabeler is
+        created, rather than being consulted through matchpathcon for every
+        file.  Files that already have their default context are left alone.
+    """
+    def __init__(self, root):
+        """ Create a Relabeler instance.
+
+            Arguments:
+
+                root -- the directory the install root is mounted at
+        """
+        self.root = root.rstrip("/")
+        self.checked = 0            # files we looked up a context for
+        self.relabeled = 0          # files whose context we changed
+        self.failed = 0             # files whose context we failed to set
+
+        self._handle = None
+        try:
+            self._handle = selinux.selabel_open(selinux.SELABEL_CTX_FILE,
+                                                None, 0)
+        except OSError as e:
+            log.info("failed to load file contexts, using matchpathcon: %s"
+                     % e)
+
+    def close(self):
+        """ Release the loaded file contexts. """
+        if self._handle is not None:
+            selinux.selabel_close(self._handle)
+            self._handle = None
+
+    def defaultContext(self, path):
+        """ Return the default context for path, relative to the root. """
+        path = os.path.normpath(path)
+        try:
+            if self._handle is None:
+                return selinux.matchpathcon(path, 0)[1]
+
+            return selinux.selabel_lookup(self._handle, path, 0)[1]
+        except OSError as e:
+            log.info("failed to get default SELinux context for %s: %s"
+                     % (path, e))
+            return None
+
+    def relabel(self, path):
+        """ Reset the context of a single file.
+
+            Arguments:
+
+                path -- the full path to the file, including the root
+
+            Return True if the file's context was changed.
+        """
+        if not os.access(path, os.R_OK):
+            log.warning("%s doesn't exist" % path)
+            return False
+
+        # the policy knows nothing about paths that start with the root
+        if path.startswith(self.root + "/"):
+            con = self.defaultContext(path[len(self.root):])
+        else:
+            con = self.defaultContext(path)
+
+        self.checked += 1
+        if not con:
+            return False
+
+        try:
+            if selinux.lgetfilecon(path)[1] == con:
+                return False
+        except OSError:
+            pass
+
+        try:
+            if selinux.lsetfilecon(path, con) == 0:
+                self.relabeled += 1
+                return True
+        except OSError as e:
+            log.info("failed to set SELinux context for %s: %s" % (path, e))
+
+        self.failed += 1
+        return False
+
+    def relabelTree(self, top):
+        """ Reset the context of top and of everything below it.
+
+            Symlinks to directories are relabeled but not followed.
+        """
+        self.relabel(top)
+
+        dirs = [top]
+        while dirs:
+            directory = dirs.pop()
+            try:
+                names = os.listdir(directory)
+            except OSError:
+                continue
+
+            for name in names:
+                path = os.path.join(directory, name)
+                self.relabel(path)
+
+                try:
+                    if stat.S_ISDIR(os.lstat(path).st_mode):
+                        dirs.append(path)
+                except OSError:
+                    continue
+
+    def logStats(self):
+        """ Write the counters to the log. """
+        log.info("SELinux contexts: %d files checked, %d relabeled, "
+                 "%d failed" % (self.checked, self.relabeled, self.failed))
@@ -0,0 +1,237 @@
+#
+# repocache.py: repository metadata shared between installs
+#
+# Copyright (C) 2012  Red Hat, Inc.  All rights reserved.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+""" A cache of yum repository metadata that outlives a single install.
+
+    Installing many machines from the same tree means downloading and
+    decompressing the same primary, filelists and comps metadata over and
+    over. A RepoCache keeps a copy of everything yum left in a repo's
+    cachedir, under the checksum of the repomd.xml it came with. Once yum
+    has fetched a repo's repomd.xml, restore() copies the matching entry
+    into the repo's cachedir, where yum finds the files it would otherwise
+    download and checks them against repomd.xml as usual.
+
+    Each entry has a MANIFEST with the size and checksum of its files, so a
+    partially written or damaged entry is ignored rather than restored.
+    Entries are written under a temporary name and renamed into place, so
+    several machines can share a cache directory, eg. over NFS. Metadata
+    yum only fetches later on, like the filelists depsolving needs, is
+    added to an existing entry the same way, file by file, before the new
+    MANIFEST that lists it replaces the old one.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import socket
+
+import logging
+log = logging.getLogger("anaconda")
+
+MANIFEST = "MANIFEST"
+
+# files in a repo's cachedir that have nothing to do with its metadata
+_skipped = ("cachecookie", "packages", "headers")
+
+def _checksum(path):
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), ""):
+            sha.update(block)
+
+    return sha.hexdigest()
+
+def _metadataFiles(cachedir):
+    """ Return the paths of the metadata files in cachedir, relative to it. """
+    files = []
+    for (dirpath, dirnames, filenames) in os.walk(cachedir):
+        relative = os.path.relpath(dirpath, cachedir)
+        if relative == ".":
+            dirnames[:] = [d for d in dirnames if d not in _skipped]
+            filenames = [f for f in filenames if f not in _skipped]
+
+        for filename in filenames:
+            path = os.path.normpath(os.path.join(relative, filename))
+            if not os.path.islink(os.path.join(cachedir, path)):
+                files.append(path)
+
+    return sorted(files)
+
+class RepoCache(object):
+    """ A directory of repository metadata keyed by repomd.xml checksum. """
+    def __init__(self, path):
+        self.path = path
+
+    def key(self, cachedir):
+        """ Return the key of the metadata in cachedir, or None. """
+        repomd = os.path.join(cachedir, "repomd.xml")
+        if not os.path.exists(repomd):
+            return None
+
+        return _checksum(repomd)
+
+    def _entry(self, key):
+        return os.path.join(self.path, key)
+
+    def _readManifest(self, entry):
+        try:
+            with open(os.path.join(entry, MANIFEST)) as f:
+                return json.load(f)
+        except (IOError, ValueError):
+            return None
+
+    def restore(self, repoid, cachedir):
+        """ Copy the cached metadata for the repomd.xml in cachedir into it.
+
+            Files that are already in cachedir are left alone. Return True
+            if there was a valid entry for the repo.
+        """
+        key = self.key(cachedir)
+        entry = self._entry(key) if key else None
+        if not entry or not os.path.isdir(entry):
+            log.info("no cached metadata for repo %s" % repoid)
+            return False
+
+        manifest = self._readManifest(entry)
+        if manifest is None:
+            log.warning("ignoring cached metadata for repo %s without a "
+                        "manifest" % repoid)
+            return False
+
+        # check the whole entry before copying anything out of it
+        for (name, (size, checksum)) in manifest.items():
+            path = os.path.join(entry, name)
+            try:
+                valid = not os.path.normpath(name).startswith((os.sep, "..")) \
+                        and os.path.getsize(path) == size \
+                        and _checksum(path) == checksum
+            except (IOError, OSError):
+                valid = False
+
+            if not valid:
+                log.warning("ignoring cached metadata for repo %s, %s is "
+                            "damaged" % (repoid, name))
+                return False
+
+        try:
+            for name in sorted(manifest):
+                dest = os.path.join(cachedir, name)
+                if os.path.exists(dest):
+                    continue
+
+                if not os.path.isdir(os.path.dirname(dest)):
+                    os.makedirs(os.path.dirname(dest))
+                shutil.copy2(os.path.join(entry, name), dest)
+        except (IOError, OSError) as e:
+            # whatever didn't make it will simply get downloaded
+            log.warning("failed to restore cached metadata for repo %s: %s"
+                        % (repoid, e))
+            return False
+
+        log.info("restored cached metadata for repo %s from %s"
+                 % (repoid, entry))
+        return True
+
+    def _tmpName(self, path):
+        return "%s.%s.%d.tmp" % (path, socket.gethostname(), os.getpid())
+
+    def _writeManifest(self, directory, manifest):
+        tmp = self._tmpName(os.path.join(directory, MANIFEST))
+        with open(tmp, "w") as f:
+            json.dump(manifest, f, sort_keys=True, indent=1)
+        os.rename(tmp, os.path.join(directory, MANIFEST))
+
+    def _add(self, manifest, cachedir, directory, name):
+        """ Copy cachedir's file name into directory and into manifest. """
+        dest = os.path.join(directory, name)
+        if not os.path.isdir(os.path.dirname(dest)):
+            os.makedirs(os.path.dirname(dest))
+
+        tmp = self._tmpName(dest)
+        try:
+            shutil.copy2(os.path.join(cachedir, name), tmp)
+            os.rename(tmp, dest)
+        except (IOError, OSError):
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+
+        manifest[name] = (os.path.getsize(dest), _checksum(dest))
+
+    def _merge(self, repoid, cachedir, entry):
+        """ Add the files in cachedir that entry lacks to it. """
+        manifest = self._readManifest(entry)
+        if manifest is None:
+            return True
+
+        missing = [n for n in _metadataFiles(cachedir) if n not in manifest]
+        if not missing:
+            return True
+
+        try:
+            for name in missing:
+                self._add(manifest, cachedir, entry, name)
+
+            self._writeManifest(entry, manifest)
+        except (IOError, OSError) as e:
+            # the entry is still as good as it was
+            log.warning("failed to add %s to cached metadata for repo %s: %s"
+                        % (missing, repoid, e))
+            return True
+
+        log.info("added %s to cached metadata for repo %s in %s"
+                 % (missing, repoid, entry))
+        return True
+
+    def store(self, repoid, cachedir):
+        """ Add the metadata in cachedir to the cache.
+
+            If the cache already has an entry for the repo's repomd.xml,
+            only the files it does not have yet are added to it. Return
+            True if the cache has an entry afterwards.
+        """
+        key = self.key(cachedir)
+        if not key:
+            return False
+
+        entry = self._entry(key)
+        if os.path.isdir(entry):
+            return self._merge(repoid, cachedir, entry)
+
+        tmp = self._tmpName(entry)
+        try:
+            manifest = {}
+            for name in _metadataFiles(cachedir):
+                self._add(manifest, cachedir, tmp, name)
+
+            self._writeManifest(tmp, manifest)
+            os.rename(tmp, entry)
+        except (IOError, OSError) as e:
+            # somebody else got there first, or we can't write to the cache
+            shutil.rmtree(tmp, ignore_errors=True)
+            if os.path.isdir(entry):
+                return self._merge(repoid, cachedir, entry)
+
+            log.warning("failed to cache metadata for repo %s: %s"
+                        % (repoid, e))
+            return False
+
+        log.info("cached metadata for repo %s in %s" % (repoid, entry))
+        return True
@@ -49,13 +49,16 @@ from devicelibs.crypto import generateBackupPassphrase
 from devicelibs.mpath import MultipathConfigWriter
 from devicelibs.edd import get_edd_dict
 from udev import *
+from snapshot import StateLog
+import changes
 import iscsi
 import fcoe
 import zfcp
 import dasd
 
-import shelve
-import contextlib
+import tempfile
+import threading
+import Queue
 
 import gettext
 _ = lambda x: gettext.ldgettext("anaconda", x)
@@ -83,10 +86,16 @@ def storageInitialize(anaconda):
     anaconda.intf.resetReinitInconsistentLVMQuestion()
     lvm.lvm_vg_blacklist = []
 
+    # Only rescan what changed since the last pass, eg. targets added in the
+    # filter UI, unless there are user changes that have to be thrown away.
+    incremental = not storage.devicetree.findActions()
+
     # Set up the protected partitions list now.
     if anaconda.protected:
-        storage.config.protectedDevSpecs.extend(anaconda.protected)
-        storage.reset()
+        storage.config.protectedDevSpecs.extend(
+            [spec for spec in anaconda.protected
+             if spec not in storage.config.protectedDevSpecs])
+        storage.reset(incremental=incremental)
 
         if not flags.livecdInstall and not storage.protectedDevices:
             if anaconda.upgrade:
@@ -99,7 +108,7 @@ def storageInitialize(anaconda):
                     type="custom", custom_buttons = [_("_Exit installer")])
                 sys.exit(1)
     else:
-        storage.reset()
+        storage.reset(incremental=incremental)
 
     if not storage.disks:
         custom_buttons=[_("_Try again"), _("_Exit installer")]
@@ -287,6 +296,7 @@ class StorageDiscoveryConfig(object):
         self.protectedDevSpecs = []
         self.diskImages = {}
         self.mpathFriendlyNames = True
+        self.probeThreads = flags.probeThreads
 
     def writeKS(self, f):
         # clearpart
@@ -360,6 +370,8 @@ class Storage(object):
         self._nextID = 0
         self.defaultFSType = get_default_filesystem_type()
         self._dumpFile = "/tmp/storage.state"
+        self._stateLog = StateLog(self._dumpFile)
+        self._stateSerial = changes.currentSerial()
 
         # these will both be empty until our reset method gets called
         self.devicetree = DeviceTree(intf=self.intf,
@@ -372,7 +384,11 @@ class Storage(object):
         self.services = set()
 
     def doIt(self):
-        self.devicetree.processActions()
+        def actionDone(action):
+            self.dumpState("action.%d" % action.id, action=action)
+
+        self.devicetree.processActions(callback=actionDone,
+                                       workers=flags.actionWorkers)
         self.doEncryptionPassphraseRetrofits()
 
         # now set the boot partition's flag.
@@ -441,12 +457,17 @@ class Storage(object):
         except Exception as e:
             log.error("failure tearing down device tree: %s" % e)
 
-    def reset(self, cleanupOnly=False):
+    def reset(self, cleanupOnly=False, incremental=False):
         """ Reset storage configuration to reflect actual system state.
 
             This should rescan from scratch but not clobber user-obtained
             information like passphrases, iscsi config, &c
 
+            If incremental is True, only the devices that have been added,
+            removed or changed since the device tree was populated are
+            rescanned and scheduled actions are kept. We fall back to a
+            full rescan whenever that is not possible.
+
         """
         # save passphrases for luks devices so we don't have to reprompt
         self.encryptionPassphrase = None
@@ -470,14 +491,23 @@ class Storage(object):
         if getattr(self.anaconda, "upgrade", False):
             self.config.clearPartType = CLEARPART_TYPE_NONE
 
-        self.devicetree = DeviceTree(intf=self.intf,
-                                     conf=self.config,
-                                     passphrase=self.encryptionPassphrase,
-                                     luksDict=self.__luksDevs,
-                                     iscsi=self.iscsi,
-                                     dasd=self.dasd)
-        self.devicetree.populate(progressWindow=prog,
-                                 cleanupOnly=cleanupOnly)
+        rescanned = False
+        if incremental and not cleanupOnly:
+            try:
+                rescanned = self.devicetree.rescan(conf=self.config,
+                                                   progressWindow=prog)
+            except Exception as e:
+                log.error("incremental rescan failed: %s" % e)
+
+        if not rescanned:
+            self.devicetree = DeviceTree(intf=self.intf,
+                                         conf=self.config,
+                                         passphrase=self.encryptionPassphrase,
+                                         luksDict=self.__luksDevs,
+                                         iscsi=self.iscsi,
+                                         dasd=self.dasd)
+            self.devicetree.populate(progressWindow=prog,
+                                     cleanupOnly=cleanupOnly)
         self.config.clearPartType = clearPartType # set it back
         self.fsset = FSSet(self.devicetree)
         self.eddDict = get_edd_dict(self.partitioned)
@@ -737,7 +767,7 @@ class Storage(object):
         # When a usb is connected from before the start of the installation,
         # it is not correctly detected.
         udev_trigger(subsystem="block", action="change")
-        self.reset()
+        self.reset(incremental=True)
 
         dests = []
 
@@ -1328,11 +1358,30 @@ class Storage(object):
             return True
         return False
 
-    def dumpState(self, suffix):
-        """ Dump the current device list to the storage shelf. """
-        key = "devices.%d.%s" % (time.time(), suffix)
-        with contextlib.closing(shelve.open(self._dumpFile)) as shelf:
-            shelf[key] = [d.dict for d in self.devices]
+    def dumpState(self, suffix, action=None):
+        """ Append a snapshot of the devices and actions to the state log.
+
+            After an action, only the devices the change log (see changes.py)
+            has seen change since the last snapshot, and the devices around
+            the action's device, are serialized again.
+        """
+        (serial, changed) = changes.changesSince(self._stateSerial)
+        self._stateSerial = serial
+
+        stale = None
+        if action is not None and changed is not None:
+            changed = set(changed)
+            near = [action.device] + action.device.parents
+            for device in near[:]:
+                near.extend(self.devicetree.getChildren(device))
+
+            stale = set(d.id for d in near)
+            stale.update(d.id for d in self.devicetree.devices
+                         if id(d) in changed or id(d.format) in changed)
+
+        self._stateLog.write(suffix, self.devices,
+                             actions=self.devicetree.findActions(),
+                             changed=stale)
 
     def write(self):
         self.fsset.write()
@@ -1540,16 +1589,16 @@ class Storage(object):
 
         return 0
 
-def getReleaseString():
+def getReleaseString(root=ROOT_PATH):
     relName = None
     relVer = None
 
     try:
-        relArch = iutil.execWithCapture("arch", [], root=ROOT_PATH).strip()
+        relArch = iutil.execWithCapture("arch", [], root=root).strip()
     except:
         relArch = None
 
-    filename = "%s/etc/redhat-release" % ROOT_PATH
+    filename = "%s/etc/redhat-release" % root
     if os.access(filename, os.R_OK):
         with open(filename) as f:
             try:
@@ -1567,6 +1616,81 @@ def getReleaseString():
 
     return (relArch, relName, relVer)
 
+# what findExistingRootDevices found on each filesystem it examined, by
+# filesystem uuid, so that it does not have to look again after a reset
+_releaseCache = {}
+
+# how many filesystems findExistingRootDevices examines at once
+ROOT_SEARCH_THREADS = 4
+
+def examineRootDevice(device):
+    """ Mount device's filesystem read-only and look for an installation.
+
+        The device has to be set up already. The filesystem is mounted on
+        a private temporary mountpoint, so many devices can be examined at
+        the same time.
+
+        Return the (arch, product, version) tuple from getReleaseString,
+        None if there is no installation on the filesystem, or False if
+        the filesystem could not be mounted.
+    """
+    mountpoint = tempfile.mkdtemp(prefix="root-", dir="/tmp")
+    try:
+        try:
+            device.format.mount(options="ro", mountpoint=mountpoint)
+        except Exception as e:
+            log.warning("mount of %s as %s failed: %s" % (device.name,
+                                                          device.format.type,
+                                                          e))
+            return False
+
+        try:
+            if not os.access(mountpoint + "/etc/fstab", os.R_OK):
+                return None
+
+            try:
+                return getReleaseString(root=mountpoint)
+            except ValueError:
+                # This likely isn't our product, so don't even count it as
+                # notUpgradable.
+                log.info("findExistingRootDevices: no release string.")
+                return None
+        finally:
+            device.format.unmount()
+    finally:
+        os.rmdir(mountpoint)
+
+def examineRootDevices(devices, threads=ROOT_SEARCH_THREADS):
+    """ Run examineRootDevice for a list of devices on a pool of threads.
+
+        Return a list of the results, in the order of the devices.
+    """
+    work = Queue.Queue()
+    for (i, device) in enumerate(devices):
+        work.put((i, device))
+
+    results = [False] * len(devices)
+    def worker():
+        while True:
+            try:
+                (i, device) = work.get_nowait()
+            except Queue.Empty:
+                return
+
+            try:
+                results[i] = examineRootDevice(device)
+            except Exception as e:
+                log.error("examining %s failed: %s" % (device.name, e))
+
+    pool = [threading.Thread(target=worker, name="findroot-%d" % i)
+                for i in range(min(threads, len(devices)))]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+
+    return results
+
 def findExistingRootDevices(anaconda, upgradeany=False):
     """ upgradeany will cause it to ignore version, product and
     arch mismatches. Use with caution.
@@ -1589,7 +1713,7 @@ def findExistingRootDevices(anaconda, upgradeany=False):
     if not os.path.exists(ROOT_PATH):
         iutil.mkdirChain(ROOT_PATH)
 
-    roots = []
+    candidates = []
     for device in anaconda.storage.devicetree.leaves:
         if not device.format.linuxNative or not device.format.mountable:
             continue
@@ -1598,49 +1722,56 @@ def findExistingRootDevices(anaconda, upgradeany=False):
             # can't upgrade the part holding hd: media so why look at it?
             continue
 
+        candidates.append(device)
+
+    # setting devices up is left to this thread, only the mounting and
+    # looking around happens in parallel
+    releases = {}
+    examine = []
+    for device in candidates:
+        uuid = device.format.uuid
+        if uuid and uuid in _releaseCache:
+            releases[id(device)] = _releaseCache[uuid]
+            continue
+
         try:
             device.setup()
         except Exception as e:
             log.warning("setup of %s failed: %s" % (device.name, e))
             continue
 
-        try:
-            device.format.mount(options="ro", mountpoint=ROOT_PATH)
-        except Exception as e:
-            log.warning("mount of %s as %s failed: %s" % (device.name,
-                                                          device.format.type,
-                                                          e))
-            device.teardown()
+        examine.append(device)
+
+    for (device, release) in zip(examine, examineRootDevices(examine)):
+        device.teardown(recursive=True)
+        if release is False:
+            # maybe it will mount next time
             continue
 
-        if os.access(ROOT_PATH + "/etc/fstab", os.R_OK):
-            try:
-                (arch, product, version) = getReleaseString()
-            except ValueError:
-                # This likely isn't our product, so don't even count it as
-                # notUpgradable.
-                log.info("findExistingRootDevices: no release string.")
-                continue
-            finally:
-                device.teardown(recursive=True)
+        releases[id(device)] = release
+        if device.format.uuid:
+            _releaseCache[device.format.uuid] = release
 
-            if arch is None:
-                # we failed to determine the arch (for instance when we can't
-                # run a binary on the target system)
-                log.info("findExistingRootDevices: no arch.")
-                continue
+    for device in candidates:
+        release = releases.get(id(device))
+        if not release:
+            continue
 
-            (upgradable, tests) = anaconda.instClass.productUpgradable(arch, product, version)
-            if upgradeany or upgradable:
-                rootDevs.append((device, "%s %s" % (product, version)))
-            else:
-                notUpgradable.append((product, version, arch, device.name, tests))
-                log.info("product %s, version %s, arch %s found on %s is not upgradable"
-                         % (product, version, arch, device.name))
-                log.debug("test results: %s" % (tests,))
+        (arch, product, version) = release
+        if arch is None:
+            # we failed to determine the arch (for instance when we can't
+            # run a binary on the target system)
+            log.info("findExistingRootDevices: no arch.")
+            continue
+
+        (upgradable, tests) = anaconda.instClass.productUpgradable(arch, product, version)
+        if upgradeany or upgradable:
+            rootDevs.append((device, "%s %s" % (product, version)))
         else:
-            # this handles unmounting the filesystem
-            device.teardown(recursive=True)
+            notUpgradable.append((product, version, arch, device.name, tests))
+            log.info("product %s, version %s, arch %s found on %s is not upgradable"
+                     % (product, version, arch, device.name))
+            log.debug("test results: %s" % (tests,))
 
     return (rootDevs, notUpgradable)
 
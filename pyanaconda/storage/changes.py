@@ -0,0 +1,101 @@
+# changes.py
+# Tracking of changes to device and format attributes.
+#
+# Copyright (C) 2012  Red Hat, Inc.
+#
+# This copyrighted material is made available to anyone wishing to use,
+# modify, copy, or redistribute it subject to the terms and conditions of
+# the GNU General Public License v.2, or (at your option) any later version.
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY expressed or implied, including the implied warranties of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General
+# Public License for more details.  You should have received a copy of the
+# GNU General Public License along with this program; if not, write to the
+# Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.  Any Red Hat trademarks that are incorporated in the
+# source code or documentation are not subject to the GNU General Public
+# License and may only be used or replicated with the express permission of
+# Red Hat, Inc.
+#
+
+""" A bounded log of changes to the attributes DeviceTree indexes on.
+
+    Devices and formats call noteChange whenever one of the attributes the
+    DeviceTree uses to look them up (name, sysfs path, uuid, label, &c)
+    or to derive its lists of leaves and filesystems (number of children,
+    mountpoint) is assigned. Lists of parents are TrackedLists, so changing
+    one in place counts as a change to the device it belongs to. A consumer
+    remembers the serial number it has seen and later asks for the ids of
+    the objects that changed since then. If the
+    consumer has fallen so far behind that the log no longer covers the
+    interval, changesSince returns None for the ids and the consumer has
+    to rebuild its state from scratch.
+"""
+
+import threading
+from collections import deque
+from itertools import islice
+
+# how many changes we remember before consumers have to start over
+MAX_CHANGES = 4096
+
+_changes = deque(maxlen=MAX_CHANGES)
+_serial = 0
+# devices are changed from probe, root search and action worker threads
+_lock = threading.Lock()
+
+def noteChange(obj):
+    """ Record that one of obj's tracked attributes has been assigned. """
+    global _serial
+    with _lock:
+        _serial += 1
+        _changes.append(id(obj))
+
+def currentSerial():
+    """ Return the serial number of the most recent change. """
+    return _serial
+
+def changesSince(serial):
+    """ Return the changes recorded after serial.
+
+        Return value is a (serial, ids) tuple, where serial is the current
+        serial number and ids is a list of the id() of each changed object,
+        oldest first, or None if the log no longer reaches back to serial.
+    """
+    with _lock:
+        current = _serial
+        count = current - serial
+        if count <= 0:
+            return (current, [])
+
+        if count > len(_changes):
+            return (current, None)
+
+        ids = list(islice(reversed(_changes), count))
+
+    ids.reverse()
+    return (current, ids)
+
+class TrackedList(list):
+    """ A list attribute whose in-place changes are noted as changes to its
+        owner, just like assigning a new list to the attribute would be.
+    """
+    def __init__(self, owner, items=()):
+        list.__init__(self, items)
+        self.owner = owner
+
+def _noting(name):
+    method = getattr(list, name)
+    def noting(self, *args, **kwargs):
+        ret = method(self, *args, **kwargs)
+        # copy and pickle fill in the items before they set the owner
+        noteChange(getattr(self, "owner", self))
+        return ret
+
+    noting.__name__ = name
+    return noting
+
+for _name in ("append", "extend", "insert", "remove", "pop", "sort",
+              "reverse", "__setitem__", "__delitem__", "__setslice__",
+              "__delslice__", "__iadd__", "__imul__"):
+    setattr(TrackedList, _name, _noting(_name))
@@ -155,6 +155,19 @@ class DeviceAction(object):
         """ perform the action """
         pass
 
+    def prepare(self, intf=None):
+        """ Set up what a format action needs before executeFormat.
+
+            This is the part of the action that changes state other
+            devices share, like partition tables, lvm and md. It has to run
+            on its own, while executeFormat may run alongside other actions.
+        """
+        pass
+
+    def executeFormat(self, intf=None):
+        """ perform a format action once prepare has run """
+        pass
+
     def cancel(self):
         """ cancel the action """
         pass
@@ -411,6 +424,10 @@ class ActionCreateFormat(DeviceAction):
             self.origFormat = getFormat(None)
 
     def execute(self, intf=None):
+        self.prepare(intf=intf)
+        self.executeFormat(intf=intf)
+
+    def prepare(self, intf=None):
         self.device.setup()
 
         if isinstance(self.device, PartitionDevice):
@@ -428,6 +445,7 @@ class ActionCreateFormat(DeviceAction):
 
             self.device.disk.format.commitToDisk()
 
+    def executeFormat(self, intf=None):
         self.device.format.create(intf=intf,
                                   device=self.device.path,
                                   options=self.device.formatArgs)
@@ -548,7 +566,13 @@ class ActionResizeFormat(DeviceAction):
         self.device.format.targetSize = newsize
 
     def execute(self, intf=None):
+        self.prepare(intf=intf)
+        self.executeFormat(intf=intf)
+
+    def prepare(self, intf=None):
         self.device.setup(orig=True)
+
+    def executeFormat(self, intf=None):
         self.device.format.doResize(intf=intf)
 
     def cancel(self):
@@ -593,7 +617,13 @@ class ActionMigrateFormat(DeviceAction):
         self.device.format.migrate = True
 
     def execute(self, intf=None):
+        self.prepare(intf=intf)
+        self.executeFormat(intf=intf)
+
+    def prepare(self, intf=None):
         self.device.setup(orig=True)
+
+    def executeFormat(self, intf=None):
         self.device.format.doMigrate(intf=intf)
 
     def cancel(self):
@@ -82,17 +82,74 @@ def lvm_cc_addFilterRejectRegexp(regexp):
     global config_args_data
     log.debug("lvm filter: adding %s to the reject list" % regexp)
     config_args_data["filterRejects"].append(regexp)
+    # the filter determines what lvm reports, so start over
+    invalidateSnapshot()
 
     # compoes config once more.
     _composeConfig()
 
+def lvm_cc_removeFilterRejectRegexp(regexp):
+    """ Remove a regular expression from the --config string."""
+    global config_args_data
+    if regexp not in config_args_data["filterRejects"]:
+        return
+
+    log.debug("lvm filter: removing %s from the reject list" % regexp)
+    config_args_data["filterRejects"].remove(regexp)
+    invalidateSnapshot()
+
+    _composeConfig()
+
 def lvm_cc_resetFilter():
     global config_args, config_args_data
     config_args_data["filterRejects"] = []
     config_args_data["filterAccepts"] = []
     config_args = []
+    invalidateSnapshot()
 # End config_args handling code.
 
+# Start snapshot handling code
+#
+# Instead of running lvs once for every snapshot lv to find its origin, each
+# run of which makes lvm scan all the devices, we run it once for all lvs
+# and answer lvorigin from that report. The report is dropped whenever the
+# filter changes or lvm modifies anything, and gets taken again by the next
+# query. Activating and deactivating vgs and lvs doesn't change any origins,
+# so it leaves the report alone. Lvs that are not in the report are passed
+# on to lvm, so that they are looked up the same way they always have been.
+_snapshot = None
+
+def invalidateSnapshot():
+    global _snapshot
+    _snapshot = None
+
+def _getSnapshot():
+    """ Return a dict of the lvs' origins, keyed by (vg name, lv name). """
+    global _snapshot
+    if _snapshot is not None:
+        return _snapshot
+
+    args = ["lvs", "--noheadings"] + \
+            ["--separator", "|"] + \
+            ["-o", "vg_name,lv_name,origin"] + \
+            config_args
+
+    buf = iutil.execWithCapture("lvm", args,
+                                stderr = "/dev/tty5")
+    snapshot = {}
+    for line in buf.splitlines():
+        values = [v.strip() for v in line.split("|")]
+        if len(values) != 3:
+            # blank lines, warnings and such
+            continue
+
+        snapshot[(values[0], values[1])] = values[2]
+
+    log.debug("lvm snapshot: %d lvs" % len(snapshot))
+    _snapshot = snapshot
+    return _snapshot
+# End snapshot handling code.
+
 # Names that should not be used int the creation of VGs
 lvm_vg_blacklist = []
 def blacklistVG(name):
@@ -130,7 +187,10 @@ def clampSize(size, pesize, roundup=None):
 
     return long(round(float(size)/float(pesize)) * pesize)
 
-def lvm(args, progress=None):
+def lvm(args, progress=None, invalidate=True):
+    if invalidate:
+        invalidateSnapshot()
+
     ret = iutil.execWithPulseProgress("lvm", args,
                                      stdout = "/dev/tty5",
                                      stderr = "/dev/tty5",
@@ -236,7 +296,7 @@ def vgactivate(vg_name):
             [vg_name]
 
     try:
-        lvm(args)
+        lvm(args, invalidate=False)
     except LVMError as msg:
         raise LVMError("vgactivate failed for %s: %s" % (vg_name, msg))
 
@@ -246,7 +306,7 @@ def vgdeactivate(vg_name):
             [vg_name]
 
     try:
-        lvm(args)
+        lvm(args, invalidate=False)
     except LVMError as msg:
         raise LVMError("vgdeactivate failed for %s: %s" % (vg_name, msg))
 
@@ -315,6 +375,10 @@ def lvs(vg_name):
     return lvs
 
 def lvorigin(vg_name, lv_name):
+    origin = _getSnapshot().get((vg_name, lv_name))
+    if origin is not None:
+        return origin
+
     args = ["lvs", "--noheadings", "-o", "origin"] + \
             config_args + \
             ["%s/%s" % (vg_name, lv_name)]
@@ -370,7 +434,7 @@ def lvactivate(vg_name, lv_name):
             ["%s/%s" % (vg_name, lv_name)]
 
     try:
-        lvm(args)
+        lvm(args, invalidate=False)
     except LVMError as msg:
         raise LVMError("lvactivate failed for %s: %s" % (lv_name, msg))
 
@@ -380,7 +444,7 @@ def lvdeactivate(vg_name, lv_name):
             ["%s/%s" % (vg_name, lv_name)]
 
     try:
-        lvm(args)
+        lvm(args, invalidate=False)
     except LVMError as msg:
         raise LVMError("lvdeactivate failed for %s: %s" % (lv_name, msg))
 
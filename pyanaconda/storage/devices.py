@@ -115,6 +115,7 @@ from pyanaconda.flags import flags
 from pyanaconda.anaconda_log import log_method_call
 from udev import *
 from formats import get_device_format_class, getFormat, DeviceFormat
+from changes import noteChange, TrackedList
 
 import gettext
 _ = lambda x: gettext.ldgettext("anaconda", x)
@@ -155,10 +156,9 @@ def deviceNameToDiskByPath(deviceName=None):
         return ""
 
     ret = None
-    for dev in udev_get_block_devices():
-        if udev_device_get_name(dev) == deviceName:
-            ret = udev_device_get_by_path(dev)
-            break
+    dev = udev_get_block_device_snapshot().names.get(deviceName)
+    if dev:
+        ret = udev_device_get_by_path(dev)
 
     if ret:
         return ret
@@ -205,6 +205,10 @@ class Device(object):
     _packages = []
     _services = []
 
+    # attributes DeviceTree looks devices up by or derives its lists from
+    _trackedAttrs = frozenset(["_name", "parents", "sysfsPath", "uuid",
+                               "_format", "_serial", "kids"])
+
     def __init__(self, name, parents=None):
         """ Create a Device instance.
 
@@ -232,6 +236,15 @@ class Device(object):
         for parent in self.parents:
             parent.addChild()
 
+    def __setattr__(self, attr, value):
+        if attr == "parents":
+            # so changes made to the list in place get noted, too
+            value = TrackedList(self, value)
+
+        object.__setattr__(self, attr, value)
+        if attr in self._trackedAttrs:
+            noteChange(self)
+
     def __deepcopy__(self, memo):
         """ Create a deep copy of a Device instance.
 
@@ -21,7 +21,11 @@
 #
 
 import os
+import sys
 import stat
+import threading
+import Queue
+from collections import deque
 import block
 import re
 import shutil
@@ -39,9 +43,12 @@ import devicelibs.lvm
 import devicelibs.mpath
 import devicelibs.loop
 from udev import *
+import changes
+import probe
 from pyanaconda import iutil
 from pyanaconda import platform
 from pyanaconda import tsort
+from pyanaconda import timing
 from pyanaconda.anaconda_log import log_method_call, log_method_return
 import parted
 import _ped
@@ -52,6 +59,14 @@ _ = lambda x: gettext.ldgettext("anaconda", x)
 import logging
 log = logging.getLogger("storage")
 
+# where processActions writes how long each action took
+ACTION_TIMING_REPORT = "/tmp/storage-actions.tsv"
+ACTION_TIMING_TRACE = "/tmp/storage-actions.trace.json"
+
+# how many actions processActions runs at once, unless told otherwise; the
+# actionworkers boot option asks for more
+ACTION_WORKERS = 1
+
 def getLUKSPassphrase(intf, device, passphrases):
     """ Obtain a passphrase for a LUKS encrypted block device.
 
@@ -132,6 +147,18 @@ def getLUKSPassphrase(intf, device, passphrases):
     return passphrase
 
 
+def _isConcurrentAction(action):
+    """ Return True if action can run alongside other actions.
+
+        Creating, resizing or migrating a filesystem, swap, pv or other
+        format only involves the action's own device once the action's
+        prepare step has set up the device and its partition's flags.
+        Disklabels are the exception.
+    """
+    return (action.isFormat and
+            (action.isCreate or action.isResize or action.isMigrate) and
+            action.format.type != "disklabel")
+
 class DeviceTree(object):
     """ A quasi-tree that represents the devices in the system.
 
@@ -158,6 +185,21 @@ class DeviceTree(object):
         self._devices = []
         self._actions = []
 
+        # indexes used by the getDeviceBy* methods, see _indexDevice
+        self._index = dict((kind, {}) for kind in self._indexKinds)
+        self._indexKeys = {}        # id(device) -> {kind: [key, ...]}
+        self._indexFormats = {}     # id(device) -> id(device.format)
+        self._indexOwners = {}      # id(device or format) -> device
+        self._indexOrder = {}       # id(device) -> insertion sequence
+        self._indexParents = {}     # id(device) -> [parent, ...]
+        self._children = {}         # id(parent) -> [device, ...]
+        self._indexSeq = 0
+        self._indexSerial = changes.currentSerial()
+
+        # values derived from the device list, see _cached
+        self._generation = 0
+        self._cache = {}
+
         # a list of all device names we encounter
         self.names = []
 
@@ -174,6 +216,11 @@ class DeviceTree(object):
         self.dasd = dasd
         self.mpathFriendlyNames = getattr(conf, "mpathFriendlyNames", True)
 
+        # number of threads used to probe devices before adding them to the
+        # tree, see probe.py; 0 disables the probe stage
+        self.probeThreads = getattr(conf, "probeThreads", 0)
+        self._probed = {}
+
         self.platform = platform.getPlatform(None)
 
         self.diskImages = {}
@@ -210,6 +257,154 @@ class DeviceTree(object):
 
         self._cleanup = False
 
+        # what udev told us about each device we have scanned, see rescan
+        self._udevSeen = {}     # sysfs path -> fingerprint
+        self._conf = self._confKey(conf)
+
+    # the lookup indexes we maintain
+    _indexKinds = ("name", "path", "sysfsPath", "uuid", "label", "serial")
+
+    # devices whose path depends on more than their own attributes, eg: a
+    # FileDevice's path depends on whether its parent's format is mounted
+    _unindexedPathTypes = (FileDevice, BTRFSDevice)
+
+    def _deviceIndexKeys(self, device):
+        """ Return a dict of the keys device should be indexed under. """
+        keys = {"name": [device.name],
+                "sysfsPath": [device.sysfsPath],
+                "uuid": [u for u in (device.uuid, device.format.uuid) if u],
+                "label": [],
+                "serial": [],
+                "path": []}
+
+        label = getattr(device.format, "label", None)
+        if label:
+            keys["label"].append(label)
+
+        if hasattr(device, "serial"):
+            keys["serial"].append(device.serial)
+
+        if isinstance(device, self._unindexedPathTypes):
+            # getDeviceByPath checks these devices' paths as it goes
+            keys["path"].append(None)
+        else:
+            keys["path"].append(device.path)
+
+        return keys
+
+    def _indexDevice(self, device):
+        """ Add device to the lookup indexes under its current keys. """
+        keys = self._deviceIndexKeys(device)
+        for (kind, values) in keys.items():
+            index = self._index[kind]
+            for value in values:
+                index.setdefault(value, []).append(device)
+
+        self._indexKeys[id(device)] = keys
+        self._indexFormats[id(device)] = id(device.format)
+        self._indexOwners[id(device)] = device
+        self._indexOwners[id(device.format)] = device
+
+        parents = list(device.parents)
+        self._indexParents[id(device)] = parents
+        for parent in parents:
+            self._children.setdefault(id(parent), []).append(device)
+
+    def _unindexDevice(self, device):
+        """ Remove device from the lookup indexes. """
+        keys = self._indexKeys.pop(id(device), {})
+        for (kind, values) in keys.items():
+            index = self._index[kind]
+            for value in values:
+                devices = index.get(value, [])
+                if device in devices:
+                    devices.remove(device)
+                if not devices:
+                    index.pop(value, None)
+
+        self._indexOwners.pop(id(device), None)
+        format_id = self._indexFormats.pop(id(device), None)
+        if self._indexOwners.get(format_id) is device:
+            del self._indexOwners[format_id]
+
+        for parent in self._indexParents.pop(id(device), []):
+            children = self._children.get(id(parent), [])
+            if device in children:
+                children.remove(device)
+            if not children:
+                self._children.pop(id(parent), None)
+
+    def _reindexDevice(self, device):
+        """ Update the lookup indexes after a change to device. """
+        old_names = self._indexKeys.get(id(device), {}).get("name")
+        self._unindexDevice(device)
+        self._indexDevice(device)
+
+        if old_names != self._indexKeys[id(device)]["name"]:
+            # lvs' names and paths are derived from their vg's name
+            for child in self._childrenOf(device):
+                self._unindexDevice(child)
+                self._indexDevice(child)
+
+    def _rebuildIndex(self):
+        """ Rebuild the lookup indexes from scratch. """
+        for kind in self._indexKinds:
+            self._index[kind] = {}
+        self._indexKeys = {}
+        self._indexFormats = {}
+        self._indexOwners = {}
+        self._indexParents = {}
+        self._children = {}
+        for device in self._devices:
+            self._indexDevice(device)
+
+    def _syncIndex(self):
+        """ Apply changes to devices and formats made since our last sync. """
+        (serial, changed) = changes.changesSince(self._indexSerial)
+        self._indexSerial = serial
+        if changed is None:
+            log.debug("device index out of date; rebuilding it")
+            self._rebuildIndex()
+            return
+
+        seen = set()
+        for obj_id in changed:
+            device = self._indexOwners.get(obj_id)
+            if device is None or id(device) in seen:
+                continue
+
+            seen.add(id(device))
+            self._reindexDevice(device)
+
+    def _cached(self, key, compute):
+        """ Return compute(), reusing the last result if nothing changed.
+
+            The result is reused for as long as no device is added to or
+            removed from the tree and no tracked device or format attribute
+            (see changes.py) is assigned.
+        """
+        state = (self._generation, changes.currentSerial())
+        cached = self._cache.get(key)
+        if cached is None or cached[0] != state:
+            cached = (state, compute())
+            self._cache[key] = cached
+
+        return cached[1]
+
+    def _childrenOf(self, device):
+        """ Return device's children, in device list order. """
+        # a removed device's id may have been reused by the time we get here
+        children = [c for c in self._children.get(id(device), [])
+                        if device in c.parents]
+        children.sort(key=lambda c: self._indexOrder[id(c)])
+        return children
+
+    def _lookup(self, kind, key):
+        """ Return the devices indexed under key, in device list order. """
+        self._syncIndex()
+        devices = self._index[kind].get(key, [])
+        return sorted(devices, key=lambda d: self._indexOrder[id(d)])
+
     def setDiskImages(self, images):
         """ Set the disk images and reflect them in exclusiveDisks. """
         self.diskImages = images
@@ -220,56 +415,182 @@ class DeviceTree(object):
         self._ignoredDisks.append(disk)
         devicelibs.lvm.lvm_cc_addFilterRejectRegexp(disk)
 
+    def removeIgnoredDisk(self, disk):
+        self._ignoredDisks.remove(disk)
+        devicelibs.lvm.lvm_cc_removeFilterRejectRegexp(disk)
+
     def pruneActions(self):
         """ Remove redundant/obsolete actions from the action list. """
-        for action in reversed(self._actions[:]):
-            if action not in self._actions:
+        # an action can only obsolete actions on the same device
+        byDevice = {}
+        for action in self._actions:
+            byDevice.setdefault(action.device.id, []).append(action)
+
+        pruned = set()
+        for action in reversed(self._actions):
+            if id(action) in pruned:
                 log.debug("action %d already pruned" % action.id)
                 continue
 
-            for obsolete in self._actions[:]:
+            for obsolete in byDevice[action.device.id]:
+                if id(obsolete) in pruned:
+                    continue
+
                 if action.obsoletes(obsolete):
                     log.info("removing obsolete action %d (%d)"
                              % (obsolete.id, action.id))
-                    self._actions.remove(obsolete)
+                    pruned.add(id(obsolete))
 
-    def sortActions(self):
-        """ Sort actions based on dependencies. """
-        if not self._actions:
-            return
+        self._actions = [a for a in self._actions if id(a) not in pruned]
 
-        edges = []
+    def _actionDependencies(self):
+        """ Return a list of (action, dependent action) index pairs.
+
+            Rather than asking every action whether it requires every other
+            action, only compare actions that can possibly be related:
+            those on the same device, on devices the action's device
+            depends on, on partitions of the same disk (this also covers
+            the extended/logical partition relationship) and on logical
+            volumes in the same volume group.
+        """
+        byDevice = {}
+        byDisk = {}
+        byVG = {}
+        for action in self._actions:
+            device = action.device
+            byDevice.setdefault(device.id, []).append(action)
+            if isinstance(device, PartitionDevice):
+                diskID = getattr(device.disk, "id", None)
+                byDisk.setdefault(diskID, []).append(action)
+            elif isinstance(device, LVMLogicalVolumeDevice):
+                byVG.setdefault(device.vg.id, []).append(action)
+
+        def relatedActions(action):
+            related = []
+            if isinstance(action.device, LVMLogicalVolumeDevice):
+                related.extend(byVG.get(action.device.vg.id, []))
+
+            seen = set()
+            devices = [action.device]
+            while devices:
+                device = devices.pop()
+                if device.id in seen:
+                    continue
 
-        # collect all ordering requirements for the actions
+                seen.add(device.id)
+                related.extend(byDevice.get(device.id, []))
+                if isinstance(device, PartitionDevice):
+                    diskID = getattr(device.disk, "id", None)
+                    related.extend(byDisk.get(diskID, []))
+                devices.extend(device.parents)
+
+            return related
+
+        indices = dict((id(a), i) for (i, a) in enumerate(self._actions))
+        edges = []
+        checked = set()
         for action in self._actions:
-            action_idx = self._actions.index(action)
-            children = []
-            for _action in self._actions:
-                if _action == action:
+            action_idx = indices[id(action)]
+            for other in relatedActions(action):
+                other_idx = indices[id(other)]
+                pair = (min(action_idx, other_idx), max(action_idx, other_idx))
+                if action_idx == other_idx or pair in checked:
                     continue
 
-                # create edges based on both action type and dependencies.
-                if action.type > _action.type or _action.requires(action):
-                    children.append(_action)
+                checked.add(pair)
+                if action.requires(other):
+                    edges.append((other_idx, action_idx))
+                if other.requires(action):
+                    edges.append((action_idx, other_idx))
 
-            for child in children:
-                child_idx = self._actions.index(child)
-                edges.append((action_idx, child_idx))
+        return edges
 
-        # create a graph reflecting the ordering information we have
-        graph = tsort.create_graph(range(len(self._actions)), edges)
+    def sortActions(self):
+        """ Sort actions based on dependencies.
 
-        # perform a topological sort based on the graph's contents
-        order = tsort.tsort(graph)
+            Return a list of (action, dependent action) index pairs into
+            the sorted list of actions.
+        """
+        if not self._actions:
+            return []
+
+        # actions of a given type all come before any action of a lower
+        # type, so we only need to sort each type's actions amongst
+        # themselves
+        groups = {}
+        for (idx, action) in enumerate(self._actions):
+            groups.setdefault(action.type, []).append(idx)
+
+        dependencies = self._actionDependencies()
+        edges = {}
+        for (parent, child) in dependencies:
+            parent_type = self._actions[parent].type
+            child_type = self._actions[child].type
+            if parent_type == child_type:
+                edges.setdefault(parent_type, []).append((parent, child))
+            elif parent_type < child_type:
+                # this dependency contradicts the ordering by type
+                raise tsort.CyclicGraphError("action %d requires action %d"
+                                             % (self._actions[child].id,
+                                                self._actions[parent].id))
+
+        # perform a topological sort of each type's actions
+        order = []
+        for action_type in sorted(groups.keys(), reverse=True):
+            graph = tsort.create_graph(groups[action_type],
+                                       edges.get(action_type, []))
+            order.extend(tsort.tsort(graph))
 
         # now replace self._actions with a sorted version of the same list
-        actions = []
-        for idx in order:
-            actions.append(self._actions[idx])
-        self._actions = actions
+        self._actions = [self._actions[idx] for idx in order]
+
+        position = dict((idx, pos) for (pos, idx) in enumerate(order))
+        return [(position[parent], position[child])
+                for (parent, child) in dependencies]
+
+    def processActions(self, dryRun=None, callback=None, workers=None):
+        """ Execute all registered actions.
+
+            callback, if given, is called with each action once it has been
+            executed.
+
+            Up to workers actions, ACTION_WORKERS by default, are executed
+            at the same time. See _executeActions for which ones.
+
+            How long each action took, and how much of that went to
+            external commands, udev and parted, is written to
+            ACTION_TIMING_REPORT and ACTION_TIMING_TRACE.
+        """
+        timeline = timing.startTimeline()
+        try:
+            self._processActions(dryRun=dryRun, callback=callback,
+                                 workers=workers)
+        finally:
+            timing.stopTimeline()
+            self._writeActionTiming(timeline)
+
+        udev_log_settle_stats()
 
-    def processActions(self, dryRun=None):
-        """ Execute all registered actions. """
+    def _writeActionTiming(self, timeline):
+        """ Write the report and trace of a processActions run. """
+        columns = ["exec", "udev", "parted", "renumber"]
+        try:
+            timeline.writeReport(ACTION_TIMING_REPORT, "action", columns)
+            timeline.writeTrace(ACTION_TIMING_TRACE)
+        except IOError as e:
+            log.error("failed to write action timing: %s" % e)
+
+        totals = dict.fromkeys(columns, 0)
+        actions = timeline.breakdown("action")
+        for (span, times, children) in actions:
+            for column in columns:
+                totals[column] += times.get(column, 0)
+
+        log.info("executed %d actions in %.2f seconds (%s)"
+                 % (len(actions), sum(a[0].duration for a in actions),
+                    ", ".join("%s %.2f" % (c, totals[c]) for c in columns)))
+
+    def _processActions(self, dryRun=None, callback=None, workers=None):
         log.info("resetting parted disks...")
         for device in self.devices:
             if device.partitioned:
@@ -309,27 +630,182 @@ class DeviceTree(object):
         self.pruneActions()
 
         log.info("sorting actions...")
-        self.sortActions()
+        edges = self.sortActions()
         for action in self._actions:
             log.debug("action: %s" % action)
 
-        for action in self._actions:
-            log.info("executing action: %s" % action)
-            if not dryRun:
+        if dryRun:
+            for action in self._actions:
+                log.info("executing action: %s" % action)
+                if callback:
+                    callback(action)
+            return
+
+        if workers is None:
+            workers = ACTION_WORKERS
+
+        prereqs = dict((idx, set()) for idx in range(len(self._actions)))
+        for (parent, child) in edges:
+            prereqs[child].add(parent)
+
+        # actions of a given type all complete before any action of a lower
+        # type starts, whether or not they are related
+        done = set()
+        start = 0
+        while start < len(self._actions):
+            end = start
+            while end < len(self._actions) and \
+                  self._actions[end].type == self._actions[start].type:
+                end += 1
+
+            self._executeActions(range(start, end), prereqs, done, workers,
+                                 callback)
+            start = end
+
+    def _executeActions(self, indices, prereqs, done, workers, callback):
+        """ Execute the actions at the given indices into the queue.
+
+            An action becomes ready once the actions listed in its prereqs
+            entry are in done. Ready format create, resize and migrate
+            actions are prepared on this thread and then executed on up to
+            workers threads. Every other action changes state all disks
+            share (partition tables, lvm, md), so it runs on this thread,
+            in queue order, while no other action is running. Those get
+            priority whenever the workers are idle.
+
+            The workers never get to use the interface, which only this
+            thread may drive. While they run, this thread shows a wait
+            window instead of the progress windows the actions would.
+
+            If an action fails, the ones already running are waited for and
+            the first failure is raised.
+        """
+        results = Queue.Queue()
+        def work(action, idx):
+            try:
+                with timing.span(str(action), "action"):
+                    self._executeAction(action, concurrent=True)
+            except Exception:
+                results.put((idx, sys.exc_info()))
+            else:
+                results.put((idx, None))
+
+        def finish(idx):
+            done.add(idx)
+            if callback:
+                callback(self._actions[idx])
+
+        pending = list(indices)
+        running = 0
+        error = None
+        wait = None
+        while pending or running:
+            ready = []
+            if error is None:
+                ready = [idx for idx in pending if prereqs[idx] <= done]
+
+            concurrent = [idx for idx in ready if workers > 1 and
+                          _isConcurrentAction(self._actions[idx])]
+            others = [idx for idx in ready if idx not in concurrent]
+
+            # get the serial work out of the way first, so as many
+            # concurrent actions as possible become ready at once
+            if others and not running:
+                idx = others[0]
+                pending.remove(idx)
+                action = self._actions[idx]
+                log.info("executing action: %s" % action)
+                with timing.span(str(action), "action"):
+                    self._executeAction(action)
+                finish(idx)
+                continue
+
+            for idx in concurrent[:workers - running]:
+                pending.remove(idx)
+                action = self._actions[idx]
+                log.info("executing action: %s" % action)
+                # the workers never touch partition tables, lvm or md
                 try:
-                    action.execute(intf=self.intf)
-                except DiskLabelCommitError:
-                    # it's likely that a previous format destroy action
-                    # triggered setup of an lvm or md device.
-                    self.teardownAll()
-                    action.execute(intf=self.intf)
+                    with timing.span("prepare %s" % action, "prepare"):
+                        self._retryCommit(action.prepare)
+                except Exception:
+                    error = sys.exc_info()
+                    break
 
-                udev_settle()
-                for device in self._devices:
-                    # make sure we catch any renumbering parted does
-                    if device.exists and isinstance(device, PartitionDevice):
-                        device.updateName()
-                        device.format.device = device.path
+                threading.Thread(target=work, args=(action, idx),
+                                 name="action-%d" % action.id).start()
+                running += 1
+
+            if not running:
+                break
+
+            if wait is None and self.intf:
+                wait = self.intf.waitWindow(_("Formatting"),
+                            _("Formatting and resizing filesystems.  This "
+                              "may take several minutes."))
+
+            result = None
+            while result is None:
+                try:
+                    result = results.get(timeout=0.25 if wait else None)
+                except Queue.Empty:
+                    wait.refresh()
+
+            (idx, excInfo) = result
+            running -= 1
+            if wait and not running:
+                wait.pop()
+                wait = None
+
+            if excInfo is None:
+                finish(idx)
+            elif error is None:
+                error = excInfo
+
+        if error:
+            raise error[0], error[1], error[2]
+        elif pending:
+            raise DeviceTreeError("unable to execute actions %s"
+                                  % [self._actions[idx].id for idx in pending])
+
+    def _retryCommit(self, method):
+        """ Call method, once more if a partition table commit fails. """
+        try:
+            method(intf=self.intf)
+        except DiskLabelCommitError:
+            # it's likely that a previous format destroy action
+            # triggered setup of an lvm or md device.
+            self.teardownAll()
+            method(intf=self.intf)
+
+    def _executeAction(self, action, concurrent=False):
+        """ Execute an action.
+
+            Actions executed concurrently with others have been prepared
+            already, so only their executeFormat step is run, and they
+            don't renumber partitions.
+        """
+        if concurrent:
+            # only the main thread may drive the interface
+            action.executeFormat(intf=None)
+        else:
+            self._retryCommit(action.execute)
+
+        udev_settle()
+
+        # any action can change what lvm sees, eg: destroying a
+        # partition that contains a pv
+        devicelibs.lvm.invalidateSnapshot()
+
+        if concurrent:
+            return
+
+        with timing.span("renumber partitions", "renumber"):
+            for device in self._devices:
+                # make sure we catch any renumbering parted does
+                if device.exists and isinstance(device, PartitionDevice):
+                    device.updateName()
+                    device.format.device = device.path
 
     def _addDevice(self, newdev):
         """ Add a device to the tree.
@@ -337,16 +813,21 @@ class DeviceTree(object):
             Raise ValueError if the device's identifier is already
             in the list.
         """
-        if newdev.uuid and newdev.uuid in [d.uuid for d in self._devices] and \
-           not isinstance(newdev, NoDevice):
+        if newdev.uuid and not isinstance(newdev, NoDevice) and \
+           [d for d in self._lookup("uuid", newdev.uuid)
+                if d.uuid == newdev.uuid]:
             raise ValueError("device is already in tree")
 
         # make sure this device's parent devices are in the tree already
         for parent in newdev.parents:
-            if parent not in self._devices:
+            if id(parent) not in self._indexOrder:
                 raise DeviceTreeError("parent device not in tree")
 
         self._devices.append(newdev)
+        self._indexOrder[id(newdev)] = self._indexSeq
+        self._indexSeq += 1
+        self._generation += 1
+        self._indexDevice(newdev)
 
         # don't include "req%d" partition names
         if ((newdev.type != "partition" or
@@ -362,7 +843,7 @@ class DeviceTree(object):
 
             Only leaves may be removed.
         """
-        if dev not in self._devices:
+        if id(dev) not in self._indexOrder:
             raise ValueError("Device '%s' not in tree" % dev.name)
 
         if not dev.isleaf and not force:
@@ -390,6 +871,9 @@ class DeviceTree(object):
                     device.updateName()
 
         self._devices.remove(dev)
+        self._unindexDevice(dev)
+        del self._indexOrder[id(dev)]
+        self._generation += 1
         if dev.name in self.names:
             self.names.remove(dev.name)
         log.info("removed %s %s (id %d) from device tree" % (dev.type,
@@ -493,28 +977,29 @@ class DeviceTree(object):
 
             The list includes both direct and indirect dependents.
         """
-        dependents = []
+        self._syncIndex()
+        dependents = {}
 
         # special handling for extended partitions since the logical
         # partitions and their deps effectively depend on the extended
-        logicals = []
         if isinstance(dep, PartitionDevice) and dep.partType and \
            dep.isExtended:
             # collect all of the logicals on the same disk
             for part in self.getDevicesByInstance(PartitionDevice):
                 if part.partType and part.isLogical and part.disk == dep.disk:
-                    logicals.append(part)
+                    dependents[id(part)] = part
 
-        for device in self.devices:
-            if device.dependsOn(dep):
-                dependents.append(device)
-            else:
-                for logical in logicals:
-                    if device.dependsOn(logical):
-                        dependents.append(device)
-                        break
+        # everything below dep and the logicals is a dependent, too
+        queue = deque([dep] + dependents.values())
+        while queue:
+            for child in self._childrenOf(queue.popleft()):
+                if id(child) not in dependents:
+                    dependents[id(child)] = child
+                    queue.append(child)
 
-        return dependents
+        dependents.pop(id(dep), None)
+        return sorted(dependents.values(),
+                      key=lambda d: self._indexOrder[id(d)])
 
     def isIgnored(self, info):
         """ Return True if info is a device we should ignore.
@@ -949,6 +1434,7 @@ class DeviceTree(object):
         log_method_call(self, name=name, info=pprint.pformat(info))
         uuid = udev_device_get_uuid(info)
         sysfs_path = udev_device_get_sysfs_path(info)
+        self._udevSeen[sysfs_path] = self._udevFingerprint(info)
 
         # make sure we note the name of every device we see
         if name not in self.names:
@@ -1654,9 +2140,15 @@ class DeviceTree(object):
             kwargs["uuid"] = info["ID_FS_UUID_SUB"]
             kwargs["volUUID"] = uuid
 
+        probed = self._probed.pop(name, None)
+        if probed:
+            format = probed.formatFor(args, kwargs)
+
         try:
             log.info("type detected on '%s' is '%s'" % (name, format_type,))
-            device.format = formats.getFormat(*args, **kwargs)
+            if format is None:
+                format = formats.getFormat(*args, **kwargs)
+            device.format = format
         except FSError:
             log.warning("type '%s' on '%s' invalid, assuming no format" %
                       (format_type, name,))
@@ -1694,7 +2186,11 @@ class DeviceTree(object):
         if device.format.type:
             log.info("got format: %s" % device.format)
 
-    def _handleInconsistencies(self):
+    def _handleInconsistencies(self, devices=None):
+        """ Resolve or ignore inconsistencies in the tree.
+
+            If devices is given, only look at the devices in that list.
+        """
         def reinitializeVG(vg):
             # First we remove VG data
             try:
@@ -1745,14 +2241,19 @@ class DeviceTree(object):
                             self.addIgnoredDisk(parent.name)
                         devicelibs.lvm.lvm_cc_addFilterRejectRegexp(parent.name)
 
+        def considered(devices_):
+            if devices is None:
+                return devices_
+            return [d for d in devices_ if d in devices]
+
         # Address the inconsistencies present in the tree leaves.
-        for leaf in self.leaves:
+        for leaf in considered(self.leaves):
             leafInconsistencies(leaf)
 
         # Check for unused BIOS raid members, unused dmraid members are added
         # to self.unusedRaidMembers as they are processed, extend this list
         # with unused mdraid BIOS raid members
-        for c in self.getDevicesByType("mdcontainer"):
+        for c in considered(self.getDevicesByType("mdcontainer")):
             if c.kids == 0:
                 self.unusedRaidMembers.extend(map(lambda m: m.name, c.devices))
 
@@ -1760,7 +2261,7 @@ class DeviceTree(object):
             self.intf.unusedRaidMembersWarning(self.unusedRaidMembers)
 
         # remove md array devices for which we did not find all members
-        for array in self.getDevicesByType("mdarray"):
+        for array in considered(self.getDevicesByType("mdarray")):
             if array.memberDevices > len(array.parents):
                 self._recursiveRemove(array)
 
@@ -1872,6 +2373,16 @@ class DeviceTree(object):
         finally:
             self.restoreConfigs()
 
+    def _probeDevices(self, devices):
+        """ Run the read-only probes for a list of udev devices.
+
+            The results are consumed by handleUdevDeviceFormat.
+        """
+        if self.probeThreads <= 0 or self._cleanup:
+            return
+
+        self._probed = probe.probeDevices(devices, self.probeThreads)
+
     def _populate(self, progressWindow):
         log.info("DeviceTree.populate: ignoredDisks is %s ; exclusiveDisks is %s"
                     % (self._ignoredDisks, self.exclusiveDisks))
@@ -1911,6 +2422,7 @@ class DeviceTree(object):
         log.info("devices to scan: %s" %
                  [d['name'] for d in self.topology.devices_iter()])
         old_devices = {}
+        devices = []
         for dev in self.topology.devices_iter():
             # avoid the problems caused by encountering multipath devices in
             # this loop by simply skipping all dm devices here
@@ -1918,6 +2430,10 @@ class DeviceTree(object):
                 log.debug("Skipping a device mapper drive (%s) for now" % dev['name'])
                 continue
 
+            devices.append(dev)
+
+        self._probeDevices(devices)
+        for dev in devices:
             old_devices[dev['name']] = dev
             self.addUdevDevice(dev)
             if progressWindow:
@@ -1954,6 +2470,28 @@ class DeviceTree(object):
 
         # Now, loop and scan for devices that have appeared since the two above
         # blocks or since previous iterations.
+        self._scanNewDevices(old_devices, progressWindow)
+        self._probed = {}
+        self.populated = True
+
+        # After having the complete tree we make sure that the system
+        # inconsistencies are ignored or resolved.
+        self._handleInconsistencies()
+
+        self.teardownAll()
+        udev_log_settle_stats()
+
+    def _scanNewDevices(self, old_devices, progressWindow, since=None):
+        """ Scan the devices udev lists that are not in old_devices.
+
+            old_devices is a dict of udev info dicts keyed by device name
+            that gets updated as devices are scanned. Scanning continues
+            until no new devices show up.
+
+            If since is given, only the lvs added to the tree at or after
+            that insertion sequence number are rescanned once they have
+            been set up.
+        """
         while True:
             devices = []
             new_devices = udev_get_block_devices()
@@ -1972,25 +2510,218 @@ class DeviceTree(object):
                     # remove any logical volume devices from old_devices so
                     # they will be re-scanned to get their formatting handled
                     for (old_name, old_device) in old_devices.items():
-                        if udev_device_is_dm_lvm(old_device):
-                            del old_devices[old_name]
+                        if not udev_device_is_dm_lvm(old_device):
+                            continue
+
+                        if since is not None:
+                            lv = self.getDeviceByName(old_name)
+                            if lv and self._indexOrder[id(lv)] < since:
+                                continue
+
+                        del old_devices[old_name]
                     continue
                 # nothing is changing -- we are finished building devices
                 break
 
             log.info("devices to scan: %s" % [d['name'] for d in devices])
+            self._probeDevices(devices)
             for dev in devices:
                 self.addUdevDevice(dev)
                 if progressWindow:
                     progressWindow.pulse()
 
-        self.populated = True
+    # udev properties that change when a device or its contents do; not the
+    # event's SEQNUM or USEC_INITIALIZED, since the "change" events we
+    # trigger before each reset would make every device look changed
+    _udevFingerprintKeys = ("MAJOR", "MINOR", "DM_NAME", "DM_UUID", "MD_UUID",
+                            "MD_LEVEL", "ID_PART_TABLE_TYPE",
+                            "ID_PART_ENTRY_OFFSET", "ID_PART_ENTRY_SIZE",
+                            "ID_FS_TYPE", "ID_FS_UUID", "ID_FS_UUID_SUB",
+                            "ID_FS_LABEL")
+
+    def _udevFingerprint(self, info):
+        return tuple(info.get(key) for key in self._udevFingerprintKeys)
+
+    @staticmethod
+    def _confKey(conf):
+        """ Return the parts of conf that determine how the tree is built. """
+        return (list(getattr(conf, "ignoredDisks", [])),
+                list(getattr(conf, "exclusiveDisks", [])),
+                getattr(conf, "clearPartType", CLEARPART_TYPE_NONE),
+                list(getattr(conf, "clearPartDisks", [])),
+                getattr(conf, "zeroMbr", False),
+                getattr(conf, "reinitializeDisks", False),
+                list(getattr(conf, "protectedDevSpecs", [])),
+                dict(getattr(conf, "diskImages", {})),
+                getattr(conf, "mpathFriendlyNames", True))
+
+    def _reconsideredDisks(self, conf, infos):
+        """ Return the ignored devices conf lets into the tree, or None.
+
+            The only configuration change the tree can follow in place is
+            disks being added to exclusiveDisks, eg. after the user attached
+            a new iSCSI, FCoE or zFCP target in the filter UI. Those disks and
+            their partitions have to be looked at again. Return None for any
+            other change, or if one of the added disks is multipath related.
+        """
+        key = self._confKey(conf)
+        (old, new) = (self._conf[1], key[1])
+        if key[:1] + key[2:] != self._conf[:1] + self._conf[2:] or \
+           self.diskImages or not old or not set(old).issubset(new):
+            return None
 
-        # After having the complete tree we make sure that the system
-        # inconsistencies are ignored or resolved.
-        self._handleInconsistencies()
+        added = [d for d in new if d not in old]
+        paths = []
+        for (path, info) in infos.items():
+            if udev_device_get_name(info) in added:
+                if udev_device_is_multipath_member(info):
+                    return None
+                paths.append(path)
 
-        self.teardownAll()
+        if len(paths) != len(added):
+            log.info("rescan: not all of %s found" % added)
+            return None
+
+        reconsidered = []
+        for (path, info) in infos.items():
+            name = udev_device_get_name(info)
+            if name in self._ignoredDisks and \
+               [p for p in paths if path == p or path.startswith(p + "/")]:
+                reconsidered.append(name)
+
+        return reconsidered
+
+    def _followConf(self, conf, reconsidered):
+        """ Switch the tree over to conf, see _reconsideredDisks. """
+        if conf is None:
+            return
+
+        for disk in reconsidered:
+            self.removeIgnoredDisk(disk)
+
+        self.exclusiveDisks = getattr(conf, "exclusiveDisks", [])
+        self._conf = self._confKey(conf)
+
+    def rescan(self, conf=None, progressWindow=None):
+        """ Bring a populated tree up to date with the system.
+
+            Instead of starting over, only the devices udev reports as new,
+            removed or changed since they were scanned are looked at, along
+            with the devices that depend on them. Scheduled actions and
+            passphrases are kept. So are the devices we ignored, unless conf
+            adds disks to exclusiveDisks.
+
+            Return False, without touching the tree, if it cannot be updated
+            in place: if conf differs from the configuration the tree was
+            built with in any other way, if multipath is involved, or if a
+            device that has to be rescanned has actions scheduled on it. The
+            caller then has to build a new tree.
+        """
+        if not self.populated or self._cleanup:
+            return False
+
+        infos = {}
+        for info in udev_get_block_devices():
+            infos[udev_device_get_sysfs_path(info)] = info
+
+        reconsidered = []
+        if conf is not None and self._confKey(conf) != self._conf:
+            reconsidered = self._reconsideredDisks(conf, infos)
+            if reconsidered is None:
+                log.info("rescan: storage configuration changed")
+                return False
+
+            log.info("rescan: exclusiveDisks grew to %s, reconsidering %s"
+                     % (conf.exclusiveDisks, reconsidered))
+
+        # the devices we ignored but may not anymore are as good as new
+        seen = dict((p, f) for (p, f) in self._udevSeen.items()
+                    if p not in infos or
+                       udev_device_get_name(infos[p]) not in reconsidered)
+
+        gone = [p for p in seen if p not in infos]
+        changed = [p for p in seen if p in infos and
+                   self._udevFingerprint(infos[p]) != seen[p]]
+        new = [p for p in infos if p not in seen]
+        log.info("rescan: new: %s ; removed: %s ; changed: %s"
+                 % (new, gone, changed))
+        if not (new or gone or changed):
+            self._followConf(conf, reconsidered)
+            return True
+
+        # partitions coming or going mean their disk's partition table has
+        # changed
+        for path in new + gone:
+            disk_path = os.path.dirname(path)
+            if disk_path in infos and disk_path in seen and \
+               disk_path not in changed:
+                changed.append(disk_path)
+
+        # multipath devices are only set up from the complete topology
+        for path in new + changed:
+            if udev_device_is_multipath_member(infos[path]) or \
+               udev_device_is_dm_mpath(infos[path]):
+                log.info("rescan: %s is multipath related" % path)
+                return False
+
+        # everything built on top of a removed or changed device goes too
+        affected = []
+        for path in gone + changed:
+            device = self.getDeviceBySysfsPath(path)
+            if not device or device in affected:
+                continue
+
+            for dep in [device] + self.getDependentDevices(device):
+                if dep not in affected:
+                    affected.append(dep)
+
+        for device in affected:
+            if device.type == "dm-multipath" or \
+               device.format.type == "multipath_member":
+                log.info("rescan: %s is multipath related" % device.name)
+                return False
+
+            if self.findActions(device=device):
+                log.info("rescan: %s has actions scheduled" % device.name)
+                return False
+
+        self._followConf(conf, reconsidered)
+        self.backupConfigs()
+        try:
+            # remove the affected devices, children before their parents
+            affected.sort(key=lambda d: self._indexOrder[id(d)], reverse=True)
+            for device in affected:
+                self._removeDevice(device, moddisk=False)
+                self._udevSeen.pop(device.sysfsPath, None)
+
+            for path in gone + changed + new:
+                self._udevSeen.pop(path, None)
+
+            # everything we have not seen, or no longer remember, is new
+            old_devices = {}
+            for (path, info) in infos.items():
+                if path in self._udevSeen:
+                    old_devices[info["name"]] = info
+
+            since = self._indexSeq
+            self._scanNewDevices(old_devices, progressWindow, since=since)
+            added = [d for d in self._devices
+                        if self._indexOrder[id(d)] >= since]
+
+            self._handleInconsistencies(devices=added)
+
+            for device in added:
+                if device.isleaf:
+                    try:
+                        device.teardown(recursive=True)
+                    except StorageError as e:
+                        log.info("teardown of %s failed: %s"
+                                 % (device.name, e))
+        finally:
+            self.restoreConfigs()
+
+        log.info("rescan: added %s" % [d.name for d in added])
+        return True
 
     def teardownAll(self):
         """ Run teardown methods on all devices. """
@@ -2013,10 +2744,9 @@ class DeviceTree(object):
             return None
 
         found = None
-        for device in self._devices:
-            if device.sysfsPath == path:
-                found = device
-                break
+        devices = self._lookup("sysfsPath", path)
+        if devices:
+            found = devices[0]
 
         log_method_return(self, found)
         return found
@@ -2026,26 +2756,15 @@ class DeviceTree(object):
             return None
 
         found = None
-        for device in self._devices:
-            if device.uuid == uuid:
-                found = device
-                break
-            elif device.format.uuid == uuid:
-                found = device
-                break
+        devices = self._lookup("uuid", uuid)
+        if devices:
+            found = devices[0]
 
         log_method_return(self, found)
         return found
 
     def getDevicesBySerial(self, serial):
-        devices = []
-        for device in self._devices:
-            if not hasattr(device, "serial"):
-                log.warning("device %s has no serial attr" % device.name)
-                continue
-            if device.serial == serial:
-                devices.append(device)
-
+        devices = self._lookup("serial", serial)
         log_method_return(self, devices)
         return devices
 
@@ -2054,18 +2773,22 @@ class DeviceTree(object):
             return None
 
         found = None
-        for device in self._devices:
-            _label = getattr(device.format, "label", None)
-            if not _label:
-                continue
-
-            if _label == label:
-                found = device
-                break
+        devices = self._lookup("label", label)
+        if devices:
+            found = devices[0]
 
         log_method_return(self, found)
         return found
 
+    def _lookupLVMAlias(self, kind, key):
+        """ Return the lvm devices matching key with "--" taken as "-". """
+        alias = key.replace("--","-")
+        if alias == key:
+            return []
+
+        return [d for d in self._lookup(kind, alias)
+                    if d.type == "lvmlv" or d.type == "lvmvg"]
+
     def getDeviceByName(self, name):
         log_method_call(self, name=name)
         if not name:
@@ -2073,14 +2796,10 @@ class DeviceTree(object):
             return None
 
         found = None
-        for device in self._devices:
-            if device.name == name:
-                found = device
-                break
-            elif (device.type == "lvmlv" or device.type == "lvmvg") and \
-                    device.name == name.replace("--","-"):
-                found = device
-                break
+        devices = self._lookup("name", name) + \
+                  self._lookupLVMAlias("name", name)
+        if devices:
+            found = min(devices, key=lambda d: self._indexOrder[id(d)])
 
         log_method_return(self, found)
         return found
@@ -2094,7 +2813,11 @@ class DeviceTree(object):
         found = None
         leaf = None
         other = None
-        for device in self._devices:
+        devices = self._lookup("path", path) + \
+                  self._lookupLVMAlias("path", path)
+        devices.extend(self._lookup("path", None))
+        devices.sort(key=lambda d: self._indexOrder[id(d)])
+        for device in devices:
             if (device.path == path or
                 ((device.type == "lvmlv" or device.type == "lvmvg") and
                  device.path == path.replace("--","-"))):
@@ -2116,28 +2839,28 @@ class DeviceTree(object):
 
     def getDevicesByType(self, device_type):
         # TODO: expand this to catch device format types
-        return [d for d in self._devices if d.type == device_type]
+        return self._cached(("type", device_type),
+                            lambda: [d for d in self._devices
+                                        if d.type == device_type])[:]
 
     def getDevicesByInstance(self, device_class):
-        return [d for d in self._devices if isinstance(d, device_class)]
+        return self._cached(("instance", device_class),
+                            lambda: [d for d in self._devices
+                                        if isinstance(d, device_class)])[:]
 
     @property
     def devices(self):
         """ List of device instances """
-        devices = []
-        for device in self._devices:
-            if device.uuid and device.uuid in [d.uuid for d in devices] and \
-               not isinstance(device, NoDevice):
-                raise DeviceTreeError("duplicate uuids in device tree")
-
-            devices.append(device)
-
-        return devices
+        # _addDevice makes sure there are no duplicate uuids
+        return self._devices[:]
 
     @property
     def filesystems(self):
         """ List of filesystems. """
         #""" Dict with mountpoint keys and filesystem values. """
+        return self._cached("filesystems", self._getFilesystems)[:]
+
+    def _getFilesystems(self):
         filesystems = []
         for dev in self.leaves:
             if dev.format and getattr(dev.format, 'mountpoint', None):
@@ -2148,6 +2871,9 @@ class DeviceTree(object):
     @property
     def uuids(self):
         """ Dict with uuid keys and Device values. """
+        return dict(self._cached("uuids", self._getUuids))
+
+    def _getUuids(self):
         uuids = {}
         for dev in self._devices:
             try:
@@ -2174,6 +2900,9 @@ class DeviceTree(object):
 
             FIXME: duplicate labels are a possibility
         """
+        return dict(self._cached("labels", self._getLabels))
+
+    def _getLabels(self):
         labels = {}
         for dev in self._devices:
             # don't include btrfs member devices
@@ -2186,12 +2915,13 @@ class DeviceTree(object):
     @property
     def leaves(self):
         """ List of all devices upon which no other devices exist. """
-        leaves = [d for d in self._devices if d.isleaf]
-        return leaves
+        return self._cached("leaves",
+                            lambda: [d for d in self._devices if d.isleaf])[:]
 
     def getChildren(self, device):
         """ Return a list of a device's children. """
-        return [c for c in self._devices if device in c.parents]
+        self._syncIndex()
+        return self._childrenOf(device)
 
     def resolveDevice(self, devspec, blkidTab=None, cryptTab=None):
         # find device in the tree
@@ -28,6 +28,7 @@ from pyanaconda.iutil import get_sysfs_path_by_name
 from pyanaconda.iutil import execWithRedirect
 from pyanaconda.anaconda_log import log_method_call
 from ..errors import *
+from ..changes import noteChange
 from ..devicelibs.dm import dm_node_from_name
 from ..udev import udev_device_get_major, udev_device_get_minor
 
@@ -151,6 +152,9 @@ class DeviceFormat(object):
     _check = False
     _hidden = False                     # hide devices with this formatting?
 
+    # attributes DeviceTree looks devices up by or derives its lists from
+    _trackedAttrs = frozenset(["uuid", "label", "mountpoint"])
+
     def __init__(self, *args, **kwargs):
         """ Create a DeviceFormat instance.
 
@@ -172,6 +176,11 @@ class DeviceFormat(object):
         #if self.__class__ is DeviceFormat:
         #    self.exists = True
 
+    def __setattr__(self, attr, value):
+        object.__setattr__(self, attr, value)
+        if attr in self._trackedAttrs:
+            noteChange(self)
+
     def __repr__(self):
         s = ("%(classname)s instance (%(id)s) --\n"
              "  type = %(type)s  name = %(name)s  status = %(status)s\n"
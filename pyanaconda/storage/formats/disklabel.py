@@ -25,6 +25,7 @@ import copy
 
 from pyanaconda.anaconda_log import log_method_call
 from pyanaconda import iutil
+from pyanaconda import timing
 import parted
 import _ped
 from ..errors import *
@@ -272,7 +273,8 @@ class DiskLabel(DeviceFormat):
         log_method_call(self, device=self.device,
                         numparts=len(self.partitions))
         try:
-            self.partedDisk.commit()
+            with timing.span("commit %s" % self.device, "parted"):
+                self.partedDisk.commit()
         except parted.DiskException as msg:
             raise DiskLabelCommitError(msg)
         else:
@@ -283,7 +285,8 @@ class DiskLabel(DeviceFormat):
         log_method_call(self, device=self.device,
                         numparts=len(self.partitions))
         try:
-            self.partedDisk.commitToDevice()
+            with timing.span("commitToDevice %s" % self.device, "parted"):
+                self.partedDisk.commitToDevice()
         except parted.DiskException as msg:
             raise DiskLabelCommitError(msg)
 
@@ -30,6 +30,7 @@ import math
 import os
 import sys
 import tempfile
+import threading
 import selinux
 from pyanaconda import isys
 
@@ -53,6 +54,10 @@ except OSError:
 
 fs_configs = {}
 
+# minimum sizes of existing filesystems, keyed on (type, uuid, size); they
+# take a while to compute and stay valid across Storage.reset()
+_minSizeCache = {}
+
 def get_kernel_filesystems():
     fs_list = []
     for line in open("/proc/filesystems").readlines():
@@ -102,6 +107,31 @@ def fsConfigFromFile(config_file):
     # XXX what's the policy about multiple configs for a given type?
     fs_configs[fs_attrs['type']] = fs_attrs
 
+def prefetchMinSizes(fmts):
+    """ Compute the minimum sizes of existing filesystems in the background.
+
+        Arguments:
+
+            fmts -- a list of FS instances
+
+        Return the started daemon thread. Failures are left for whoever
+        asks for a filesystem's minSize later to run into.
+    """
+    fmts = [f for f in fmts if isinstance(f, FS) and f.exists]
+
+    def prefetch():
+        for fmt in fmts:
+            try:
+                fmt.minSize
+            except Exception as e:
+                log.debug("prefetch of minimum size for %s failed: %s"
+                          % (fmt.device, e))
+
+    thread = threading.Thread(target=prefetch, name="minsize-prefetch")
+    thread.daemon = True
+    thread.start()
+    return thread
+
 class FS(DeviceFormat):
     """ Filesystem class. """
     _type = "Abstract Filesystem Class"  # fs type name
@@ -154,7 +184,6 @@ class FS(DeviceFormat):
         self._mountpoint = None     # the current mountpoint when mounted
         if self.exists:
             self._size = self._getExistingSize()
-            foo = self.minSize      # force calculation of minimum size
 
         self._targetSize = self._size
 
@@ -219,6 +248,51 @@ class FS(DeviceFormat):
     size = property(_getSize, doc="This filesystem's size, accounting "
                                   "for pending changes")
 
+    @property
+    def _minSizeKey(self):
+        """ The key this filesystem's minimum size is cached under. """
+        if not self.exists or not self.uuid:
+            return None
+
+        return (self.type, self.uuid, self._size)
+
+    def _getMinSize(self):
+        """ Determine the minimum size of this filesystem in MB. """
+        return self._minSize
+
+    @property
+    def minSize(self):
+        """ Minimum size for this filesystem in MB.
+
+            For an existing filesystem this is only determined once it is
+            asked for, which is usually when somebody wants to resize it.
+        """
+        if self._minInstanceSize is None:
+            key = self._minSizeKey
+            size = _minSizeCache.get(key)
+            if size is None:
+                try:
+                    size = self._getMinSize()
+                except FSError as e:
+                    # this used to keep the format from being instantiated
+                    # at all; now the least we can do is not shrink it
+                    log.warning("failed to get minimum size for %s: %s"
+                                % (self.device, e))
+                    size = self._size
+                    key = None
+
+                if key:
+                    _minSizeCache[key] = size
+
+            self._minInstanceSize = size
+
+        return self._minInstanceSize
+
+    def _resetMinSize(self):
+        """ Forget this filesystem's minimum size so it gets redetermined. """
+        _minSizeCache.pop(self._minSizeKey, None)
+        self._minInstanceSize = None
+
     def _getExistingSize(self):
         """ Determine the size of this filesystem.  Filesystem must
             exist.  Each filesystem varies, but the general procedure
@@ -452,7 +526,7 @@ class FS(DeviceFormat):
         # properly unmounted. After doCheck the minimum size will be correct
         # so run the check one last time and bump up the size if it was too
         # small.
-        self._minInstanceSize = None
+        self._resetMinSize()
         if self.targetSize < self.minSize:
             self.targetSize = self.minSize
             log.info("Minimum size changed, setting targetSize on %s to %s" \
@@ -991,54 +1065,48 @@ class Ext2FS(FS):
         if err:
             raise FSError("failed to set UUID for %s: %s" % (self.device, err))
 
-    @property
-    def minSize(self):
-        """ Minimum size for this filesystem in MB. """
-        if self._minInstanceSize is None:
-            # try once in the beginning to get the minimum size for an
-            # existing filesystem.
-            size = self._minSize
-            blockSize = None
-
-            if self.exists and os.path.exists(self.device):
-                # get block size
-                buf = iutil.execWithCapture(self.infofsProg,
-                                            ["-h", self.device],
-                                            stderr="/dev/tty5")
-                for line in buf.splitlines():
-                    if line.startswith("Block size:"):
-                        blockSize = int(line.split(" ")[-1])
-                        break
-
-                if blockSize is None:
-                    raise FSError("failed to get block size for %s filesystem "
-                                  "on %s" % (self.mountType, self.device))
+    def _getMinSize(self):
+        """ Determine the minimum size of this filesystem in MB. """
+        size = self._minSize
+        blockSize = None
 
-                # get minimum size according to resize2fs
-                buf = iutil.execWithCapture(self.resizefsProg,
-                                            ["-P", self.device],
-                                            stderr="/dev/tty5")
-                for line in buf.splitlines():
-                    if "minimum size of the filesystem:" not in line:
-                        continue
-
-                    # line will look like:
-                    # Estimated minimum size of the filesystem: 1148649
-                    #
-                    # NOTE: The minimum size reported is in blocks.  Convert
-                    # to bytes, then megabytes, and finally round up.
-                    (text, sep, minSize) = line.partition(": ")
-                    size = long(minSize) * blockSize
-                    size = math.ceil(size / 1024.0 / 1024.0)
+        if self.exists and os.path.exists(self.device):
+            # get block size
+            buf = iutil.execWithCapture(self.infofsProg,
+                                        ["-h", self.device],
+                                        stderr="/dev/tty5")
+            for line in buf.splitlines():
+                if line.startswith("Block size:"):
+                    blockSize = int(line.split(" ")[-1])
                     break
 
-                if size is None:
-                    log.warning("failed to get minimum size for %s filesystem "
-                                "on %s" % (self.mountType, self.device))
+            if blockSize is None:
+                raise FSError("failed to get block size for %s filesystem "
+                              "on %s" % (self.mountType, self.device))
 
-            self._minInstanceSize = size
+            # get minimum size according to resize2fs
+            buf = iutil.execWithCapture(self.resizefsProg,
+                                        ["-P", self.device],
+                                        stderr="/dev/tty5")
+            for line in buf.splitlines():
+                if "minimum size of the filesystem:" not in line:
+                    continue
+
+                # line will look like:
+                # Estimated minimum size of the filesystem: 1148649
+                #
+                # NOTE: The minimum size reported is in blocks.  Convert
+                # to bytes, then megabytes, and finally round up.
+                (text, sep, minSize) = line.partition(": ")
+                size = long(minSize) * blockSize
+                size = math.ceil(size / 1024.0 / 1024.0)
+                break
+
+            if size is None:
+                log.warning("failed to get minimum size for %s filesystem "
+                            "on %s" % (self.mountType, self.device))
 
-        return self._minInstanceSize
+        return size
 
     @property
     def isDirty(self):
@@ -1406,36 +1474,31 @@ class NTFS(FS):
             return True
         return False
 
-    @property
-    def minSize(self):
-        """ The minimum filesystem size in megabytes. """
-        if self._minInstanceSize is None:
-            # we try one time to determine the minimum size.
-            size = self._minSize
-            if self.exists and os.path.exists(self.device):
-                minSize = None
-                buf = iutil.execWithCapture(self.resizefsProg,
-                                            ["-m", self.device],
-                                            stderr = "/dev/tty5")
-                for l in buf.split("\n"):
-                    if not l.startswith("Minsize"):
-                        continue
-                    try:
-                        min = l.split(":")[1].strip()
-                        minSize = int(min) + 250
-                    except (IndexError, ValueError) as e:
-                        minSize = None
-                        log.warning("Unable to parse output for minimum size on %s: %s" %(self.device, e))
-
-                if minSize is None:
-                    log.warning("Unable to discover minimum size of filesystem "
-                                "on %s" %(self.device,))
-                else:
-                    size = minSize
-
-            self._minInstanceSize = size
+    def _getMinSize(self):
+        """ Determine the minimum size of this filesystem in MB. """
+        size = self._minSize
+        if self.exists and os.path.exists(self.device):
+            minSize = None
+            buf = iutil.execWithCapture(self.resizefsProg,
+                                        ["-m", self.device],
+                                        stderr = "/dev/tty5")
+            for l in buf.split("\n"):
+                if not l.startswith("Minsize"):
+                    continue
+                try:
+                    min = l.split(":")[1].strip()
+                    minSize = int(min) + 250
+                except (IndexError, ValueError) as e:
+                    minSize = None
+                    log.warning("Unable to parse output for minimum size on %s: %s" %(self.device, e))
+
+            if minSize is None:
+                log.warning("Unable to discover minimum size of filesystem "
+                            "on %s" %(self.device,))
+            else:
+                size = minSize
 
-        return self._minInstanceSize
+        return size
 
     @property
     def resizeArgs(self):
@@ -0,0 +1,158 @@
+# probe.py
+# Read-only probing of block devices ahead of device tree population.
+#
+# Copyright (C) 2012  Red Hat, Inc.
+#
+# This copyrighted material is made available to anyone wishing to use,
+# modify, copy, or redistribute it subject to the terms and conditions of
+# the GNU General Public License v.2, or (at your option) any later version.
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY expressed or implied, including the implied warranties of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General
+# Public License for more details.  You should have received a copy of the
+# GNU General Public License along with this program; if not, write to the
+# Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.  Any Red Hat trademarks that are incorporated in the
+# source code or documentation are not subject to the GNU General Public
+# License and may only be used or replicated with the express permission of
+# Red Hat, Inc.
+#
+
+""" Probing of block devices on a pool of threads.
+
+    Most of the time DeviceTree.populate spends on a device goes to the
+    helpers run while instantiating the device's existing filesystem (eg:
+    dumpe2fs to get its size). None of them
+    change anything, so they can be run for many devices at once before
+    the tree is built.
+
+    probeDevices instantiates the formats on a bounded number of threads
+    and returns a ProbeResult for each device. While populating the tree,
+    DeviceTree only uses a probed format if the udev data for the device
+    leads it to exactly the same format constructor arguments; in every
+    other case it instantiates the format itself, just as it would without
+    the probe stage.
+"""
+
+import threading
+import Queue
+
+import formats
+from formats.fs import FS
+from errors import *
+from udev import *
+
+import logging
+log = logging.getLogger("storage")
+
+class ProbeResult(object):
+    """ The outcome of probing a single device. """
+    def __init__(self, name, args, kwargs, format=None):
+        self.name = name
+        self.args = args
+        self.kwargs = kwargs
+        self.format = format
+
+    def formatFor(self, args, kwargs):
+        """ Return the probed format if it was built from args and kwargs. """
+        if self.format is None or args != self.args or kwargs != self.kwargs:
+            return None
+
+        return self.format
+
+def formatArguments(info):
+    """ Guess the format constructor arguments for a device.
+
+        Return an (args, kwargs) tuple of the arguments DeviceTree is
+        expected to use for the existing filesystem on the device described
+        by info, or None if there is no filesystem to probe.
+    """
+    format_type = udev_device_get_format(info)
+    if not format_type:
+        return None
+
+    fmt_class = formats.get_device_format_class(format_type)
+    if not fmt_class or not issubclass(fmt_class, FS):
+        return None
+
+    name = udev_device_get_name(info)
+    if udev_device_is_dm(info):
+        path = "/dev/mapper/%s" % name
+    else:
+        path = "/dev/%s" % name
+
+    kwargs = {"uuid": udev_device_get_uuid(info),
+              "label": udev_device_get_label(info),
+              "device": path,
+              "serial": udev_device_get_serial(info),
+              "exists": True}
+    if format_type == "btrfs":
+        kwargs["uuid"] = info.get("ID_FS_UUID_SUB")
+        kwargs["volUUID"] = udev_device_get_uuid(info)
+
+    return ([format_type], kwargs)
+
+def probeDevice(info):
+    """ Probe the device described by info and return a ProbeResult. """
+    arguments = formatArguments(info)
+    if arguments is None:
+        return None
+
+    (args, kwargs) = arguments
+    result = ProbeResult(udev_device_get_name(info), args, kwargs)
+    try:
+        result.format = formats.getFormat(*args, **kwargs)
+    except FSError as e:
+        # leave it to the device tree to run into this again and deal
+        # with it the way it always does
+        log.debug("probe of %s failed: %s" % (result.name, e))
+
+    return result
+
+def probeDevices(infos, threads):
+    """ Probe a list of devices on a pool of threads.
+
+        Arguments:
+
+            infos -- a list of udev info dicts
+            threads -- the maximum number of threads to use
+
+        Return a dict mapping device names to ProbeResult instances. Devices
+        that have nothing worth probing or whose probe failed unexpectedly
+        do not appear in it.
+    """
+    work = Queue.Queue()
+    for info in infos:
+        work.put(info)
+
+    results = {}
+    lock = threading.Lock()
+
+    def worker():
+        while True:
+            try:
+                info = work.get_nowait()
+            except Queue.Empty:
+                return
+
+            try:
+                result = probeDevice(info)
+            except Exception as e:
+                log.error("probe of %s failed: %s"
+                          % (info.get("name"), e))
+                continue
+
+            if result:
+                with lock:
+                    results[result.name] = result
+
+    pool = [threading.Thread(target=worker, name="probe-%d" % i)
+                for i in range(min(threads, len(infos)))]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+
+    log.info("probed %d of %d devices using %d threads"
+             % (len(results), len(infos), len(pool)))
+    return results
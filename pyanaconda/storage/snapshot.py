@@ -0,0 +1,203 @@
+# snapshot.py
+# Append-only log of device tree and action queue snapshots.
+#
+# Copyright (C) 2012  Red Hat, Inc.
+#
+# This copyrighted material is made available to anyone wishing to use,
+# modify, copy, or redistribute it subject to the terms and conditions of
+# the GNU General Public License v.2, or (at your option) any later version.
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY expressed or implied, including the implied warranties of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General
+# Public License for more details.  You should have received a copy of the
+# GNU General Public License along with this program; if not, write to the
+# Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.  Any Red Hat trademarks that are incorporated in the
+# source code or documentation are not subject to the GNU General Public
+# License and may only be used or replicated with the express permission of
+# Red Hat, Inc.
+#
+
+""" Snapshots of the device tree, written as JSON lines.
+
+    Every line of the log is a JSON object of one of these forms:
+
+        {"snapshot": label, "time": t}      starts a new snapshot
+        {"snapshot": label, "time": t,      starts the first snapshot of a
+         "first": true}                     new StateLog
+        {"device": id, "data": {...}}       a device's dict
+        {"device": id}                      a device whose dict is the same
+                                            as the last one logged for it
+        {"action": id, "data": description} an action added to the queue
+        {"done": id}                        an action gone from the queue
+
+    A snapshot consists of the device lines that follow its "snapshot"
+    line, and of the queue as the action and done lines up to the next
+    snapshot leave it. Since a device that has not changed costs a single
+    short line and an action is only logged when it enters and leaves the
+    queue, a snapshot can be taken after every action without the log
+    growing much.
+"""
+
+import json
+import time
+from collections import OrderedDict
+
+import logging
+log = logging.getLogger("storage")
+
+class StateLog(object):
+    """ A file that snapshots of the device tree get appended to. """
+    def __init__(self, path):
+        self.path = path
+        self._logged = {}           # device id -> last data logged for it
+        self._queued = None         # ids of the actions in the logged queue
+
+    def write(self, label, devices, actions=(), changed=None):
+        """ Append a snapshot to the log.
+
+            Arguments:
+
+                label -- a name for the snapshot, eg: "initial"
+                devices -- the devices to record
+                actions -- the actions in the queue
+
+            Keyword Arguments:
+
+                changed -- the ids of the devices that may have changed
+                           since the last snapshot, or None if any of them
+                           may have
+        """
+        record = {"snapshot": label, "time": time.time()}
+        if self._queued is None:
+            record["first"] = True
+            self._queued = set()
+        lines = [json.dumps(record)]
+
+        for device in devices:
+            if changed is not None and device.id not in changed and \
+               device.id in self._logged:
+                lines.append('{"device": %d}' % device.id)
+                continue
+
+            data = json.dumps(device.dict, sort_keys=True, default=str)
+            if self._logged.get(device.id) == data:
+                lines.append('{"device": %d}' % device.id)
+            else:
+                lines.append('{"device": %d, "data": %s}' % (device.id, data))
+                self._logged[device.id] = data
+
+        queued = set()
+        for action in actions:
+            queued.add(action.id)
+            if action.id not in self._queued:
+                lines.append(json.dumps({"action": action.id,
+                                         "data": str(action)}))
+
+        for action_id in sorted(self._queued - queued):
+            lines.append('{"done": %d}' % action_id)
+        self._queued = queued
+
+        try:
+            with open(self.path, "a") as f:
+                f.write("\n".join(lines) + "\n")
+        except IOError as e:
+            log.error("failed to write %s snapshot: %s" % (label, e))
+
+def _intern(value):
+    """ Intern the strings in a decoded JSON value. """
+    if isinstance(value, dict):
+        return dict((intern(str(k)), _intern(v)) for (k, v) in value.items())
+    elif isinstance(value, list):
+        return [_intern(v) for v in value]
+    elif isinstance(value, unicode):
+        try:
+            return intern(str(value))
+        except UnicodeEncodeError:
+            return value
+
+    return value
+
+def readSnapshots(path):
+    """ Generate the snapshots in a state log, oldest first.
+
+        Each snapshot is a (label, time, devices, actions) tuple, where
+        devices is a dict of device data keyed by device id and actions is
+        a list of the descriptions of the actions in the queue, in the order
+        they were added to it. Strings are interned, since most of them are
+        repeated from one snapshot to the next.
+    """
+    data = {}
+    queue = OrderedDict()           # action id -> description
+    snapshot = None
+    with open(path) as f:
+        for line in f:
+            record = json.loads(line)
+            if "snapshot" in record:
+                if snapshot:
+                    snapshot[3].extend(queue.values())
+                    yield snapshot
+
+                if record.get("first"):
+                    queue.clear()
+                snapshot = (record["snapshot"], record["time"], {}, [])
+            elif snapshot is None:
+                continue
+            elif "device" in record:
+                device_id = record["device"]
+                if "data" in record:
+                    data[device_id] = _intern(record["data"])
+                snapshot[2][device_id] = data[device_id]
+            elif "action" in record:
+                queue[record["action"]] = _intern(record["data"])
+            elif "done" in record:
+                queue.pop(record["done"], None)
+
+    if snapshot:
+        snapshot[3].extend(queue.values())
+        yield snapshot
+
+def findSnapshot(path, label):
+    """ Return the last snapshot in the log with the given label. """
+    found = None
+    for snapshot in readSnapshots(path):
+        if snapshot[0] == label:
+            found = snapshot
+
+    return found
+
+def _flatten(data, prefix=""):
+    flat = {}
+    for (key, value) in data.items():
+        if isinstance(value, dict):
+            flat.update(_flatten(value, prefix=prefix + key + "."))
+        else:
+            flat[prefix + key] = value
+
+    return flat
+
+def diffSnapshots(old, new):
+    """ Compare two snapshots' devices.
+
+        Return value is an (added, removed, changed) tuple. added and
+        removed are sorted lists of device ids. changed is a dict mapping
+        the id of each device present in both snapshots whose data differs
+        to a dict of {key: (old value, new value)}, where the keys of
+        nested dicts are joined with a ".", as in "format.type".
+    """
+    (oldDevices, newDevices) = (old[2], new[2])
+    added = sorted(set(newDevices) - set(oldDevices))
+    removed = sorted(set(oldDevices) - set(newDevices))
+
+    changed = {}
+    for device_id in set(oldDevices) & set(newDevices):
+        if oldDevices[device_id] == newDevices[device_id]:
+            continue
+
+        before = _flatten(oldDevices[device_id])
+        after = _flatten(newDevices[device_id])
+        changed[device_id] = dict((key, (before.get(key), after.get(key)))
+                                  for key in set(before) | set(after)
+                                  if before.get(key) != after.get(key))
+
+    return (added, removed, changed)
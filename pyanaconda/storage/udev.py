@@ -30,35 +30,88 @@ from pyanaconda.baseudev import *
 import logging
 log = logging.getLogger("storage")
 
-def udev_resolve_devspec(devspec):
-    if not devspec:
-        return None
-
-    import devices as _devices
-    ret = None
-    for dev in udev_get_block_devices():
+class BlockDeviceSnapshot(object):
+    """ The udev data of every block device, indexed by name, uuid, label
+        and symlink.
+    """
+    def __init__(self, devices, seqnum=None):
+        """ Create a BlockDeviceSnapshot instance.
+
+            Arguments:
+
+                devices -- a list of udev info dicts
+
+            Keyword Arguments:
+
+                seqnum -- the kernel uevent seqnum the devices are current for
+        """
+        self.devices = devices
+        self.seqnum = seqnum
+        self.names = {}
+        self.uuids = {}
+        self.labels = {}
+        self.symlinks = {}
+        for dev in devices:
+            self.names.setdefault(udev_device_get_name(dev), dev)
+
+            uuid = udev_device_get_uuid(dev)
+            if uuid is not None:
+                self.uuids.setdefault(uuid, dev)
+
+            label = udev_device_get_label(dev)
+            if label is not None:
+                self.labels.setdefault(label, dev)
+
+            # the last device to have a symlink wins, the way it always has
+            for link in dev.get("symlinks", []):
+                self.symlinks[link] = dev
+
+    def resolveDevspec(self, devspec):
+        """ Return the udev info for the device devspec refers to, or None. """
         if devspec.startswith("LABEL="):
-            if udev_device_get_label(dev) == devspec[6:]:
-                ret = dev
-                break
+            return self.labels.get(devspec[6:])
         elif devspec.startswith("UUID="):
-            if udev_device_get_uuid(dev) == devspec[5:]:
-                ret = dev
-                break
-        elif udev_device_get_name(dev) == _devices.devicePathToName(devspec):
-            ret = dev
-            break
-        else:
-            spec = devspec
-            if not spec.startswith("/dev/"):
-                spec = os.path.normpath("/dev/" + spec)
+            return self.uuids.get(devspec[5:])
 
-            for link in dev["symlinks"]:
-                if spec == link:
-                    ret = dev
-                    break
+        import devices as _devices
+        dev = self.names.get(_devices.devicePathToName(devspec))
+        del _devices
+        if dev:
+            return dev
+
+        spec = devspec
+        if not spec.startswith("/dev/"):
+            spec = os.path.normpath("/dev/" + spec)
+
+        return self.symlinks.get(spec)
+
+_snapshot = None
+
+def udev_get_block_device_snapshot():
+    """ Return a BlockDeviceSnapshot of the system's block devices.
 
-    del _devices
+        The snapshot is only taken again after the kernel has sent another
+        uevent, so looking devices up in it over and over does not cost a
+        udev settle and a walk over all block devices every time.
+    """
+    global _snapshot
+    seqnum = udev_get_uevent_seqnum()
+    if _snapshot and seqnum is not None and seqnum == _snapshot.seqnum:
+        return _snapshot
+
+    udev_wait_for_block_devices()
+
+    # loading scsi_wait_scan sends uevents of its own, so only look at the
+    # seqnum once we are done waiting
+    seqnum = udev_get_uevent_seqnum()
+    _snapshot = BlockDeviceSnapshot(__get_block_devices(), seqnum)
+    return _snapshot
+
+def udev_resolve_devspec(devspec):
+    if not devspec:
+        return None
+
+    ret = udev_get_block_device_snapshot().resolveDevspec(devspec)
     if ret:
         return udev_device_get_name(ret)
 
@@ -69,7 +122,7 @@ def udev_resolve_glob(glob):
     if not glob:
         return ret
 
-    for dev in udev_get_block_devices():
+    for dev in udev_get_block_device_snapshot().devices:
         name = udev_device_get_name(dev)
 
         if fnmatch.fnmatch(name, glob):
@@ -81,13 +134,19 @@ def udev_resolve_glob(glob):
 
     return ret
 
-def udev_get_block_devices():
+def udev_wait_for_block_devices():
     # Wait for scsi adapters to be done with scanning their busses (#583143)
     iutil.execWithRedirect("modprobe", [ "scsi_wait_scan" ],
                                stdout = "/dev/tty5", stderr="/dev/tty5")
     iutil.execWithRedirect("rmmod", [ "scsi_wait_scan" ],
                                stdout = "/dev/tty5", stderr="/dev/tty5")
     udev_settle()
+
+def udev_get_block_devices():
+    udev_wait_for_block_devices()
+    return __get_block_devices()
+
+def __get_block_devices():
     entries = []
     for path in udev_enumerate_block_devices():
         entry = udev_get_block_device(path)
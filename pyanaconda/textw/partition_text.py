@@ -130,7 +130,9 @@ class PartitionTypeWindow:
             if rc == "F2":
                 addDialog = addDriveDialog(anaconda)
                 if addDialog.addDriveDialog(screen) != INSTALL_BACK:
-                    anaconda.storage.reset()
+                    devicetree = anaconda.storage.devicetree
+                    anaconda.storage.reset(
+                        incremental=not devicetree.findActions())
                 continue
 
             if res == TEXT_BACK_CHECK:
@@ -0,0 +1,196 @@
+#
+# timing.py: recording how long things take
+#
+# Copyright (C) 2012  Red Hat, Inc.  All rights reserved.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+""" Timing of nested spans of work.
+
+    Code that is worth timing wraps itself in span() or is decorated with
+    timed(). While no Timeline is active both cost next to nothing. Once
+    startTimeline has been called, every span is recorded along with the
+    span it is nested in, until stopTimeline is called. The Timeline can
+    then write a report per span of a given category and a trace that
+    chrome://tracing can load.
+"""
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+class Span(object):
+    """ A single timed piece of work. """
+    def __init__(self, name, category, parent, thread, args):
+        self.name = name
+        self.category = category
+        self.parent = parent        # the enclosing Span, or None
+        self.thread = thread        # number of the thread that ran it
+        self.args = args
+        self.start = time.time()
+        self.end = None
+
+    @property
+    def duration(self):
+        return (self.end or time.time()) - self.start
+
+class Timeline(object):
+    """ The spans recorded between startTimeline and stopTimeline. """
+    def __init__(self):
+        self.spans = []
+        self._threads = {}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def begin(self, name, category, args):
+        """ Start a span nested in the current thread's innermost span. """
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+
+        with self._lock:
+            thread = self._threads.setdefault(threading.current_thread().ident,
+                                              len(self._threads))
+            span = Span(name, category, stack[-1] if stack else None,
+                        thread, args)
+            self.spans.append(span)
+
+        stack.append(span)
+        return span
+
+    def end(self, span):
+        span.end = time.time()
+        self._local.stack.remove(span)
+
+    def breakdown(self, category):
+        """ Return how the spans of a category spent their time.
+
+            Return value is a list of (span, times, children) tuples, one
+            for each span of the given category, in the order they started.
+            times is a dict of the total duration of the span's immediate
+            children by their category, and children is a list of those
+            children.
+        """
+        children = {}
+        for span in self.spans:
+            if span.parent is not None:
+                children.setdefault(id(span.parent), []).append(span)
+
+        result = []
+        for span in self.spans:
+            if span.category != category:
+                continue
+
+            times = {}
+            for child in children.get(id(span), []):
+                times[child.category] = times.get(child.category, 0) + \
+                                        child.duration
+            result.append((span, times, children.get(id(span), [])))
+
+        return result
+
+    def writeReport(self, path, category, columns):
+        """ Write a tab separated table of a category's spans to path.
+
+            There is one row per span, with its duration, the time its
+            children of each of the given categories took, and the names
+            of those children.
+        """
+        lines = ["\t".join(["name", "seconds"] + columns + ["children"])]
+        for (span, times, children) in self.breakdown(category):
+            row = [span.name, "%.3f" % span.duration]
+            row.extend(["%.3f" % times.get(c, 0) for c in columns])
+            row.append(", ".join(child.name for child in children
+                                 if child.category in columns))
+            lines.append("\t".join(row))
+
+        with open(path, "w") as f:
+            f.write("\n".join(lines) + "\n")
+
+    def writeTrace(self, path):
+        """ Write the spans to path in the Chrome trace event format. """
+        if self.spans:
+            origin = min(span.start for span in self.spans)
+
+        events = []
+        for span in self.spans:
+            events.append({"name": span.name, "cat": span.category,
+                           "ph": "X", "pid": os.getpid(), "tid": span.thread,
+                           "ts": int((span.start - origin) * 1000000),
+                           "dur": int(span.duration * 1000000),
+                           "args": span.args})
+
+        with open(path, "w") as f:
+            json.dump({"traceEvents": events}, f, default=str)
+
+_timeline = None
+
+def startTimeline():
+    """ Start recording spans in a new Timeline and return it. """
+    global _timeline
+    _timeline = Timeline()
+    return _timeline
+
+def stopTimeline():
+    """ Stop recording spans and return the Timeline they were recorded in. """
+    global _timeline
+    (timeline, _timeline) = (_timeline, None)
+    return timeline
+
+@contextmanager
+def span(name, category, **args):
+    """ Record the time the body of a with statement takes. """
+    timeline = _timeline
+    if timeline is None:
+        yield
+        return
+
+    current = timeline.begin(name, category, args)
+    try:
+        yield
+    finally:
+        timeline.end(current)
+
+def timed(category, name=None):
+    """ Decorate a function so that each call to it is recorded as a span.
+
+        name is the name of the spans, the function's name by default. If
+        it is callable, it gets called with the function's arguments and
+        returns the name.
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            timeline = _timeline
+            if timeline is None:
+                return func(*args, **kwargs)
+
+            if callable(name):
+                spanName = name(*args, **kwargs)
+            else:
+                spanName = name or func.__name__
+
+            current = timeline.begin(spanName, category, {})
+            try:
+                return func(*args, **kwargs)
+            finally:
+                timeline.end(current)
+
+        return wrapper
+
+    return decorator
@@ -100,6 +100,77 @@ class Users:
         self.admin = libuser.admin()
         self.rootPassword = { "isCrypted": False, "password": "", "lock": False }
 
+    def _addGroup(self, group_name, **kwargs):
+        """Add a group using the libuser session in self.admin.  Takes the
+           same kwargs as createGroup.  Returns False if the group already
+           exists.
+        """
+        if self.admin.lookupGroupByName(group_name):
+            return False
+
+        groupEnt = self.admin.initGroup(group_name)
+
+        if kwargs.get("gid", -1) >= 0:
+            groupEnt.set(libuser.GIDNUMBER, kwargs["gid"])
+
+        self.admin.addGroup(groupEnt)
+        return True
+
+    def _addUser(self, user_name, **kwargs):
+        """Add a user using the libuser session in self.admin.  Takes the
+           same kwargs as createUser.  Returns False if the user already
+           exists.
+        """
+        root = kwargs.get("root", "/mnt/sysimage")
+
+        if self.admin.lookupUserByName(user_name):
+            return False
+
+        userEnt = self.admin.initUser(user_name)
+        groupEnt = self.admin.initGroup(user_name)
+
+        grpLst = filter(lambda grp: grp,
+                        map(lambda name: self.admin.lookupGroupByName(name), kwargs.get("groups", [])))
+        userEnt.set(libuser.GIDNUMBER, [groupEnt.get(libuser.GIDNUMBER)[0]] +
+                    map(lambda grp: grp.get(libuser.GIDNUMBER)[0], grpLst))
+
+        if kwargs.get("homedir", False):
+            userEnt.set(libuser.HOMEDIRECTORY, kwargs["homedir"])
+        else:
+            iutil.mkdirChain(root+'/home')
+            userEnt.set(libuser.HOMEDIRECTORY, "/home/" + user_name)
+
+        if kwargs.get("shell", False):
+            userEnt.set(libuser.LOGINSHELL, kwargs["shell"])
+
+        if kwargs.get("uid", -1) >= 0:
+            userEnt.set(libuser.UIDNUMBER, kwargs["uid"])
+
+        if kwargs.get("gecos", False):
+            userEnt.set(libuser.GECOS, kwargs["gecos"])
+
+        self.admin.addUser(userEnt, mkmailspool=kwargs.get("mkmailspool", True))
+        self.admin.addGroup(groupEnt)
+
+        if kwargs.get("password", False):
+            if kwargs.get("isCrypted", False):
+                password = kwargs["password"]
+            else:
+                password = cryptPassword(kwargs["password"], algo=kwargs.get("algo", None))
+
+            self.admin.setpassUser(userEnt, password, True)
+
+        if kwargs.get("lock", False):
+            self.admin.lockUser(userEnt)
+
+        # Add the user to all the groups they should be part of.
+        grpLst.append(self.admin.lookupGroupByName(user_name))
+        for grp in grpLst:
+            grp.add(libuser.MEMBERNAME, user_name)
+            self.admin.modifyGroup(grp)
+
+        return True
+
     def createGroup (self, group_name, **kwargs):
         """Create a new user on the system with the given name.  Optional kwargs:
 
@@ -121,15 +192,9 @@ class Users:
             self.admin = libuser.admin()
 
             try:
-                if self.admin.lookupGroupByName(group_name):
+                if not self._addGroup(group_name, **kwargs):
                     os._exit(1)
 
-                groupEnt = self.admin.initGroup(group_name)
-
-                if kwargs.get("gid", -1) >= 0:
-                    groupEnt.set(libuser.GIDNUMBER, kwargs["gid"])
-
-                self.admin.addGroup(groupEnt)
                 os._exit(0)
             except Exception as e:
                 log.critical("Error when creating new group: %s" % str(e))
@@ -181,52 +246,9 @@ class Users:
             self.admin = libuser.admin()
 
             try:
-                if self.admin.lookupUserByName(user_name):
+                if not self._addUser(user_name, **kwargs):
                     os._exit(1)
 
-                userEnt = self.admin.initUser(user_name)
-                groupEnt = self.admin.initGroup(user_name)
-
-                grpLst = filter(lambda grp: grp,
-                                map(lambda name: self.admin.lookupGroupByName(name), kwargs.get("groups", [])))
-                userEnt.set(libuser.GIDNUMBER, [groupEnt.get(libuser.GIDNUMBER)[0]] +
-                            map(lambda grp: grp.get(libuser.GIDNUMBER)[0], grpLst))
-
-                if kwargs.get("homedir", False):
-                    userEnt.set(libuser.HOMEDIRECTORY, kwargs["homedir"])
-                else:
-                    iutil.mkdirChain(root+'/home')
-                    userEnt.set(libuser.HOMEDIRECTORY, "/home/" + user_name)
-
-                if kwargs.get("shell", False):
-                    userEnt.set(libuser.LOGINSHELL, kwargs["shell"])
-
-                if kwargs.get("uid", -1) >= 0:
-                    userEnt.set(libuser.UIDNUMBER, kwargs["uid"])
-
-                if kwargs.get("gecos", False):
-                    userEnt.set(libuser.GECOS, kwargs["gecos"])
-
-                self.admin.addUser(userEnt, mkmailspool=kwargs.get("mkmailspool", True))
-                self.admin.addGroup(groupEnt)
-
-                if kwargs.get("password", False):
-                    if kwargs.get("isCrypted", False):
-                        password = kwargs["password"]
-                    else:
-                        password = cryptPassword(kwargs["password"], algo=kwargs.get("algo", None))
-
-                    self.admin.setpassUser(userEnt, password, True)
-
-                if kwargs.get("lock", False):
-                    self.admin.lockUser(userEnt)
-
-                # Add the user to all the groups they should be part of.
-                grpLst.append(self.admin.lookupGroupByName(user_name))
-                for grp in grpLst:
-                    grp.add(libuser.MEMBERNAME, user_name)
-                    self.admin.modifyGroup(grp)
-
                 os._exit(0)
             except Exception as e:
                 log.critical("Error when creating new user: %s" % str(e))
@@ -243,6 +265,69 @@ class Users:
         else:
             return False
 
+    def createUsersAndGroups(self, groups=None, users=None,
+                             root="/mnt/sysimage"):
+        """Create a batch of groups and then a batch of users on the system,
+           all in one libuser session.
+
+           groups    -- A list of (group_name, kwargs) tuples, where kwargs
+                        are those createGroup takes.
+           users     -- A list of (user_name, kwargs) tuples, where kwargs
+                        are those createUser takes.
+           root      -- The directory of the system to create the new groups
+                        and users in.  Defaults to /mnt/sysimage.
+
+           Returns a (groupResults, userResults) tuple of lists telling for
+           each entry whether it was created.
+        """
+        groups = groups or []
+        users = users or []
+        entries = [(self._addGroup, name, kw) for (name, kw) in groups] + \
+                  [(self._addUser, name, kw) for (name, kw) in users]
+
+        (readfd, writefd) = os.pipe()
+        childpid = os.fork()
+
+        if not childpid:
+            os.close(readfd)
+            if not root in ["","/"]:
+                os.chroot(root)
+                del(os.environ["LIBUSER_CONF"])
+
+            self.admin = libuser.admin()
+
+            # report each entry's result as soon as we have it, so the ones
+            # before a crash still count
+            for (add, name, kwargs) in entries:
+                kwargs = dict(kwargs, root=root)
+                try:
+                    created = add(name, **kwargs)
+                except Exception as e:
+                    log.critical("Error when creating %s: %s" % (name, str(e)))
+                    created = False
+
+                os.write(writefd, created and "1" or "0")
+
+            os._exit(0)
+
+        os.close(writefd)
+        buf = ""
+        while True:
+            data = os.read(readfd, 4096)
+            if not data:
+                break
+            buf += data
+        os.close(readfd)
+
+        try:
+            os.waitpid(childpid, 0)
+        except OSError as e:
+            log.critical("exception from waitpid while creating users: %s %s" % (e.errno, e.strerror))
+
+        results = [c == "1" for c in buf[:len(entries)]]
+        results += [False] * (len(entries) - len(results))
+        return (results[:len(groups)], results[len(groups):])
+
     def checkUserExists(self, username, root="/mnt/sysimage"):
         childpid = os.fork()
 
@@ -310,18 +395,29 @@ class Users:
         self.setRootPassword(algo=self.getPassAlgo())
 
         if self.anaconda.ksdata:
+            groups = []
             for gd in self.anaconda.ksdata.group.groupList:
                 kwargs = gd.__dict__
                 kwargs.update({"root": ROOT_PATH})
-                if not self.createGroup(gd.name, **kwargs):
-                    log.error("Group %s already exists, not creating." % gd.name)
+                groups.append((gd.name, kwargs))
 
+            users = []
             for ud in self.anaconda.ksdata.user.userList:
                 kwargs = ud.__dict__
                 kwargs.update({"algo": self.getPassAlgo(),
                                "root": ROOT_PATH})
-                if not self.createUser(ud.name, **kwargs):
-                    log.error("User %s already exists, not creating." % ud.name)
+                users.append((ud.name, kwargs))
+
+            (groupResults, userResults) = \
+                self.createUsersAndGroups(groups, users, root=ROOT_PATH)
+
+            for ((name, kwargs), created) in zip(groups, groupResults):
+                if not created:
+                    log.error("Group %s already exists, not creating." % name)
+
+            for ((name, kwargs), created) in zip(users, userResults):
+                if not created:
+                    log.error("User %s already exists, not creating." % name)
 
     def writeKS(self, f):
         if self.rootPassword["isCrypted"]:
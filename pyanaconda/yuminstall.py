@@ -31,6 +31,10 @@ import glob
 import tempfile
 import itertools
 import re
+import threading
+import Queue
+import bisect
+import fnmatch
 
 
 import anaconda_log
@@ -50,6 +54,7 @@ from product import isFinal, productName, productVersion, productStamp
 from constants import *
 from image import *
 from compssort import *
+from repocache import RepoCache
 import packages
 
 import gettext
@@ -72,6 +77,9 @@ urlgrabber.grabber.default_grabber.opts.user_agent = "%s (anaconda)/%s" %(produc
 import iutil
 import isys
 
+# characters that make a package name a glob
+_globChars = re.compile(r"[*?[]")
+
 class NoSuchGroup(Exception):
     pass
 
@@ -92,6 +100,152 @@ def size_string (size):
 
     return to_unicode(retval)
 
+# how many packages past the one rpm is installing get downloaded ahead of
+# time, by how many threads, and how many bytes of downloaded packages may
+# be waiting for rpm at once
+PREFETCH_AHEAD = 8
+PREFETCH_THREADS = 2
+PREFETCH_BUDGET = 256 * 1024 * 1024
+
+class PackagePrefetcher(object):
+    """ Download the packages of a transaction before rpm asks for them.
+
+        The packages get downloaded in the order rpm is going to install
+        them, at most ahead packages past the last one rpm asked for, and
+        at most budget bytes of them waiting to be installed at a time.
+        Each download is checked against the package's checksum right
+        away, so all that is left to do when rpm gets to the package is
+        to open the file.
+
+        Packages that fail to download or verify are simply not prefetched.
+        Fetching them again, and asking the user what to do if that fails
+        too, is up to the caller.
+
+        yum's repositories and their grabbers are not safe to use from more
+        than one thread at a time, so downloads are made holding lock, and
+        so must any other use of them while the prefetcher is running. The
+        checksums get verified outside of it.
+    """
+    def __init__(self, ayum, pkgs, ahead=PREFETCH_AHEAD,
+                 threads=PREFETCH_THREADS, budget=PREFETCH_BUDGET):
+        self.ayum = ayum
+        self.pkgs = pkgs
+        self.ahead = ahead
+        self.threads = threads
+        self.budget = budget
+
+        self._index = dict((po.pkgtup, i) for (i, po) in enumerate(pkgs))
+        self._next = 0          # index of the next package to download
+        self._position = 0      # index past the last package rpm asked for
+        self._handedOut = set() # indices of packages rpm has asked for
+        self._results = {}      # index -> local path, None if it failed
+        self._waiting = 0       # bytes being or done downloading but not
+                                # handed out yet
+        self._stopped = False
+        self._cond = threading.Condition()
+        self._workers = []
+        self.lock = threading.Lock()
+
+    def start(self):
+        for i in range(self.threads):
+            worker = threading.Thread(target=self._work,
+                                      name="prefetch-%d" % i)
+            worker.daemon = True
+            worker.start()
+            self._workers.append(worker)
+
+    def stop(self):
+        """ Stop downloading and remove the packages rpm did not ask for. """
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+
+        for worker in self._workers:
+            worker.join()
+
+        for path in self._results.values():
+            if path and path.startswith("%s/var/cache/yum/" % ROOT_PATH):
+                try:
+                    os.unlink(path)
+                except OSError:
+                    pass
+
+        self._results = {}
+
+    def _ready(self):
+        """ Return True if the next package can be downloaded now. """
+        while self._next in self._handedOut:
+            self._next += 1
+
+        if self._next >= len(self.pkgs) or \
+           self._next >= self._position + self.ahead:
+            return False
+
+        size = self.pkgs[self._next].size
+        return not self._waiting or self._waiting + size <= self.budget
+
+    def _work(self):
+        while True:
+            with self._cond:
+                while not self._stopped and not self._ready() and \
+                      self._next < len(self.pkgs):
+                    self._cond.wait()
+
+                if self._stopped or self._next >= len(self.pkgs):
+                    return
+
+                idx = self._next
+                self._next += 1
+                po = self.pkgs[idx]
+                self._waiting += po.size
+
+            path = None
+            try:
+                with self.lock:
+                    path = self.ayum.repos.getRepo(po.repoid).getPackage(po)
+                if not self.ayum.verifyPkg(path, po, False):
+                    log.warning("prefetched package %s is corrupt" % po)
+                    os.unlink(path)
+                    path = None
+            except (YumBaseError, URLGrabError, EnvironmentError) as e:
+                log.warning("failed to prefetch %s: %s" % (po, e))
+                path = None
+
+            with self._cond:
+                self._results[idx] = path
+                if not path:
+                    self._waiting -= po.size
+                self._cond.notify_all()
+
+    def get(self, po):
+        """ Return the local path of po, or None if it was not prefetched.
+
+            This waits for a download that is in progress to finish.
+        """
+        with self._cond:
+            idx = self._index.get(po.pkgtup)
+            if idx is None:
+                return None
+
+            self._position = max(self._position, idx + 1)
+            self._cond.notify_all()
+            if idx in self._handedOut:
+                return None
+
+            self._handedOut.add(idx)
+            if idx >= self._next:
+                # rpm got here before we did, leave this one to the caller
+                return None
+
+            while idx not in self._results and not self._stopped:
+                self._cond.wait()
+
+            path = self._results.pop(idx, None)
+            if path:
+                self._waiting -= po.size
+
+            return path
+
 class AnacondaCallback:
 
     def __init__(self, ayum, anaconda, instLog, modeText):
@@ -116,15 +270,78 @@ class AnacondaCallback:
 
         self.openfile = None
         self.inProgressPo = None
+        self.prefetcher = None
 
-    def setSizes(self, numpkgs, totalSize, totalFiles):
+    def setSizes(self, numpkgs, totalSize):
         self.numpkgs = numpkgs
         self.totalSize = totalSize
-        self.totalFiles = totalFiles
 
         self.donepkgs = 0
         self.doneSize = 0
 
+    def packageObject(self, h):
+        """ Return the package object for a transaction element's key. """
+        # Old-style (hdr, path) callback
+        if isinstance(h, types.TupleType):
+            (hdr, rpmloc) = h
+            # hate hate hate at epochs...
+            epoch = hdr['epoch']
+            if epoch is not None:
+                epoch = str(epoch)
+            txmbrs = self.ayum.tsInfo.matchNaevr(hdr['name'], hdr['arch'],
+                                                 epoch, hdr['version'],
+                                                 hdr['release'])
+            if len(txmbrs) == 0:
+                raise RuntimeError, "Unable to find package %s-%s-%s.%s" %(hdr['name'], hdr['version'], hdr['release'], hdr['arch'])
+            return txmbrs[0].po
+        # New-style callback, h is our txmbr
+        else:
+            return h.po
+
+    def startPrefetch(self):
+        """ Start downloading packages ahead of rpm installing them.
+
+            This has to be called after the transaction has been ordered.
+            Only packages from network repositories get prefetched, the
+            ones on local media are read quickly enough as it is.
+        """
+        pkgs = []
+        for te in self.ayum.ts.ts:
+            if te.Type() != rpm.TR_ADDED:
+                continue
+
+            po = self.packageObject(te.Key())
+            if self.repos.getRepo(po.repoid).needsNetwork():
+                pkgs.append(po)
+
+        if not pkgs:
+            return
+
+        # don't fill up the disk the packages get downloaded to
+        budget = PREFETCH_BUDGET
+        try:
+            st = os.statvfs(self.rootPath)
+            budget = min(budget, st.f_bavail * st.f_frsize / 4)
+        except OSError:
+            pass
+
+        log.info("prefetching %d packages" % len(pkgs))
+        self.prefetcher = PackagePrefetcher(self.ayum, pkgs, budget=budget)
+        self.prefetcher.start()
+
+    def stopPrefetch(self):
+        if self.prefetcher:
+            self.prefetcher.stop()
+            self.prefetcher = None
+
+    def _serialized(self, func, *args):
+        """ Call func, taking turns with the prefetch threads. """
+        if not self.prefetcher:
+            return func(*args)
+
+        with self.prefetcher.lock:
+            return func(*args)
+
     def callback(self, what, amount, total, h, user):
         if what == rpm.RPMCALLBACK_TRANS_START:
             # step 6 is the bulk of the ts processing time
@@ -144,23 +361,7 @@ class AnacondaCallback:
             self.progressWindow.pop()
 
         if what == rpm.RPMCALLBACK_INST_OPEN_FILE:
-            # Old-style (hdr, path) callback
-            if isinstance(h, types.TupleType):
-                (hdr, rpmloc) = h
-                # hate hate hate at epochs...
-                epoch = hdr['epoch']
-                if epoch is not None:
-                    epoch = str(epoch)
-                txmbrs = self.ayum.tsInfo.matchNaevr(hdr['name'], hdr['arch'],
-                                                     epoch, hdr['version'],
-                                                     hdr['release'])
-                if len(txmbrs) == 0:
-                    raise RuntimeError, "Unable to find package %s-%s-%s.%s" %(hdr['name'], hdr['version'], hdr['release'], hdr['arch'])
-                po = txmbrs[0].po
-            # New-style callback, h is our txmbr
-            else:
-                po = h.po
-
+            po = self.packageObject(h)
             repo = self.repos.getRepo(po.repoid)
 
             pkgStr = "%s-%s-%s.%s" % (po.name, po.version, po.release, po.arch)
@@ -181,15 +382,24 @@ class AnacondaCallback:
             self.instLog.flush()
             self.openfile = None
 
+            # if the package was prefetched it has been verified already,
+            # otherwise fetch it now
+            fn = None
+            if self.prefetcher:
+                fn = self.prefetcher.get(po)
+
             while self.openfile is None:
                 try:
-                    fn = repo.getPackage(po)
+                    if fn is None:
+                        fn = self._serialized(repo.getPackage, po)
 
                     f = open(fn, 'r')
                     self.openfile = f
                 except (yum.Errors.NoMoreMirrorsRepoError, IOError):
-                    self.ayum._handleFailure(po)
+                    fn = None
+                    self._serialized(self.ayum._handleFailure, po)
                 except yum.Errors.RepoError:
+                    fn = None
                     continue
             self.inProgressPo = po
 
@@ -221,7 +431,11 @@ class AnacondaCallback:
                                           self.numpkgs)
                                        % {'donepkgs': self.donepkgs,
                                           'numpkgs': self.numpkgs})
-            self.progress.set_fraction(float(self.doneSize / self.totalSize))
+            # without sizes to go by, go by the number of packages
+            if self.totalSize:
+                self.progress.set_fraction(float(self.doneSize / self.totalSize))
+            elif self.numpkgs:
+                self.progress.set_fraction(min(1.0, float(self.donepkgs) / self.numpkgs))
             self.progress.processEvents()
 
             self.inProgressPo = None
@@ -955,8 +1169,11 @@ class AnacondaYum(yum.YumBase):
         if obj.tries == obj.retry:
             return
 
+        # packages are also downloaded on the prefetch threads, which must
+        # not touch the UI
         delay = 0.25*(2**(obj.tries-1))
-        if delay > 1:
+        if delay > 1 and \
+           threading.currentThread().getName() == "MainThread":
             w = self.anaconda.intf.waitWindow(_("Retrying"), _("Retrying download."))
             time.sleep(delay)
             w.pop()
@@ -964,17 +1181,20 @@ class AnacondaYum(yum.YumBase):
             time.sleep(delay)
 
     def getDownloadPkgs(self):
+        """ Return the packages to install and their total installed size.
+
+            Return value is a (packages, size) tuple, size is in kilobytes.
+            Only the primary metadata is consulted; counting files would
+            mean loading the filelists of the whole transaction.
+        """
         downloadpkgs = []
         totalSize = 0
-        totalFiles = 0
         for txmbr in self.tsInfo.getMembersWithState(output_states=TS_INSTALL_STATES):
             if txmbr.po:
                 totalSize += int(txmbr.po.returnSimple("installedsize")) / 1024
-                for filetype in txmbr.po.returnFileTypes():
-                    totalFiles += len(txmbr.po.returnFileEntries(ftype=filetype))
                 downloadpkgs.append(txmbr.po)
 
-        return (downloadpkgs, totalSize, totalFiles)
+        return (downloadpkgs, totalSize)
 
     def setColor(self):
         if rpmUtils.arch.isMultiLibArch():
@@ -1016,8 +1236,12 @@ class AnacondaYum(yum.YumBase):
 
         self.anaconda.bootloader.trusted_boot = self.isPackageInstalled(name="tboot")
 
-        if self._run(instLog, cb, intf) == DISPATCH_BACK:
-            return DISPATCH_BACK
+        cb.startPrefetch()
+        try:
+            if self._run(instLog, cb, intf) == DISPATCH_BACK:
+                return DISPATCH_BACK
+        finally:
+            cb.stopPrefetch()
 
         self.ts.close()
 
@@ -1189,6 +1413,7 @@ class YumBackend(AnacondaBackend):
     def __init__ (self, anaconda):
         AnacondaBackend.__init__(self, anaconda)
         self.supportsPackageSelection = True
+        self.repoCache = None
 
         buf = """
 [main]
@@ -1258,12 +1483,51 @@ reposdir=/etc/anaconda.repos.d,/tmp/updates/anaconda.repos.d,/tmp/product/anacon
                     sys.exit(1)
                 break
 
+        self.repoCache = self._getRepoCache(anaconda)
+
         self.doRepoSetup(anaconda)
         self.doSackSetup(anaconda)
         self.doGroupSetup(anaconda)
 
+        # everything the sack and group setup needed is in the cachedirs now
+        self._storeRepoCache()
+
         self.ayum.doMacros()
 
+    def _storeRepoCache(self):
+        """ Add the metadata in the enabled repos' cachedirs to repoCache. """
+        if not self.repoCache:
+            return
+
+        for repo in self.ayum.repos.listEnabled():
+            self.repoCache.store(repo.id, repo.cachedir)
+
+    def _getRepoCache(self, anaconda):
+        """ Return the RepoCache given by the repocache boot option, or None. """
+        path = flags.repoCache
+        if not path:
+            return None
+
+        if path.startswith("nfs:"):
+            if not network.hasActiveNetDev() and not anaconda.intf.enableNetwork():
+                log.error("no network available for repo cache %s" % path)
+                return None
+
+            dest = tempfile.mkdtemp("", "repocache", "/mnt")
+            try:
+                isys.mount(path[4:], dest, "nfs")
+            except Exception as e:
+                log.error("error mounting repo cache %s: %s" % (path, e))
+                return None
+
+            path = dest
+
+        if not os.path.isdir(path):
+            log.error("repo cache %s is not a directory" % path)
+            return None
+
+        return RepoCache(path)
+
     def doGroupSetup(self, anaconda):
         while True:
             try:
@@ -1288,17 +1552,38 @@ reposdir=/etc/anaconda.repos.d,/tmp/updates/anaconda.repos.d,/tmp/product/anacon
                 continue
 
     def doRepoSetup(self, anaconda, thisrepo = None, fatalerrors = True):
-        self.__withFuncDo(anaconda, lambda r: self.ayum.doRepoSetup(thisrepo=r.id),
+        def setup(repo):
+            self.ayum.doRepoSetup(thisrepo=repo.id)
+            # now that repomd.xml is here, bring in the rest of the metadata
+            # from the cache so the sack setup doesn't have to download it
+            if self.repoCache:
+                self.repoCache.restore(repo.id, repo.cachedir)
+
+        def fetch(repo):
+            # just get repomd.xml, doRepoSetup finds it there afterwards
+            repo.setup(self.ayum.conf.cache, self.ayum.mediagrabber)
+
+        self.__withFuncDo(anaconda, setup, fetch=fetch,
                           thisrepo=thisrepo, fatalerrors=fatalerrors,
                           callback=RepoSetupPulseProgress(anaconda.intf))
 
     def doSackSetup(self, anaconda, thisrepo = None, fatalerrors = True):
+        def fetch(repo):
+            # the metadata doSackSetup and doGroupSetup are going to read
+            fileTypes = repo.repoXML.fileTypes()
+            for mdtypes in (("primary_db", "primary"), ("group_gz", "group")):
+                for mdtype in mdtypes:
+                    if mdtype in fileTypes:
+                        repo.retrieveMD(mdtype)
+                        break
+
         self.__withFuncDo(anaconda, lambda r: self.ayum.doSackSetup(thisrepo=r.id),
+                          fetch=fetch,
                           thisrepo=thisrepo, fatalerrors=fatalerrors,
                           callback=SackSetupProgress(anaconda.intf))
 
     def __withFuncDo(self, anaconda, fn, thisrepo=None, fatalerrors=True,
-                     callback=None):
+                     callback=None, fetch=None):
         # Don't do this if we're being called as a dispatcher step (instead
         # of being called when a repo is added via the UI) and we're going
         # back.
@@ -1312,49 +1597,21 @@ reposdir=/etc/anaconda.repos.d,/tmp/updates/anaconda.repos.d,/tmp/product/anacon
         else:
             repos = self.ayum.repos.listEnabled()
 
-        for repo in repos:
-            if callback:
-                callback.connect(repo)
-
-            while True:
-                try:
-                    fn(repo)
-                    if callback:
-                        callback.disconnect()
-                except RepoError as e:
-                    if callback:
-                        callback.disconnect()
-                    buttons = [_("_Exit installer"), _("Edit"), _("_Retry")]
-                else:
-                    break # success
-
-                if anaconda.ksdata:
-                    buttons.append(_("_Continue"))
+        # fetch only downloads what fn needs into the repo's cachedir, so it
+        # can run for all the network repos at once before fn runs for each
+        # of them here. A repo fetch failed for goes straight to the error
+        # dialog.
+        errors = {}
+        if fetch and thisrepo is None and flags.repoThreads > 1:
+            network = [r for r in repos if r.needsNetwork()]
+            if len(network) > 1:
+                errors = self.__fetchParallel(anaconda, fetch, network)
 
-                if not fatalerrors:
-                    raise RepoError, e
-
-                rc = anaconda.intf.messageWindow(_("Error"),
-                                   _("Unable to read package metadata. This may be "
-                                     "due to a missing repodata directory.  Please "
-                                     "ensure that your install tree has been "
-                                     "correctly generated.\n\n%s" % e),
-                                     type="custom", custom_icon="error",
-                                     custom_buttons=buttons)
-                if rc == 0:
-                    # abort
-                    sys.exit(0)
-                elif rc == 1:
-                    # edit
-                    anaconda.intf.editRepoWindow(repo)
-                    break
-                elif rc == 2:
-                    # retry, but only if button is present
-                    continue
-                else:
-                    # continue, but only if button is present
-                    self.ayum.repos.delete(repo.id)
-                    break
+        for repo in repos:
+            self.__withFuncDoRepo(anaconda, fn, repo,
+                                  fatalerrors=fatalerrors,
+                                  callback=callback,
+                                  error=errors.get(repo.id))
 
             # if we're in kickstart the repo may have been deleted just above
             try:
@@ -1369,6 +1626,97 @@ reposdir=/etc/anaconda.repos.d,/tmp/updates/anaconda.repos.d,/tmp/product/anacon
 
         self.ayum.repos.callback = None
 
+    def __withFuncDoRepo(self, anaconda, fn, repo, fatalerrors=True,
+                         callback=None, error=None):
+        # error is what fetching this repo's metadata already failed with,
+        # if it has been tried before
+        if callback:
+            callback.connect(repo)
+
+        while True:
+            try:
+                if error is not None:
+                    (e, error) = (error, None)
+                    raise e
+
+                fn(repo)
+                if callback:
+                    callback.disconnect()
+            except RepoError as e:
+                if callback:
+                    callback.disconnect()
+                buttons = [_("_Exit installer"), _("Edit"), _("_Retry")]
+            else:
+                break # success
+
+            if anaconda.ksdata:
+                buttons.append(_("_Continue"))
+
+            if not fatalerrors:
+                raise RepoError, e
+
+            rc = anaconda.intf.messageWindow(_("Error"),
+                               _("Unable to read package metadata. This may be "
+                                 "due to a missing repodata directory.  Please "
+                                 "ensure that your install tree has been "
+                                 "correctly generated.\n\n%s" % e),
+                                 type="custom", custom_icon="error",
+                                 custom_buttons=buttons)
+            if rc == 0:
+                # abort
+                sys.exit(0)
+            elif rc == 1:
+                # edit
+                anaconda.intf.editRepoWindow(repo)
+                break
+            elif rc == 2:
+                # retry, but only if button is present
+                continue
+            else:
+                # continue, but only if button is present
+                self.ayum.repos.delete(repo.id)
+                break
+
+    def __fetchParallel(self, anaconda, fetch, repos):
+        """ Call fetch for each of repos, on up to flags.repoThreads threads.
+
+            Return a dict of the RepoError fetch raised for each repo it
+            failed for, keyed by repo id. Any other failure is left for
+            the caller to run into again.
+        """
+        window = anaconda.intf.waitWindow(_("Installation Progress"),
+                                          _("Retrieving installation information."))
+
+        work = Queue.Queue()
+        for repo in repos:
+            work.put(repo)
+
+        errors = {}
+        def worker():
+            while True:
+                try:
+                    repo = work.get_nowait()
+                except Queue.Empty:
+                    return
+
+                try:
+                    fetch(repo)
+                except RepoError as e:
+                    log.error("fetching repo %s failed: %s" % (repo.id, e))
+                    errors[repo.id] = e
+                except Exception as e:
+                    log.error("fetching repo %s failed: %s" % (repo.id, e))
+
+        threads = [threading.Thread(target=worker, name="repo-%d" % i)
+                   for i in range(min(flags.repoThreads, len(repos)))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        window.pop()
+        return errors
+
     def getDefaultGroups(self, anaconda):
         langs = anaconda.instLanguage.getCurrentLangSearchList()
         rc = map(lambda x: x.groupid,
@@ -1557,7 +1905,10 @@ reposdir=/etc/anaconda.repos.d,/tmp/updates/anaconda.repos.d,/tmp/product/anacon
             else:
                 break
 
-        (self.dlpkgs, self.totalSize, self.totalFiles)  = self.ayum.getDownloadPkgs()
+        (self.dlpkgs, self.totalSize) = self.ayum.getDownloadPkgs()
+
+        # depsolving may have fetched the filelists
+        self._storeRepoCache()
 
         if not anaconda.upgrade:
             largePart = anaconda.storage.mountpoints.get("/usr", anaconda.storage.rootDevice)
@@ -1633,7 +1984,7 @@ reposdir=/etc/anaconda.repos.d,/tmp/updates/anaconda.repos.d,/tmp/product/anacon
 
         cb = AnacondaCallback(self.ayum, anaconda,
                               self.instLog, self.modeText)
-        cb.setSizes(len(self.dlpkgs), self.totalSize, self.totalFiles)
+        cb.setSizes(len(self.dlpkgs), self.totalSize)
 
         rc = self.ayum.run(self.instLog, cb, anaconda.intf)
 
@@ -1783,6 +2134,156 @@ reposdir=/etc/anaconda.repos.d,/tmp/updates/anaconda.repos.d,/tmp/product/anacon
             log.debug("no such package %s to remove" %(pkg,))
             return 0
 
+    def _packageIndex(self):
+        """ Return the packages in the sack by name and by name.arch. """
+        index = {}
+        for po in self.ayum.pkgSack.returnPackages():
+            index.setdefault(po.name, []).append(po)
+            index.setdefault("%s.%s" % (po.name, po.arch), []).append(po)
+
+        return index
+
+    def _matchPackages(self, index, patterns):
+        """ Match names, name.archs and globs of them against a package index.
+
+            Return a (matches, unmatched) tuple, where matches is a dict of
+            the packages each matching pattern matched and unmatched is a
+            list of the other patterns.
+        """
+        keys = None
+        matches = {}
+        unmatched = []
+        for pattern in patterns:
+            if pattern in index:
+                matches[pattern] = index[pattern]
+                continue
+            elif not _globChars.search(pattern):
+                unmatched.append(pattern)
+                continue
+
+            # only the keys that start with the part of the glob before the
+            # first wildcard can match it
+            if keys is None:
+                keys = sorted(index)
+            prefix = _globChars.split(pattern, 1)[0]
+            regex = re.compile(fnmatch.translate(pattern))
+
+            found = {}
+            for i in xrange(bisect.bisect_left(keys, prefix), len(keys)):
+                if not keys[i].startswith(prefix):
+                    break
+                if regex.match(keys[i]):
+                    for po in index[keys[i]]:
+                        found[po.pkgtup] = po
+
+            if found:
+                matches[pattern] = found.values()
+            else:
+                unmatched.append(pattern)
+
+        return (matches, unmatched)
+
+    def _groupIndex(self):
+        """ Return the ids of the groups by translated name, name and id. """
+        index = {}
+        for g in self.ayum.comps.groups:
+            for trans in g.translated_name.values():
+                index[trans] = g.groupid
+        for g in self.ayum.comps.groups:
+            index[g.name] = g.groupid
+        for g in self.ayum.comps.groups:
+            index[g.groupid] = g.groupid
+
+        return index
+
+    def selectPackages(self, packages, groups, excludedPackages=[],
+                       excludedGroups=[]):
+        """ Select and exclude lists of packages and groups all at once.
+
+            packages and excludedPackages are lists of package names,
+            name.archs or globs of them, which are looked up in an index of
+            the sack built once for all of them. Anything else yum
+            understands, like provides, is looked up one at a time.
+
+            groups is a list of (group, (default, optional)) tuples and
+            excludedGroups a list of groups, by id, name or translated name.
+
+            Return a (missingPackages, missingGroups) tuple of the entries
+            that matched nothing.
+        """
+        index = self._packageIndex()
+
+        missingPackages = []
+        (matches, unmatched) = self._matchPackages(index, packages)
+        for pattern in packages:
+            if pattern not in matches:
+                if not self.selectPackage(pattern):
+                    missingPackages.append(pattern)
+                continue
+
+            byName = {}
+            for po in matches[pattern]:
+                byName.setdefault(po.name, []).append(po)
+
+            for (name, pkgs) in byName.items():
+                # like yum, leave a name that is already in the transaction
+                # alone, but a name.arch only asks for its arch
+                if fnmatch.fnmatchcase(name, pattern):
+                    if self.ayum.tsInfo.matchNaevr(name=name):
+                        continue
+                else:
+                    pkgs = [po for po in pkgs if not
+                            self.ayum.tsInfo.matchNaevr(name=name,
+                                                        arch=po.arch)]
+                    if not pkgs:
+                        continue
+
+                pkgs = yum.packageSack.packagesNewestByName(pkgs)
+                for po in self.ayum.bestPackagesFromList(pkgs):
+                    self.ayum.install(po=po)
+
+        groupIndex = self._groupIndex()
+
+        missingGroups = []
+        for (group, (default, optional)) in groups:
+            if group not in groupIndex:
+                # leave anything else, eg. a different case, to yum
+                try:
+                    self.selectGroup(group, (default, optional))
+                except NoSuchGroup:
+                    missingGroups.append(group)
+                continue
+
+            types = ["mandatory"]
+            if default:
+                types.append("default")
+            if optional:
+                types.append("optional")
+
+            self.ayum.selectGroup(groupIndex[group], group_package_types=types)
+
+        # remove all the excluded packages in one go, including from the
+        # conditionals so that they don't get pulled back in by them
+        (matches, unmatched) = self._matchPackages(index, excludedPackages)
+        excluded = set(po.pkgtup for pkgs in matches.values() for po in pkgs)
+        if excluded:
+            for pkgtup in excluded:
+                self.ayum.tsInfo.remove(pkgtup)
+
+            for (req, pkgs) in self.ayum.tsInfo.conditionals.items():
+                self.ayum.tsInfo.conditionals[req] = \
+                    [po for po in pkgs if po.pkgtup not in excluded]
+
+        map(self.deselectPackage, unmatched)
+
+        for group in excludedGroups:
+            if group in groupIndex:
+                self.ayum.deselectGroup(groupIndex[group], force=True)
+            else:
+                self.deselectGroup(group)
+
+        return (missingPackages, missingGroups)
+
     def groupListExists(self, grps):
         """Returns bool of whether all of the given groups exist."""
         for gid in grps:
@@ -0,0 +1,82 @@
+#!/usr/bin/python
+
+import mock
+import inspect
+import logging
+
+class RecordingHandler(logging.Handler):
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+class Formatted(object):
+    def __init__(self):
+        self.count = 0
+
+    def __str__(self):
+        self.count += 1
+        return "formatted"
+
+class AnacondaLogTest(mock.TestCase):
+
+    def setUp(self):
+        self.setupModules(["_isys", "block"])
+
+        import pyanaconda.anaconda_log
+        self.handler = RecordingHandler()
+        self.logger = logging.getLogger("storage")
+        self.logger.addHandler(self.handler)
+        self.level = self.logger.level
+        self.logger.setLevel(logging.DEBUG)
+
+    def tearDown(self):
+        import pyanaconda.anaconda_log
+        pyanaconda.anaconda_log.set_method_tracing(True)
+        self.logger.removeHandler(self.handler)
+        self.logger.setLevel(self.level)
+        self.tearDownModules()
+
+    def method(self, *args, **kwargs):
+        import pyanaconda.anaconda_log
+        pyanaconda.anaconda_log.log_method_call(self, *args, **kwargs)
+        pyanaconda.anaconda_log.log_method_return(self, "ret")
+        return len(inspect.stack())
+
+    def function_name_and_depth_test(self):
+        import pyanaconda.anaconda_log
+        def caller():
+            return (pyanaconda.anaconda_log.function_name_and_depth(),
+                    len(inspect.stack()))
+
+        ((name, depth), expected) = caller()
+        self.assertEqual(name, "caller")
+        self.assertEqual(depth, expected)
+
+    def log_method_call_test(self):
+        depth = self.method(1, key=2)
+        spaces = depth * " "
+        self.assertEqual(self.handler.messages,
+                         [spaces + "AnacondaLogTest.method: 1 ; key: 2 ;",
+                          spaces + "AnacondaLogTest.method returned ret"])
+
+    def log_method_call_lazy_test(self):
+        import pyanaconda.anaconda_log
+        arg = Formatted()
+        self.logger.setLevel(logging.INFO)
+        self.method(arg)
+        self.assertEqual(self.handler.messages, [])
+        self.assertEqual(arg.count, 0)
+
+        self.logger.setLevel(logging.DEBUG)
+        pyanaconda.anaconda_log.set_method_tracing(False)
+        self.method(arg)
+        self.assertEqual(self.handler.messages, [])
+        self.assertEqual(arg.count, 0)
+
+        pyanaconda.anaconda_log.set_method_tracing(True)
+        self.method(arg)
+        self.assertEqual(len(self.handler.messages), 2)
+        self.assertTrue(arg.count > 0)
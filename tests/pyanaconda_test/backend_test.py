@@ -151,6 +151,14 @@ class BackendTest(mock.TestCase):
         ab.deselectPackage(PKG)
         self.assertTrue(self.logger.warning.called)
 
+    def anaconda_backend_select_packages_test(self):
+        import pyanaconda.backend
+        anaconda = mock.Mock()
+        ab = pyanaconda.backend.AnacondaBackend(anaconda)
+        self.assertEqual(ab.selectPackages(["bash"], [("core", (True, False))]),
+                         ([], []))
+        self.assertTrue(self.logger.warning.called)
+
     def anaconda_backend_get_default_groups_test(self):
         import pyanaconda.backend
         anaconda = mock.Mock()
@@ -132,6 +132,33 @@ class BaseudevTest(mock.TestCase):
         pyanaconda.baseudev.udev_settle()
         self.assertTrue(pyanaconda.baseudev.iutil.execWithRedirect.called)
 
+    def udev_settle_coalesce_test(self):
+        import pyanaconda.baseudev
+        pyanaconda.baseudev.iutil = mock.Mock()
+        pyanaconda.baseudev.iutil.execWithRedirect.return_value = 0
+        self.fs.open('/sys/kernel/uevent_seqnum', 'w').write("1234\n")
+        (calls, skipped, seconds) = pyanaconda.baseudev.udev_settle_stats()
+
+        # no uevents since the last settle means nothing to wait for
+        pyanaconda.baseudev.udev_settle()
+        pyanaconda.baseudev.udev_settle()
+        self.assertEqual(pyanaconda.baseudev.iutil.execWithRedirect.call_count, 1)
+
+        self.fs.open('/sys/kernel/uevent_seqnum', 'w').write("1236\n")
+        pyanaconda.baseudev.udev_settle()
+        self.assertEqual(pyanaconda.baseudev.iutil.execWithRedirect.call_count, 2)
+
+        # a settle that timed out does not count
+        pyanaconda.baseudev.iutil.execWithRedirect.return_value = 1
+        self.fs.open('/sys/kernel/uevent_seqnum', 'w').write("1240\n")
+        pyanaconda.baseudev.udev_settle()
+        pyanaconda.baseudev.udev_settle()
+        self.assertEqual(pyanaconda.baseudev.iutil.execWithRedirect.call_count, 4)
+
+        stats = pyanaconda.baseudev.udev_settle_stats()
+        self.assertEqual(stats[:2], (calls + 5, skipped + 1))
+        self.assertTrue(stats[2] >= seconds)
+
     def udev_trigger_test(self):
         import pyanaconda.baseudev
         pyanaconda.baseudev.iutil = mock.Mock()
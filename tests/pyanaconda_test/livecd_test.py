@@ -0,0 +1,259 @@
+#!/usr/bin/python
+
+import mock
+import os
+import shutil
+import tempfile
+
+class LiveCDTest(mock.TestCase):
+
+    def setUp(self):
+        self.setupModules(["_isys", "block", "selinux", "ConfigParser",
+                           "pyanaconda.storage", "pyanaconda.backend",
+                           "pyanaconda.packages"])
+
+        import sys
+        sys.modules["pyanaconda.backend"].AnacondaBackend = object
+
+        import pyanaconda.livecd
+        pyanaconda.livecd.log = mock.Mock()
+
+        self.fds = []
+        self.tmp = tempfile.mkdtemp()
+        self.src = os.path.join(self.tmp, "src")
+        self.dst = os.path.join(self.tmp, "dst")
+        for d in ["a/b/c", "d", "e"]:
+            os.makedirs(os.path.join(self.src, d))
+
+        open(os.path.join(self.src, "a/file"), "w").write("contents\n")
+        os.link(os.path.join(self.src, "a/file"),
+                os.path.join(self.src, "d/link"))
+        os.symlink("../a/file", os.path.join(self.src, "e/symlink"))
+        with open(os.path.join(self.src, "a/b/c/sparse"), "w") as f:
+            f.seek(1024 * 1024)
+            f.write("end")
+            f.truncate(4 * 1024 * 1024)
+        os.chmod(os.path.join(self.src, "a/b"), 0700)
+        os.utime(os.path.join(self.src, "a"), (1000000000, 1000000000))
+
+    def tearDown(self):
+        for fd in self.fds:
+            os.close(fd)
+        shutil.rmtree(self.tmp)
+        self.tearDownModules()
+
+    def copytree_test(self):
+        import pyanaconda.livecd
+        # an existing destination is fine
+        os.makedirs(os.path.join(self.dst, "a"))
+        refreshes = []
+        pyanaconda.livecd.copytree(self.src, self.dst, symlinks=True,
+                                   threads=3, callback=refreshes.append)
+
+        dst = lambda path: os.path.join(self.dst, path)
+        self.assertEqual(open(dst("d/link")).read(), "contents\n")
+        self.assertTrue(os.path.samefile(dst("a/file"), dst("d/link")))
+        self.assertEqual(os.readlink(dst("e/symlink")), "../a/file")
+
+        st = os.stat(dst("a/b/c/sparse"))
+        self.assertEqual(st.st_size, 4 * 1024 * 1024)
+        self.assertTrue(st.st_blocks * 512 < st.st_size)
+        with open(dst("a/b/c/sparse")) as f:
+            f.seek(1024 * 1024)
+            self.assertEqual(f.read(3), "end")
+
+        # the directories' metadata gets set after their content is copied
+        self.assertEqual(os.stat(dst("a/b")).st_mode & 0777, 0700)
+        self.assertEqual(os.stat(dst("a")).st_mtime, 1000000000)
+
+    def tree_size_test(self):
+        import pyanaconda.livecd
+        # the hard link and the symlink do not count
+        self.assertEqual(pyanaconda.livecd.treeSize(self.src),
+                         len("contents\n") + 4 * 1024 * 1024)
+
+    def copytree_errors_test(self):
+        import pyanaconda.livecd
+        os.mkfifo(os.path.join(self.src, "d/fifo"))
+        try:
+            pyanaconda.livecd.copytree(self.src, self.dst)
+        except pyanaconda.livecd.Error as e:
+            errors = e.args[0]
+        else:
+            self.fail("copying a fifo did not fail")
+
+        self.assertEqual([err[0] for err in errors],
+                         [os.path.join(self.src, "d/fifo")])
+
+        # without symlinks=True the symlink's target gets copied
+        self.assertEqual(open(os.path.join(self.dst, "e/symlink")).read(),
+                         "contents\n")
+        self.assertRaises(OSError, pyanaconda.livecd.copytree,
+                          os.path.join(self.src, "nonexistent"), self.dst)
+
+    def copytree_links_test(self):
+        import pyanaconda.livecd
+        copier = pyanaconda.livecd.TreeCopier(threads=3)
+        copyData = copier._copyData
+        failed = []
+        def _copyData(src, dst, st):
+            if st.st_nlink > 1 and not failed:
+                failed.append(src)
+                raise IOError(5, "Input/output error")
+            return copyData(src, dst, st)
+
+        copier._copyData = _copyData
+        try:
+            copier.copy(self.src, self.dst)
+        except pyanaconda.livecd.Error as e:
+            errors = e.args[0]
+        else:
+            self.fail("failing to copy did not fail")
+
+        # the other links are not linked to the failed copy
+        self.assertEqual([err[0] for err in errors], failed)
+        others = [os.path.join(self.dst, p)
+                  for p in ["a/file", "d/link", "e/symlink"]
+                  if os.path.join(self.src, p) not in failed]
+        self.assertEqual(len(others), 2)
+        self.assertEqual(open(others[0]).read(), "contents\n")
+        self.assertTrue(os.path.samefile(others[0], others[1]))
+
+    def failing(self, calls, err):
+        """ Return a copy_file_range or sendfile that fails with err. """
+        import ctypes
+        def fail(*args):
+            calls.append(args)
+            ctypes.set_errno(err)
+            return -1
+        return fail
+
+    def kernel_copy_test(self):
+        import errno
+        import pyanaconda.livecd
+        if not pyanaconda.livecd._sendfile:
+            return
+
+        # copy_file_range cannot copy across filesystems on older kernels
+        ranges = []
+        sendfile = pyanaconda.livecd._sendfile
+        sent = []
+        def recordingSendfile(*args):
+            sent.append(args)
+            return sendfile(*args)
+
+        pyanaconda.livecd._copy_file_range = self.failing(ranges, errno.EXDEV)
+        pyanaconda.livecd._sendfile = recordingSendfile
+        pyanaconda.livecd.copytree(self.src, self.dst)
+        self.assertEqual(open(os.path.join(self.dst, "a/file")).read(),
+                         "contents\n")
+        # only a/file is copied; the sparse file is read for its holes
+        self.assertEqual(len(ranges), 1)
+        self.assertEqual(len(sent), 2)
+
+        # without either, the data is read and written
+        shutil.rmtree(self.dst)
+        pyanaconda.livecd._sendfile = self.failing(sent, errno.EINVAL)
+        pyanaconda.livecd.copytree(self.src, self.dst)
+        self.assertEqual(open(os.path.join(self.dst, "d/link")).read(),
+                         "contents\n")
+        self.assertEqual(len(ranges), 2)
+        self.assertEqual(len(sent), 3)
+
+        # any other error is one
+        pyanaconda.livecd._sendfile = self.failing(sent, errno.EIO)
+        self.assertRaises(pyanaconda.livecd.Error, pyanaconda.livecd.copytree,
+                          self.src, os.path.join(self.tmp, "other"))
+
+    def copyImage(self, chunks):
+        import pyanaconda.livecd
+        src = os.path.join(self.tmp, "image")
+        with open(src, "w") as f:
+            f.write("".join(chunks))
+
+        dst = os.path.join(self.tmp, "target")
+        open(dst, "w").close()
+        srcfd = os.open(src, os.O_RDONLY)
+        dstfd = os.open(dst, os.O_WRONLY)
+        self.fds.extend([srcfd, dstfd])
+        copier = pyanaconda.livecd.ImageCopier(srcfd, dstfd, chunkSize=4096,
+                                               syncInterval=3 * 4096)
+        return (copier, src, dst)
+
+    def image_copier_test(self):
+        chunks = ["a" * 4096] + ["\0" * 4096] * 8 + ["b" * 4096] + ["\0" * 4]
+        (copier, src, dst) = self.copyImage(chunks)
+        offsets = []
+        copier.copy(callback=offsets.append)
+
+        self.assertEqual(open(dst).read(), open(src).read())
+        self.assertEqual(offsets, range(4096, 10 * 4096 + 1, 4096) + [40964])
+        self.assertEqual(copier.synced, 40964)
+        self.assertTrue(os.stat(dst).st_blocks < os.stat(src).st_blocks)
+
+    def image_copier_resume_test(self):
+        import pyanaconda.livecd
+        chunks = [chr(ord("a") + i) * 4096 for i in range(10)]
+        (copier, src, dst) = self.copyImage(chunks)
+
+        writes = []
+        write = os.write
+        def failingWrite(fd, data):
+            writes.append(len(data))
+            if len(writes) == 5:
+                raise OSError(5, "Input/output error")
+            return write(fd, data)
+
+        pyanaconda.livecd.os.write = failingWrite
+        try:
+            self.assertRaises(OSError, copier.copy)
+            self.assertEqual(copier.synced, 3 * 4096)
+
+            # the retry picks up where the last sync left off
+            copier.copy()
+        finally:
+            pyanaconda.livecd.os.write = write
+
+        self.assertEqual(len(writes), 5 + 7)
+        self.assertEqual(open(dst).read(), open(src).read())
+
+    def image_copier_kernel_test(self):
+        import errno
+        import pyanaconda.livecd
+        if not pyanaconda.livecd._sendfile:
+            return
+
+        # a block device target gets no holes, so the kernel copies
+        chunks = [chr(ord("a") + i) * 4096 for i in range(10)] + ["k" * 4]
+        (copier, src, dst) = self.copyImage(chunks)
+        copier.sparse = False
+        ranges = []
+        sendfile = pyanaconda.livecd._sendfile
+        def failingSendfile(*args):
+            ranges.append(args)
+            if len(ranges) == 5:
+                return self.failing([], errno.EIO)(*args)
+            return sendfile(*args)
+
+        pyanaconda.livecd._copy_file_range = self.failing([], errno.EXDEV)
+        pyanaconda.livecd._sendfile = failingSendfile
+        offsets = []
+        self.assertRaises(OSError, copier.copy, callback=offsets.append)
+        self.assertEqual(offsets, [4096, 8192, 12288, 16384])
+        self.assertEqual(copier.synced, 3 * 4096)
+
+        # the retry picks up where the last sync left off
+        copier.copy(callback=offsets.append)
+        self.assertEqual(offsets[4:], range(16384, 10 * 4096 + 1, 4096) +
+                                      [40964])
+        self.assertEqual(len(ranges), 5 + 9)
+        self.assertEqual(copier.synced, 40964)
+        self.assertEqual(open(dst).read(), open(src).read())
+
+        # without either, the image is read and written
+        pyanaconda.livecd._sendfile = self.failing(ranges, errno.EINVAL)
+        os.ftruncate(copier.dstfd, 0)
+        copier.offset = copier.synced = 0
+        copier.copy()
+        self.assertEqual(len(ranges), 5 + 9 + 1)
+        self.assertEqual(open(dst).read(), open(src).read())
@@ -0,0 +1,71 @@
+#!/usr/bin/python
+
+import mock
+import os
+import shutil
+import tempfile
+
+class RelabelTest(mock.TestCase):
+
+    def setUp(self):
+        self.setupModules(["selinux"])
+        self.root = tempfile.mkdtemp()
+        for d in ["etc/lvm/backup", "var/lib/rpm"]:
+            os.makedirs(os.path.join(self.root, d))
+        for f in ["etc/lvm/lvm.conf", "etc/lvm/backup/vg", "var/lib/rpm/Packages"]:
+            open(os.path.join(self.root, f), "w").close()
+        os.symlink("/etc", os.path.join(self.root, "etc/lvm/link"))
+
+        # every file starts out with the right context except for lvm.conf
+        self.contexts = {}
+        def lookup(handle, path, mode):
+            return (0, "ctx:%s" % path)
+
+        def getcon(path):
+            if path.endswith("lvm.conf"):
+                return (0, "wrong")
+            return (0, "ctx:%s" % path[len(self.root):])
+
+        def setcon(path, con):
+            self.contexts[path[len(self.root):]] = con
+            return 0
+
+        import selinux
+        selinux.selabel_lookup.side_effect = lookup
+        selinux.lgetfilecon.side_effect = getcon
+        selinux.lsetfilecon.side_effect = setcon
+
+        import pyanaconda.relabel
+        pyanaconda.relabel.log = mock.Mock()
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+        self.tearDownModules()
+
+    def relabel_tree_test(self):
+        import pyanaconda.relabel
+        relabeler = pyanaconda.relabel.Relabeler(self.root)
+        relabeler.relabelTree(os.path.join(self.root, "etc/lvm"))
+        relabeler.relabelTree(os.path.join(self.root, "nonexistent"))
+        relabeler.close()
+
+        # etc/lvm, lvm.conf, backup, backup/vg and the link itself
+        self.assertEqual(relabeler.checked, 5)
+        self.assertEqual(relabeler.relabeled, 1)
+        self.assertEqual(self.contexts, {"/etc/lvm/lvm.conf":
+                                         "ctx:/etc/lvm/lvm.conf"})
+
+    def relabel_everything_test(self):
+        import pyanaconda.relabel
+        import selinux
+        selinux.lgetfilecon.side_effect = OSError("no context")
+
+        relabeler = pyanaconda.relabel.Relabeler(self.root + "/")
+        relabeler.relabelTree(os.path.join(self.root, "var/lib"))
+        relabeler.relabel(os.path.join(self.root, "etc/lvm/lvm.conf"))
+        self.assertEqual(relabeler.relabeled, 4)
+        self.assertEqual(sorted(self.contexts),
+                         ["/etc/lvm/lvm.conf", "/var/lib", "/var/lib/rpm",
+                          "/var/lib/rpm/Packages"])
+        self.assertTrue(selinux.selabel_open.called)
+        self.assertFalse(selinux.matchpathcon.called)
@@ -0,0 +1,118 @@
+#!/usr/bin/python
+
+import mock
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+class RepoCacheTest(mock.TestCase):
+
+    def setUp(self):
+        self.setupModules([])
+        self.tmp = tempfile.mkdtemp()
+        self.cache = os.path.join(self.tmp, "cache")
+        os.mkdir(self.cache)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+        self.tearDownModules()
+
+    def _cachedir(self, name, files):
+        cachedir = os.path.join(self.tmp, name)
+        for (path, data) in files.items():
+            path = os.path.join(cachedir, path)
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            open(path, "w").write(data)
+
+        return cachedir
+
+    def _files(self, cachedir):
+        return sorted(os.path.relpath(os.path.join(d, f), cachedir)
+                      for (d, dirs, files) in os.walk(cachedir)
+                      for f in files)
+
+    def store_restore_test(self):
+        from pyanaconda.repocache import RepoCache
+        cache = RepoCache(self.cache)
+        first = self._cachedir("first", {"repomd.xml": "<repomd/>",
+                                         "abc-primary.sqlite": "primary",
+                                         "gen/comps.xml": "comps",
+                                         "cachecookie": "",
+                                         "packages/foo.rpm": "foo"})
+        self.assertTrue(cache.store("base", first))
+        self.assertTrue(cache.store("base", first))
+        self.assertEqual(len(os.listdir(self.cache)), 1)
+
+        # a repo with the same repomd.xml gets everything but the cookie and
+        # packages, and keeps what it already has
+        second = self._cachedir("second", {"repomd.xml": "<repomd/>",
+                                           "abc-primary.sqlite": "mine"})
+        self.assertTrue(cache.restore("base", second))
+        self.assertEqual(self._files(second),
+                         ["abc-primary.sqlite", "gen/comps.xml", "repomd.xml"])
+        self.assertEqual(open(os.path.join(second, "gen/comps.xml")).read(),
+                         "comps")
+        self.assertEqual(open(os.path.join(second, "abc-primary.sqlite")).read(),
+                         "mine")
+
+        other = self._cachedir("other", {"repomd.xml": "<repomd rev='2'/>"})
+        self.assertFalse(cache.restore("base", other))
+        self.assertEqual(self._files(other), ["repomd.xml"])
+        self.assertFalse(cache.restore("base", os.path.join(self.tmp, "none")))
+
+    def damaged_test(self):
+        from pyanaconda.repocache import RepoCache
+        cache = RepoCache(self.cache)
+        first = self._cachedir("first", {"repomd.xml": "<repomd/>",
+                                         "abc-primary.sqlite": "primary"})
+        cache.store("base", first)
+        entry = os.path.join(self.cache, cache.key(first))
+
+        open(os.path.join(entry, "abc-primary.sqlite"), "w").write("primarx")
+        second = self._cachedir("second", {"repomd.xml": "<repomd/>"})
+        self.assertFalse(cache.restore("base", second))
+        self.assertEqual(self._files(second), ["repomd.xml"])
+
+        # nothing outside of the entry gets copied either
+        open(os.path.join(self.tmp, "escaped"), "w").write("x")
+        manifest = {"../../escaped": [1, hashlib.sha256("x").hexdigest()]}
+        json.dump(manifest, open(os.path.join(entry, "MANIFEST"), "w"))
+        self.assertFalse(cache.restore("base", second))
+        self.assertEqual(self._files(second), ["repomd.xml"])
+
+        os.unlink(os.path.join(entry, "MANIFEST"))
+        self.assertFalse(cache.restore("base", second))
+        self.assertEqual(self._files(second), ["repomd.xml"])
+
+    def merge_test(self):
+        from pyanaconda.repocache import RepoCache
+        cache = RepoCache(self.cache)
+        first = self._cachedir("first", {"repomd.xml": "<repomd/>",
+                                         "abc-primary.sqlite": "primary"})
+        self.assertTrue(cache.store("base", first))
+
+        # depsolving fetched the filelists after the entry was written
+        open(os.path.join(first, "def-filelists.sqlite"), "w").write("files")
+        self.assertTrue(cache.store("base", first))
+        entry = os.path.join(self.cache, cache.key(first))
+        self.assertEqual(sorted(os.listdir(entry)),
+                         ["MANIFEST", "abc-primary.sqlite",
+                          "def-filelists.sqlite", "repomd.xml"])
+
+        second = self._cachedir("second", {"repomd.xml": "<repomd/>"})
+        self.assertTrue(cache.restore("base", second))
+        self.assertEqual(self._files(second),
+                         ["abc-primary.sqlite", "def-filelists.sqlite",
+                          "repomd.xml"])
+        self.assertEqual(open(os.path.join(second,
+                                           "def-filelists.sqlite")).read(),
+                         "files")
+
+        # what is already there is not copied again
+        open(os.path.join(first, "abc-primary.sqlite"), "w").write("other")
+        self.assertTrue(cache.store("base", first))
+        self.assertEqual(open(os.path.join(entry, "abc-primary.sqlite")).read(),
+                         "primary")
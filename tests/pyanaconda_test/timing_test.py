@@ -0,0 +1,82 @@
+#!/usr/bin/python
+
+import mock
+import json
+import os
+import tempfile
+import threading
+
+class TimingTest(mock.TestCase):
+
+    def setUp(self):
+        self.setupModules([])
+        (fd, self.path) = tempfile.mkstemp()
+        os.close(fd)
+
+    def tearDown(self):
+        from pyanaconda.timing import stopTimeline
+        stopTimeline()
+        os.unlink(self.path)
+        self.tearDownModules()
+
+    def inactive_test(self):
+        from pyanaconda.timing import span, timed, startTimeline, stopTimeline
+        @timed("exec")
+        def run(command):
+            return command
+
+        with span("nothing", "action"):
+            self.assertEqual(run("ls"), "ls")
+
+        timeline = startTimeline()
+        self.assertEqual(run("ls"), "ls")
+        self.assertIs(stopTimeline(), timeline)
+        self.assertEqual([s.name for s in timeline.spans], ["run"])
+        self.assertEqual(stopTimeline(), None)
+
+    def report_test(self):
+        from pyanaconda.timing import span, timed, startTimeline, stopTimeline
+        @timed("exec", name=lambda command, argv: command)
+        def run(command, argv):
+            if command == "false":
+                raise RuntimeError("failed")
+
+        timeline = startTimeline()
+        with span("create sda1", "action"):
+            run("mkfs", ["-t", "ext4"])
+            with span("udev_settle", "udev"):
+                run("udevadm", ["settle"])
+
+        with span("create sda2", "action"):
+            self.assertRaises(RuntimeError, run, "false", [])
+
+        # spans in other threads are not nested in this thread's spans
+        with span("create sda3", "action"):
+            thread = threading.Thread(target=run, args=("mdadm", []))
+            thread.start()
+            thread.join()
+        stopTimeline()
+
+        self.assertTrue(all(s.end is not None for s in timeline.spans))
+        breakdown = timeline.breakdown("action")
+        self.assertEqual([(s.name, sorted(times), [c.name for c in children])
+                          for (s, times, children) in breakdown],
+                         [("create sda1", ["exec", "udev"],
+                           ["mkfs", "udev_settle"]),
+                          ("create sda2", ["exec"], ["false"]),
+                          ("create sda3", [], [])])
+
+        timeline.writeReport(self.path, "action", ["exec", "udev"])
+        rows = [line.split("\t") for line in open(self.path).read().splitlines()]
+        self.assertEqual(rows[0], ["name", "seconds", "exec", "udev",
+                                   "children"])
+        self.assertEqual([row[0] for row in rows[1:]],
+                         ["create sda1", "create sda2", "create sda3"])
+        self.assertEqual(rows[1][4], "mkfs, udev_settle")
+
+        timeline.writeTrace(self.path)
+        events = json.load(open(self.path))["traceEvents"]
+        self.assertEqual(len(events), 8)
+        self.assertEqual(set(e["ph"] for e in events), set(["X"]))
+        self.assertEqual(sorted(set(e["tid"] for e in events)), [0, 1])
+        self.assertEqual(min(e["ts"] for e in events), 0)
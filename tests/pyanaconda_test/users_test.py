@@ -102,6 +102,39 @@ class UsersTest(mock.TestCase):
         self.assertEqual(pyanaconda.users.libuser.admin().initGroup().method_calls,
             [('get', (GIDNUMBER,), {})])
 
+    def create_users_and_groups_test(self):
+        import pyanaconda.users
+        os = pyanaconda.users.os
+        admin = pyanaconda.users.libuser.admin()
+
+        def lookupGroupByName(name):
+            if name == "broken":
+                raise Exception("cannot look up %s" % name)
+            elif name in ["wheel", "alice"]:
+                group = mock.Mock()
+                group.get.return_value = [10]
+                return group
+            return None
+
+        admin.lookupGroupByName.side_effect = lookupGroupByName
+        admin.lookupUserByName.side_effect = lambda name: name == "bob"
+
+        written = []
+        os.pipe.return_value = (3, 4)
+        os.write.side_effect = lambda fd, data: written.append(data)
+        os.read.side_effect = lambda fd, size: "".join(written[:1] and
+                                                       [written.pop(0)])
+
+        groups = [("staff", {"gid": 100}), ("wheel", {}), ("broken", {})]
+        users = [("alice", {"password": "abcde", "groups": ["wheel"]}),
+                 ("bob", {})]
+        usr = pyanaconda.users.Users(self.anaconda)
+        self.assertEqual(usr.createUsersAndGroups(groups, users, root=""),
+                         ([True, False, False], [True, False]))
+        self.assertEqual(os.fork.call_count, 1)
+        self.assertEqual([c[0][0] for c in admin.initUser.call_args_list],
+                         ["alice"])
+
     def check_user_exists_test(self):
         import pyanaconda.users
 
@@ -0,0 +1,453 @@
+#!/usr/bin/python
+
+import mock
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+class FakePackage(object):
+    def __init__(self, name, arch="x86_64", version="1", size=10):
+        self.name = name
+        self.arch = arch
+        self.version = version
+        self.size = size
+        self.repoid = "base"
+        self.pkgtup = (name, arch, "0", version, "1")
+
+    def __repr__(self):
+        return "%s-%s.%s" % (self.name, self.version, self.arch)
+
+class FakeRepo(object):
+    """ Downloads packages to dest, failing on the ones in fail. """
+    def __init__(self, dest, fail=()):
+        self.dest = dest
+        self.fail = fail
+        self.fetched = []
+        self.active = 0
+        self.overlapped = False
+
+    def getPackage(self, po):
+        self.active += 1
+        self.overlapped = self.overlapped or self.active > 1
+        self.fetched.append(po.name)
+        try:
+            time.sleep(0.01)
+            if po.name in self.fail:
+                raise IOError(5, "Input/output error")
+
+            path = os.path.join(self.dest, "%s.rpm" % po.name)
+            open(path, "w").write(po.name)
+            return path
+        finally:
+            self.active -= 1
+
+class FakeRepoError(Exception):
+    pass
+
+class FakeSetupRepo(object):
+    def __init__(self, id, network=True):
+        self.id = id
+        self.name = id
+        self.network = network
+
+    def needsNetwork(self):
+        return self.network
+
+    def setFailureObj(self, obj):
+        pass
+
+    def setMirrorFailureObj(self, obj):
+        pass
+
+class FakeTsInfo(object):
+    def __init__(self):
+        self.pkgs = []
+        self.removed = []
+        self.conditionals = {}
+
+    def matchNaevr(self, name=None, arch=None):
+        return [po for po in self.pkgs
+                if po.name == name and arch in (None, po.arch)]
+
+    def remove(self, pkgtup):
+        self.removed.append(pkgtup)
+
+class FakeGroup(object):
+    def __init__(self, groupid, name, translated_name):
+        self.groupid = groupid
+        self.name = name
+        self.translated_name = translated_name
+
+class YumInstallTest(mock.TestCase):
+
+    def setUp(self):
+        self.setupModules(["_isys", "block", "selinux", "ConfigParser", "rpm",
+                           "rpmUtils", "rpmUtils.arch", "urlgrabber",
+                           "urlgrabber.progress", "urlgrabber.grabber", "yum",
+                           "yum.constants", "yum.Errors", "yum.misc",
+                           "yum.yumRepo", "iniparse", "pyanaconda.storage",
+                           "pyanaconda.packages", "pyanaconda.backend",
+                           "pyanaconda.image", "pyanaconda.network",
+                           "pyanaconda.compssort", "pyanaconda.isys"])
+
+        import sys
+        sys.modules["yum"].YumBase = object
+        sys.modules["yum.yumRepo"].YumRepository = object
+        sys.modules["yum.misc"].to_unicode = unicode
+        sys.modules["pyanaconda.backend"].AnacondaBackend = object
+
+        import pyanaconda.yuminstall
+        pyanaconda.yuminstall.log = mock.Mock()
+        pyanaconda.yuminstall.YumBaseError = EnvironmentError
+        pyanaconda.yuminstall.URLGrabError = EnvironmentError
+        pyanaconda.yuminstall.RepoError = FakeRepoError
+        pyanaconda.yuminstall.NoSuchGroup = FakeRepoError
+        self.repoThreads = pyanaconda.yuminstall.flags.repoThreads
+
+        self.tmp = tempfile.mkdtemp()
+        self.cache = os.path.join(self.tmp, "var/cache/yum")
+        os.makedirs(self.cache)
+        pyanaconda.yuminstall.ROOT_PATH = self.tmp
+
+    def tearDown(self):
+        import pyanaconda.yuminstall
+        pyanaconda.yuminstall.flags.repoThreads = self.repoThreads
+        shutil.rmtree(self.tmp)
+        self.tearDownModules()
+
+    def _prefetcher(self, pkgs, fail=(), corrupt=(), **kwargs):
+        import pyanaconda.yuminstall
+        self.repo = FakeRepo(self.cache, fail=fail)
+        ayum = mock.Mock()
+        ayum.repos.getRepo.return_value = self.repo
+        ayum.verifyPkg.side_effect = lambda path, po, raiseError: \
+                                         po.name not in corrupt
+        prefetcher = pyanaconda.yuminstall.PackagePrefetcher(ayum, pkgs,
+                                                             **kwargs)
+        prefetcher.start()
+        return prefetcher
+
+    def _settle(self, prefetcher, count):
+        """ Wait for count packages to be fetched and nothing else to do. """
+        # other tests replace time.sleep, so wait on the condition instead
+        for i in range(500):
+            with prefetcher._cond:
+                done = [idx for idx in range(prefetcher._next)
+                        if idx in prefetcher._results or
+                           idx in prefetcher._handedOut]
+                if len(self.repo.fetched) >= count and \
+                   len(done) == prefetcher._next and not prefetcher._ready():
+                    return
+                prefetcher._cond.wait(0.01)
+
+        self.fail("prefetcher did not settle, fetched %s"
+                  % self.repo.fetched)
+
+    def prefetch_ahead_test(self):
+        pkgs = [FakePackage("p%d" % i) for i in range(10)]
+        prefetcher = self._prefetcher(pkgs, ahead=3)
+        try:
+            self._settle(prefetcher, 3)
+            self.assertEqual(sorted(self.repo.fetched), ["p0", "p1", "p2"])
+
+            # rpm asking for a package moves the window along
+            self.assertEqual(prefetcher.get(pkgs[0]),
+                             os.path.join(self.cache, "p0.rpm"))
+            self.assertEqual(prefetcher.get(pkgs[1]),
+                             os.path.join(self.cache, "p1.rpm"))
+            self._settle(prefetcher, 5)
+            self.assertEqual(sorted(self.repo.fetched),
+                             ["p0", "p1", "p2", "p3", "p4"])
+            self.assertFalse(self.repo.overlapped)
+        finally:
+            prefetcher.stop()
+
+    def prefetch_budget_test(self):
+        pkgs = [FakePackage("p%d" % i) for i in range(5)]
+        pkgs[3].size = 100
+        prefetcher = self._prefetcher(pkgs, budget=25)
+        try:
+            self._settle(prefetcher, 2)
+            self.assertEqual(sorted(self.repo.fetched), ["p0", "p1"])
+
+            prefetcher.get(pkgs[0])
+            self._settle(prefetcher, 3)
+            self.assertEqual(sorted(self.repo.fetched), ["p0", "p1", "p2"])
+
+            # a package bigger than the budget waits for the others to go
+            prefetcher.get(pkgs[1])
+            self._settle(prefetcher, 3)
+            prefetcher.get(pkgs[2])
+            self._settle(prefetcher, 4)
+            self.assertEqual(self.repo.fetched[-1], "p3")
+        finally:
+            prefetcher.stop()
+
+    def prefetch_overtaken_test(self):
+        pkgs = [FakePackage("p%d" % i) for i in range(8)]
+        prefetcher = self._prefetcher(pkgs, ahead=2)
+        try:
+            self._settle(prefetcher, 2)
+
+            # rpm got to p4 first, so the caller fetches it and we skip it
+            self.assertEqual(prefetcher.get(pkgs[4]), None)
+            self._settle(prefetcher, 6)
+            self.assertEqual(sorted(self.repo.fetched),
+                             ["p0", "p1", "p2", "p3", "p5", "p6"])
+            self.assertEqual(prefetcher.get(pkgs[4]), None)
+            self.assertEqual(prefetcher.get(FakePackage("other")), None)
+        finally:
+            prefetcher.stop()
+
+    def prefetch_failure_test(self):
+        pkgs = [FakePackage("p%d" % i) for i in range(4)]
+        prefetcher = self._prefetcher(pkgs, fail=["p1"], corrupt=["p2"])
+        try:
+            self._settle(prefetcher, 4)
+            paths = [prefetcher.get(po) for po in pkgs]
+            self.assertEqual(paths, [os.path.join(self.cache, "p0.rpm"),
+                                     None, None,
+                                     os.path.join(self.cache, "p3.rpm")])
+            self.assertFalse(os.path.exists(os.path.join(self.cache,
+                                                         "p2.rpm")))
+            self.assertEqual(prefetcher._waiting, 0)
+        finally:
+            prefetcher.stop()
+
+    def prefetch_stop_test(self):
+        pkgs = [FakePackage("p%d" % i) for i in range(6)]
+        prefetcher = self._prefetcher(pkgs, ahead=4)
+        self._settle(prefetcher, 4)
+        prefetcher.get(pkgs[0])
+        prefetcher.stop()
+
+        # only what rpm asked for is left
+        self.assertEqual(os.listdir(self.cache), ["p0.rpm"])
+        self.assertEqual([t for t in threading.enumerate()
+                          if t.getName().startswith("prefetch-")], [])
+        self.assertEqual(prefetcher.get(pkgs[5]), None)
+
+    def prefetch_serialized_test(self):
+        import pyanaconda.yuminstall
+        pkgs = [FakePackage("p%d" % i) for i in range(3)]
+        callback = pyanaconda.yuminstall.AnacondaCallback(mock.Mock(),
+                                                          mock.Mock(),
+                                                          None, "")
+        callback.prefetcher = self._prefetcher(pkgs)
+        try:
+            locked = lambda: callback.prefetcher.lock.locked()
+            self.assertTrue(callback._serialized(locked))
+        finally:
+            callback.prefetcher.stop()
+
+        callback.prefetcher = None
+        self.assertEqual(callback._serialized(lambda x: x, 1), 1)
+
+    def _withFuncDo(self, repos, fail=(), thisrepo=None):
+        """ Run __withFuncDo on repos with a fetch that fails for fail. """
+        import pyanaconda.yuminstall
+        from pyanaconda.constants import DISPATCH_FORWARD
+        backend = pyanaconda.yuminstall.YumBackend.__new__(
+                        pyanaconda.yuminstall.YumBackend)
+        backend.ayum = mock.Mock()
+        backend.ayum.repos.listEnabled.return_value = repos
+        backend.ayum.repos.getRepo.side_effect = \
+            lambda id: [r for r in repos if r.id == id][0]
+
+        self.fetched = []
+        self.called = []
+        lock = threading.Lock()
+        def fetch(repo):
+            with lock:
+                self.fetched.append(repo.id)
+            time.sleep(0.01)
+            if repo.id in fail:
+                raise fail[repo.id]
+
+        def fn(repo):
+            self.called.append((repo.id, threading.currentThread()))
+
+        self.anaconda = mock.Mock()
+        self.anaconda.dir = DISPATCH_FORWARD
+        self.anaconda.ksdata = None
+        self.anaconda.intf.messageWindow.return_value = 2
+        backend._YumBackend__withFuncDo(self.anaconda, fn, fetch=fetch,
+                                        thisrepo=thisrepo)
+
+    def repo_fetch_test(self):
+        import pyanaconda.yuminstall
+        pyanaconda.yuminstall.flags.repoThreads = 3
+        repos = [FakeSetupRepo(id) for id in ("a", "b", "c", "d")]
+        repos.append(FakeSetupRepo("media", network=False))
+        self._withFuncDo(repos, fail={"b": FakeRepoError("b is down"),
+                                      "c": ValueError("c is broken")})
+
+        # only the network repos get fetched, each of them once
+        self.assertEqual(sorted(self.fetched), ["a", "b", "c", "d"])
+
+        # all the setup happens on this thread, in order, and only the
+        # RepoError goes straight to the dialog, for b to be retried
+        self.assertEqual([c[0] for c in self.called],
+                         ["a", "b", "c", "d", "media"])
+        self.assertEqual(set(c[1] for c in self.called),
+                         set([threading.currentThread()]))
+        self.assertEqual(self.anaconda.intf.messageWindow.call_count, 1)
+        self.assertTrue("b is down" in
+                        self.anaconda.intf.messageWindow.call_args[0][1])
+
+    def repo_fetch_serial_test(self):
+        import pyanaconda.yuminstall
+        repos = [FakeSetupRepo(id) for id in ("a", "b")]
+        pyanaconda.yuminstall.flags.repoThreads = 0
+        self._withFuncDo(repos)
+        self.assertEqual(self.fetched, [])
+        self.assertEqual([c[0] for c in self.called], ["a", "b"])
+
+        # nor is a repo added from the UI fetched on its own
+        pyanaconda.yuminstall.flags.repoThreads = 3
+        self._withFuncDo(repos, thisrepo="b")
+        self.assertEqual(self.fetched, [])
+        self.assertEqual([c[0] for c in self.called], ["b"])
+
+    def sack_fetch_test(self):
+        import pyanaconda.yuminstall
+        from pyanaconda.constants import DISPATCH_FORWARD
+        pyanaconda.yuminstall.flags.repoThreads = 2
+        repos = [FakeSetupRepo(id) for id in ("a", "b")]
+        for repo in repos:
+            repo.repoXML = mock.Mock()
+            repo.retrieveMD = mock.Mock()
+        repos[0].repoXML.fileTypes.return_value = ["primary", "primary_db",
+                                                   "filelists_db", "group",
+                                                   "group_gz"]
+        repos[1].repoXML.fileTypes.return_value = ["primary", "other"]
+
+        backend = pyanaconda.yuminstall.YumBackend.__new__(
+                        pyanaconda.yuminstall.YumBackend)
+        backend.ayum = mock.Mock()
+        backend.ayum.repos.listEnabled.return_value = repos
+        anaconda = mock.Mock()
+        anaconda.dir = DISPATCH_FORWARD
+        backend.doSackSetup(anaconda)
+
+        self.assertEqual([c[0][0] for c in repos[0].retrieveMD.call_args_list],
+                         ["primary_db", "group_gz"])
+        self.assertEqual([c[0][0] for c in repos[1].retrieveMD.call_args_list],
+                         ["primary"])
+        self.assertEqual([c[1] for c in
+                          backend.ayum.doSackSetup.call_args_list],
+                         [{"thisrepo": "a"}, {"thisrepo": "b"}])
+
+    def _selectBackend(self):
+        """ Return a YumBackend with a fake sack, transaction and comps. """
+        import pyanaconda.yuminstall
+        def newest(pkgs):
+            return [po for po in pkgs if po.version ==
+                    max(p.version for p in pkgs if p.name == po.name)]
+        pyanaconda.yuminstall.yum.packageSack.packagesNewestByName = newest
+
+        self.pkgs = [FakePackage("bash"), FakePackage("glibc"),
+                     FakePackage("glibc", arch="i686"),
+                     FakePackage("kernel"), FakePackage("kernel-devel"),
+                     FakePackage("kernel-headers"),
+                     FakePackage("vim-enhanced"), FakePackage("vim-minimal"),
+                     FakePackage("zsh", version="1"),
+                     FakePackage("zsh", version="2")]
+        backend = pyanaconda.yuminstall.YumBackend.__new__(
+                        pyanaconda.yuminstall.YumBackend)
+        backend.ayum = mock.Mock()
+        backend.ayum.pkgSack.returnPackages.return_value = self.pkgs
+        backend.ayum.tsInfo = FakeTsInfo()
+        backend.ayum.bestPackagesFromList.side_effect = lambda pkgs: \
+            [po for po in pkgs if po.arch == "x86_64"] or pkgs
+        backend.ayum.install.side_effect = lambda po: \
+            backend.ayum.tsInfo.pkgs.append(po)
+        backend.ayum.comps.groups = [
+            FakeGroup("core", "Core", {"de": "Kern"}),
+            FakeGroup("base", "Base", {}),
+            FakeGroup("web", "Web Server", {"fr": "Base", "de": "Core"})]
+
+        backend.selectPackage = mock.Mock(return_value=0)
+        backend.selectGroup = mock.Mock(side_effect=FakeRepoError)
+        backend.deselectPackage = mock.Mock()
+        backend.deselectGroup = mock.Mock()
+        return backend
+
+    def match_packages_test(self):
+        backend = self._selectBackend()
+        index = backend._packageIndex()
+        (matches, unmatched) = backend._matchPackages(index,
+                                    ["bash", "glibc.i686", "kernel*",
+                                     "*-devel", "vim-[e]*", "zsh.x86_64",
+                                     "nope", "nope*", "perl(Foo)"])
+
+        names = lambda pkgs: sorted("%s.%s-%s" % (po.name, po.arch,
+                                                  po.version) for po in pkgs)
+        self.assertEqual(names(matches["bash"]), ["bash.x86_64-1"])
+        self.assertEqual(names(matches["glibc.i686"]), ["glibc.i686-1"])
+        self.assertEqual(names(matches["kernel*"]),
+                         ["kernel-devel.x86_64-1", "kernel-headers.x86_64-1",
+                          "kernel.x86_64-1"])
+        self.assertEqual(names(matches["*-devel"]), ["kernel-devel.x86_64-1"])
+        self.assertEqual(names(matches["vim-[e]*"]), ["vim-enhanced.x86_64-1"])
+        self.assertEqual(names(matches["zsh.x86_64"]),
+                         ["zsh.x86_64-1", "zsh.x86_64-2"])
+        self.assertEqual(unmatched, ["nope", "nope*", "perl(Foo)"])
+
+    def group_index_test(self):
+        backend = self._selectBackend()
+        index = backend._groupIndex()
+
+        # ids beat names, which beat translated names
+        self.assertEqual(index["Kern"], "core")
+        self.assertEqual(index["Core"], "core")
+        self.assertEqual(index["Base"], "base")
+        self.assertEqual(index["Web Server"], "web")
+        self.assertEqual(index["web"], "web")
+        self.assertFalse("Zzz" in index)
+
+    def select_packages_test(self):
+        backend = self._selectBackend()
+        ayum = backend.ayum
+        (missingPackages, missingGroups) = backend.selectPackages(
+            ["bash", "glibc", "glibc.i686", "zsh", "nope"],
+            [("Core", (True, False)), ("Kern", (False, True)),
+             ("nogroup", (True, False))])
+
+        # glibc.i686 is selected alongside glibc, and zsh only once
+        self.assertEqual(sorted("%s.%s-%s" % (po.name, po.arch, po.version)
+                                for po in ayum.tsInfo.pkgs),
+                         ["bash.x86_64-1", "glibc.i686-1", "glibc.x86_64-1",
+                          "zsh.x86_64-2"])
+        self.assertEqual(missingPackages, ["nope"])
+        self.assertEqual(backend.selectPackage.call_args_list,
+                         [(("nope",), {})])
+        self.assertEqual(missingGroups, ["nogroup"])
+        self.assertEqual(ayum.selectGroup.call_args_list,
+            [(("core",), {"group_package_types": ["mandatory", "default"]}),
+             (("core",), {"group_package_types": ["mandatory", "optional"]})])
+
+        # what is in the transaction already is left alone
+        ayum.install.reset_mock()
+        backend.selectPackages(["glibc", "glibc.i686", "glibc.*"], [])
+        self.assertEqual(ayum.install.call_count, 0)
+
+    def exclude_packages_test(self):
+        backend = self._selectBackend()
+        ayum = backend.ayum
+        kernelDevel = self.pkgs[4]
+        ayum.tsInfo.conditionals = {"kernel": [kernelDevel, self.pkgs[0]]}
+        backend.selectPackages([], [], ["kernel-devel", "vim-e*", "nomatch"],
+                               ["Web Server", "Zzz"])
+
+        self.assertEqual(sorted(ayum.tsInfo.removed),
+                         sorted([kernelDevel.pkgtup, self.pkgs[6].pkgtup]))
+        self.assertEqual(ayum.tsInfo.conditionals, {"kernel": [self.pkgs[0]]})
+        self.assertEqual(backend.deselectPackage.call_args_list,
+                         [(("nomatch",), {})])
+        self.assertEqual(ayum.deselectGroup.call_args_list,
+                         [(("web",), {"force": True})])
+        self.assertEqual(backend.deselectGroup.call_args_list,
+                         [(("Zzz",), {})])
@@ -1,14 +1,18 @@
 #!/usr/bin/python
 
+import time
+import threading
 import unittest
 from mock import Mock
 from mock import TestCase
+from mock import slow
 
 from storagetestcase import StorageTestCase
 import pyanaconda.storage as storage
 from pyanaconda.storage.formats import getFormat
 
 # device classes for brevity's sake -- later on, that is
+from pyanaconda.storage.devices import Device
 from pyanaconda.storage.devices import StorageDevice
 from pyanaconda.storage.devices import DiskDevice
 from pyanaconda.storage.devices import PartitionDevice
@@ -30,6 +34,42 @@ from pyanaconda.storage.deviceaction import ActionDestroyFormat
 
 """ DeviceActionTestSuite """
 
+class SyntheticDevice(object):
+    """ A minimal stand-in for a Device, for large action queues. """
+    _id = 0
+    dependsOn = Device.dependsOn.im_func
+
+    def __init__(self, parents):
+        self.parents = parents
+        self.id = SyntheticDevice._id
+        SyntheticDevice._id += 1
+
+class SyntheticAction(storage.deviceaction.DeviceAction):
+    """ An action on a SyntheticDevice that does not touch the system.
+
+        Creates require the creation of the device's parents, destroys
+        require the destruction of its children. Destroying a device
+        obsoletes every action on the device, including itself.
+    """
+    def __init__(self, device, type,
+                 obj=storage.deviceaction.ACTION_OBJECT_DEVICE):
+        self.device = device
+        self.type = type
+        self.obj = obj
+        self.id = storage.deviceaction.DeviceAction._id
+        storage.deviceaction.DeviceAction._id += 1
+
+    def requires(self, action):
+        if self.isCreate:
+            return self.device.dependsOn(action.device)
+        return action.device.dependsOn(self.device)
+
+    def obsoletes(self, action):
+        if self.isDestroy and self.isDevice:
+            return (self.device.id == action.device.id and
+                    self.id >= action.id)
+        return storage.deviceaction.DeviceAction.obsoletes(self, action)
+
 class DeviceActionTestCase(StorageTestCase):
     def setUp(self):
         """ Create something like a preexisting autopart on two disks (sda,sdb).
@@ -550,6 +590,47 @@ class DeviceActionTestCase(StorageTestCase):
         sda3_actions = self.storage.devicetree.findActions(sda3.id)
         self.assertEqual(len(sda3_actions), 0)
 
+    def testLargeQueuePruning(self, *args, **kwargs):
+        """ Verify pruning of a large queue against the pairwise algorithm. """
+        def pairwisePrune(actions):
+            # this is how pruneActions used to do it
+            actions = actions[:]
+            for action in reversed(actions[:]):
+                if action not in actions:
+                    continue
+
+                for obsolete in actions[:]:
+                    if action.obsoletes(obsolete):
+                        actions.remove(obsolete)
+            return actions
+
+        create = storage.deviceaction.ACTION_TYPE_CREATE
+        resize = storage.deviceaction.ACTION_TYPE_RESIZE
+        destroy = storage.deviceaction.ACTION_TYPE_DESTROY
+        format = storage.deviceaction.ACTION_OBJECT_FORMAT
+        def queue(count):
+            # interleave the actions on count / 5 devices, and destroy
+            # every third device at the end
+            devices = [SyntheticDevice([]) for i in range(count / 5)]
+            actions = []
+            for round in range(4):
+                for device in devices:
+                    if round == 0:
+                        actions.append(SyntheticAction(device, create))
+                    elif round == 3 and device.id % 3 == 0:
+                        actions.append(SyntheticAction(device, destroy))
+                    else:
+                        actions.append(SyntheticAction(device, [create, resize][round % 2],
+                                                       obj=format))
+            return actions
+
+        devicetree = self.storage.devicetree
+        actions = queue(1000)
+        devicetree._actions = actions[:]
+        devicetree.pruneActions()
+        self.assertEqual([a.id for a in devicetree._actions],
+                         [a.id for a in pairwisePrune(actions)])
+
     def testActionDependencies(self, *args, **kwargs):
         """ Verify correct functioning of action dependencies. """
         # ActionResizeDevice
@@ -914,7 +995,245 @@ class DeviceActionTestCase(StorageTestCase):
 
     def testActionSorting(self, *args, **kwargs):
         """ Verify correct functioning of action sorting. """
-        pass
+        devicetree = self.storage.devicetree
+
+        # destroy everything on sda, then lay out new partitions, a vg with
+        # two lvs and an md array on sda and sdb
+        self.destroyAllDevices(disks=["sda"])
+
+        sda = devicetree.getDeviceByName("sda")
+        sdb = devicetree.getDeviceByName("sdb")
+        sda1 = self.newDevice(device_class=PartitionDevice,
+                              name="sda1", size=500, parents=[sda])
+        self.scheduleCreateDevice(device=sda1)
+        format = self.newFormat("ext4", mountpoint="/boot", device=sda1.path)
+        self.scheduleCreateFormat(device=sda1, format=format)
+
+        sda2 = self.newDevice(device_class=PartitionDevice,
+                              name="sda2", size=50000, parents=[sda])
+        self.scheduleCreateDevice(device=sda2)
+        format = self.newFormat("lvmpv", device=sda2.path)
+        self.scheduleCreateFormat(device=sda2, format=format)
+
+        vg = self.newDevice(device_class=LVMVolumeGroupDevice,
+                            name="vg", parents=[sda2])
+        self.scheduleCreateDevice(device=vg)
+        for (name, size) in [("lv_root", 40000), ("lv_swap", 4000)]:
+            lv = self.newDevice(device_class=LVMLogicalVolumeDevice,
+                                name=name, vgdev=vg, size=size)
+            self.scheduleCreateDevice(device=lv)
+            format = self.newFormat("ext4", device=lv.path)
+            self.scheduleCreateFormat(device=lv, format=format)
+
+        sdc = devicetree.getDeviceByName("sdc")
+        sdd = devicetree.getDeviceByName("sdd")
+        members = []
+        for disk in (sdc, sdd):
+            member = self.newDevice(device_class=PartitionDevice,
+                                    name=disk.name + "1", size=40000,
+                                    parents=[disk])
+            self.scheduleCreateDevice(device=member)
+            format = self.newFormat("mdmember", device=member.path)
+            self.scheduleCreateFormat(device=member, format=format)
+            members.append(member)
+
+        md0 = self.newDevice(device_class=MDRaidArrayDevice,
+                             name="md0", level="raid1", minor=0, size=40000,
+                             memberDevices=2, totalDevices=2,
+                             parents=members)
+        self.scheduleCreateDevice(device=md0)
+        format = self.newFormat("ext4", device=md0.path, mountpoint="/home")
+        self.scheduleCreateFormat(device=md0, format=format)
+
+        # shuffle the queue so the sort has something to do
+        actions = devicetree.findActions()
+        devicetree._actions = actions[1::2] + actions[::2]
+        devicetree.sortActions()
+        actions = devicetree.findActions()
+
+        # the sort must not change the set of actions
+        self.assertEqual(sorted(a.id for a in actions),
+                         sorted(a.id for a in devicetree._actions))
+
+        # no action may precede an action of a higher type or an action it
+        # requires
+        for (i, action) in enumerate(actions):
+            for later in actions[i+1:]:
+                self.assertFalse(action.type < later.type,
+                                 "%s sorted before %s" % (action, later))
+                self.assertFalse(action.requires(later),
+                                 "%s sorted before %s" % (action, later))
+
+        # the result only depends on the order of the input
+        order = [a.id for a in actions]
+        devicetree._actions = actions[1::2] + actions[::2]
+        devicetree.sortActions()
+        first = [a.id for a in devicetree.findActions()]
+        devicetree._actions = actions[1::2] + actions[::2]
+        devicetree.sortActions()
+        self.assertEqual([a.id for a in devicetree.findActions()], first)
+
+    def testConcurrentExecution(self, *args, **kwargs):
+        """ Verify that independent format actions run at the same time. """
+        devicetree = self.storage.devicetree
+        sdc = devicetree.getDeviceByName("sdc")
+        sdd = devicetree.getDeviceByName("sdd")
+        for (disk, fmts) in [(sdc, ["ext4", "swap"]), (sdd, ["ext4", "lvmpv"])]:
+            for (i, fmt) in enumerate(fmts):
+                part = self.newDevice(device_class=PartitionDevice,
+                                      name="%s%d" % (disk.name, i + 1),
+                                      size=10000, parents=[disk])
+                self.scheduleCreateDevice(device=part)
+                format = self.newFormat(fmt, device=part.path)
+                self.scheduleCreateFormat(device=part, format=format)
+
+        vg = self.newDevice(device_class=LVMVolumeGroupDevice,
+                            name="vg", parents=[devicetree.getDeviceByName("sdd2")])
+        self.scheduleCreateDevice(device=vg)
+        for name in ["lv_a", "lv_b"]:
+            lv = self.newDevice(device_class=LVMLogicalVolumeDevice,
+                                name=name, vgdev=vg, size=1000)
+            self.scheduleCreateDevice(device=lv)
+            format = self.newFormat("ext4", device=lv.path)
+            self.scheduleCreateFormat(device=lv, format=format)
+
+        # record when each action runs instead of running it
+        lock = threading.Lock()
+        spans = {}
+        prepared = {}
+        intfs = set()
+        def recorder(action):
+            def execute(intf=None):
+                intfs.add(intf)
+                start = time.time()
+                time.sleep(0.05)
+                with lock:
+                    spans[action.id] = (start, time.time())
+            return execute
+
+        def preparer(action):
+            def prepare(intf=None):
+                prepared[action.id] = threading.currentThread()
+            return prepare
+
+        actions = devicetree.findActions()
+        for action in actions:
+            action.execute = recorder(action)
+            action.executeFormat = recorder(action)
+            action.prepare = preparer(action)
+
+        saved = (storage.devicetree.udev_settle,
+                 storage.devicetree.ACTION_TIMING_REPORT,
+                 storage.devicetree.ACTION_TIMING_TRACE,
+                 PartitionDevice.preCommitFixup)
+        storage.devicetree.udev_settle = Mock()
+        storage.devicetree.ACTION_TIMING_REPORT = "/dev/null"
+        storage.devicetree.ACTION_TIMING_TRACE = "/dev/null"
+        PartitionDevice.preCommitFixup = Mock()
+        done = []
+        devicetree.intf = Mock()
+        timelines = []
+        devicetree._writeActionTiming = timelines.append
+        try:
+            devicetree.processActions(callback=done.append, workers=3)
+        finally:
+            (storage.devicetree.udev_settle,
+             storage.devicetree.ACTION_TIMING_REPORT,
+             storage.devicetree.ACTION_TIMING_TRACE,
+             PartitionDevice.preCommitFixup) = saved
+
+        self.assertEqual(sorted(a.id for a in done),
+                         sorted(a.id for a in actions))
+        for action in actions:
+            (start, end) = spans[action.id]
+            for other in actions:
+                (otherStart, otherEnd) = spans[other.id]
+                if action.requires(other):
+                    self.assertTrue(otherEnd <= start,
+                                    "%s ran before %s" % (action, other))
+
+                # only format creates may overlap
+                if other is not action and \
+                   otherStart < end and start < otherEnd:
+                    self.assertTrue(action.isFormat and other.isFormat,
+                                    "%s ran with %s" % (action, other))
+
+        # everything but the formats themselves happens on this thread
+        self.assertEqual(sorted(prepared),
+                         sorted(a.id for a in actions if a.isFormat))
+        self.assertEqual(set(prepared.values()),
+                         set([threading.currentThread()]))
+
+        # each action is timed once, preparing it separately
+        self.assertEqual(len(timelines[0].breakdown("action")), len(actions))
+        self.assertEqual(len(timelines[0].breakdown("prepare")),
+                         len([a for a in actions if a.isFormat]))
+
+        # only the serial actions get to use the interface; a wait window
+        # is shown while the workers run
+        self.assertEqual(intfs, set([None, devicetree.intf]))
+        wait = devicetree.intf.waitWindow.return_value
+        self.assertTrue(devicetree.intf.waitWindow.called)
+        self.assertEqual(wait.pop.call_count,
+                         devicetree.intf.waitWindow.call_count)
+
+        # the formats on the partitions run together, as do those on the lvs
+        formats = sorted(spans[a.id] for a in actions if a.isFormat)
+        overlapping = [f for f in formats if f[0] < formats[0][1]]
+        self.assertEqual(len(overlapping), 3)
+
+    def _syntheticQueue(self, stacks):
+        """ Return actions on stacks of ten synthetic devices, each one
+            created or destroyed.
+        """
+        create = storage.deviceaction.ACTION_TYPE_CREATE
+        destroy = storage.deviceaction.ACTION_TYPE_DESTROY
+        actions = []
+        for i in range(stacks):
+            parent = SyntheticDevice([])
+            for j in range(10):
+                device = SyntheticDevice([parent])
+                actions.append(SyntheticAction(device,
+                                               [create, destroy][i % 2]))
+                parent = device
+
+        return actions
+
+    def testLargeQueueSorting(self, *args, **kwargs):
+        """ Verify sorting of a queue of 1000 synthetic actions. """
+        actions = self._syntheticQueue(100)
+        devicetree = self.storage.devicetree
+        devicetree._actions = actions[::-1]
+        devicetree.sortActions()
+
+        position = dict((a.id, i) for (i, a) in enumerate(devicetree._actions))
+        self.assertEqual(len(position), len(actions))
+        byDevice = dict((a.device.id, a) for a in actions)
+        for action in actions:
+            other = byDevice.get(action.device.parents[0].id)
+            if other is None:
+                continue
+
+            if action.isCreate:
+                self.assertTrue(position[other.id] < position[action.id])
+            else:
+                self.assertTrue(position[other.id] > position[action.id])
+
+    @slow
+    def testActionSortingScaling(self, *args, **kwargs):
+        """ Time sorting of a queue of 10000 synthetic actions. """
+        actions = self._syntheticQueue(1000)
+        devicetree = self.storage.devicetree
+        devicetree._actions = actions[::-1]
+        start = time.time()
+        devicetree.sortActions()
+        elapsed = time.time() - start
+
+        # the pairwise sort took minutes for a queue this long
+        self.assertEqual(len(devicetree._actions), len(actions))
+        self.assertTrue(elapsed < 10,
+                        "sorting %d actions took %.1f seconds"
+                        % (len(actions), elapsed))
 
 
 def suite():
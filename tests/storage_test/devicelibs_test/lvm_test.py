@@ -230,9 +230,72 @@ class LVMTestCase(baseclass.DevicelibsTestCase):
         # TODO
         pass
 
+class LVMSnapshotTestCase(unittest.TestCase):
+    """ Test that snapshot origins are looked up in a single lvs report. """
+    _report = "  vg_test|lv_root|\n" \
+              "  vg_test|snap|lv_root\n" \
+              "  vg_test|snap2|lv_root\n"
+
+    def setUp(self):
+        import pyanaconda.anaconda_log
+        pyanaconda.anaconda_log.init()
+
+        import pyanaconda.iutil
+        import pyanaconda.storage.devicelibs.lvm as lvm
+        self.lvm = lvm
+        self.commands = []
+        self._execWithCapture = pyanaconda.iutil.execWithCapture
+        self._execWithPulseProgress = pyanaconda.iutil.execWithPulseProgress
+        pyanaconda.iutil.execWithCapture = self.execWithCapture
+        pyanaconda.iutil.execWithPulseProgress = self.execWithPulseProgress
+        lvm.lvm_cc_resetFilter()
+
+    def tearDown(self):
+        import pyanaconda.iutil
+        pyanaconda.iutil.execWithCapture = self._execWithCapture
+        pyanaconda.iutil.execWithPulseProgress = self._execWithPulseProgress
+        self.lvm.lvm_cc_resetFilter()
+
+    def execWithCapture(self, command, argv, **kwargs):
+        if "--separator" in argv:
+            self.commands.append("report")
+            return self._report
+
+        self.commands.append(argv[0])
+        return "  other_origin\n"
+
+    def execWithPulseProgress(self, command, argv, **kwargs):
+        self.commands.append(argv[0])
+        from pyanaconda.iutil import ExecProduct
+        return ExecProduct(0, "", "")
+
+    def testSnapshot(self):
+        lvm = self.lvm
+        self.assertEqual(lvm.lvorigin("vg_test", "snap"), "lv_root")
+        self.assertEqual(lvm.lvorigin("vg_test", "lv_root"), "")
+
+        # activating the lvs, as populate does, keeps the report
+        lvm.lvactivate("vg_test", "snap")
+        self.assertEqual(lvm.lvorigin("vg_test", "snap2"), "lv_root")
+        self.assertEqual(self.commands, ["report", "lvchange"])
+
+        # lvs lvm did not report are looked up individually
+        self.assertEqual(lvm.lvorigin("vg_other", "snap"), "other_origin")
+        self.assertEqual(self.commands[2:], ["lvs"])
+
+        # changing the filter or lvm's data means taking a new report
+        lvm.lvm_cc_addFilterRejectRegexp("sdb")
+        lvm.lvorigin("vg_test", "snap")
+        lvm.lvremove("vg_test", "snap")
+        lvm.lvorigin("vg_test", "snap2")
+        self.assertEqual(self.commands[3:],
+                         ["report", "lvremove", "report"])
+
 
 def suite():
-    return unittest.TestLoader().loadTestsFromTestCase(LVMTestCase)
+    suite1 = unittest.TestLoader().loadTestsFromTestCase(LVMTestCase)
+    suite2 = unittest.TestLoader().loadTestsFromTestCase(LVMSnapshotTestCase)
+    return unittest.TestSuite([suite1, suite2])
 
 
 if __name__ == "__main__":
@@ -0,0 +1,530 @@
+#!/usr/bin/python
+
+import unittest
+import parted
+
+from storagetestcase import StorageTestCase
+import pyanaconda.storage as storage
+
+# device classes for brevity's sake -- later on, that is
+from pyanaconda.storage.devices import DiskDevice
+from pyanaconda.storage.devices import PartitionDevice
+from pyanaconda.storage.devices import LVMVolumeGroupDevice
+from pyanaconda.storage.devices import LVMLogicalVolumeDevice
+
+""" DeviceTreeTestSuite """
+
+class DeviceTreeTestCase(StorageTestCase):
+    def setUp(self):
+        """ Create a handful of disks with a partition, a vg and two lvs. """
+        self.setUpAnaconda()
+        devicetree = self.storage.devicetree
+
+        for name in ["sda", "sdb", "sdc"]:
+            disk = self.newDevice(device_class=DiskDevice,
+                                  name=name, size=100000, serial=name.upper())
+            disk.format = self.newFormat("disklabel", path=disk.path,
+                                         exists=True)
+            devicetree._addDevice(disk)
+
+            part = self.newDevice(device_class=PartitionDevice, exists=True,
+                                  name=name + "1", parents=[disk], size=99999)
+            part.format = self.newFormat("lvmpv", device=part.path,
+                                         uuid="pv-uuid-" + name, exists=True)
+            devicetree._addDevice(part)
+
+        pvs = [devicetree.getDeviceByName(n) for n in ("sda1", "sdb1")]
+        vg = self.newDevice(device_class=LVMVolumeGroupDevice,
+                            name="Vol-Group", parents=pvs, exists=True,
+                            uuid="vg-uuid")
+        devicetree._addDevice(vg)
+
+        for (name, label) in [("lv_root", "root"), ("lv-home", "home")]:
+            lv = self.newDevice(device_class=LVMLogicalVolumeDevice,
+                                name=name, vgdev=vg, size=60000, exists=True)
+            lv.format = self.newFormat("ext4", device=lv.path, label=label,
+                                       uuid="fs-uuid-" + name, exists=True)
+            devicetree._addDevice(lv)
+
+    # These are the linear scans DeviceTree used before it grew indexes.
+    def scanName(self, name):
+        for device in self.storage.devicetree._devices:
+            if device.name == name:
+                return device
+            elif (device.type == "lvmlv" or device.type == "lvmvg") and \
+                    device.name == name.replace("--","-"):
+                return device
+
+    def scanPath(self, path):
+        leaf = None
+        other = None
+        for device in self.storage.devicetree._devices:
+            if (device.path == path or
+                ((device.type == "lvmlv" or device.type == "lvmvg") and
+                 device.path == path.replace("--","-"))):
+                if device.isleaf and not leaf:
+                    leaf = device
+                elif not other:
+                    other = device
+        return leaf or other
+
+    def scanUuid(self, uuid):
+        for device in self.storage.devicetree._devices:
+            if device.uuid == uuid or device.format.uuid == uuid:
+                return device
+
+    def scanLabel(self, label):
+        for device in self.storage.devicetree._devices:
+            if getattr(device.format, "label", None) == label:
+                return device
+
+    def scanSysfsPath(self, path):
+        for device in self.storage.devicetree._devices:
+            if device.sysfsPath == path:
+                return device
+
+    def scanSerial(self, serial):
+        return [d for d in self.storage.devicetree._devices
+                    if d.serial == serial]
+
+    def assertLookupsMatchScans(self):
+        devicetree = self.storage.devicetree
+        devices = devicetree._devices[:]
+        names = [d.name for d in devices] + ["Vol--Group-lv--home", "nope"]
+        for name in names:
+            self.assertIs(devicetree.getDeviceByName(name),
+                          self.scanName(name))
+
+        paths = [d.path for d in devices] + ["/dev/mapper/Vol--Group"]
+        for path in paths:
+            self.assertIs(devicetree.getDeviceByPath(path),
+                          self.scanPath(path))
+
+        for device in devices:
+            for uuid in (device.uuid, device.format.uuid):
+                if uuid:
+                    self.assertIs(devicetree.getDeviceByUuid(uuid),
+                                  self.scanUuid(uuid))
+
+            label = getattr(device.format, "label", None)
+            if label:
+                self.assertIs(devicetree.getDeviceByLabel(label),
+                              self.scanLabel(label))
+
+            if device.sysfsPath:
+                self.assertIs(devicetree.getDeviceBySysfsPath(device.sysfsPath),
+                              self.scanSysfsPath(device.sysfsPath))
+
+            self.assertEqual(devicetree.getDevicesBySerial(device.serial),
+                             self.scanSerial(device.serial))
+
+    def testLookups(self):
+        """ Verify that the getDeviceBy* methods agree with linear scans. """
+        devicetree = self.storage.devicetree
+        self.assertLookupsMatchScans()
+
+        self.assertEqual(devicetree.getDeviceByName("Vol-Group-lv-home").lvname,
+                         "lv-home")
+        self.assertEqual(devicetree.getDeviceByName("Vol--Group-lv_root").lvname,
+                         "lv_root")
+        self.assertEqual(devicetree.getDeviceByUuid("pv-uuid-sdb").name, "sdb1")
+        self.assertEqual(devicetree.getDeviceByLabel("root").lvname, "lv_root")
+        self.assertEqual(devicetree.getDevicesBySerial("SDC"),
+                         [devicetree.getDeviceByName("sdc")])
+        self.assertEqual(devicetree.getDeviceByName(None), None)
+        self.assertEqual(devicetree.getDeviceByUuid(""), None)
+
+    def testLookupsAfterChanges(self):
+        """ Verify that the indexes follow changes to devices and formats. """
+        devicetree = self.storage.devicetree
+
+        # renaming a vg renames its lvs
+        vg = devicetree.getDeviceByName("Vol-Group")
+        vg.name = "vg"
+        self.assertEqual(devicetree.getDeviceByName("Vol-Group"), None)
+        self.assertEqual(devicetree.getDeviceByName("vg-lv_root").vg, vg)
+        self.assertEqual(devicetree.getDeviceByPath("/dev/mapper/vg-lv--home").vg,
+                         vg)
+
+        # replace a format and relabel another in place
+        lv_root = devicetree.getDeviceByName("vg-lv_root")
+        lv_root.format = self.newFormat("xfs", device=lv_root.path,
+                                        label="newroot", uuid="xfs-uuid")
+        lv_home = devicetree.getDeviceByName("vg-lv-home")
+        lv_home.format.label = "root"
+        self.assertEqual(devicetree.getDeviceByUuid("fs-uuid-lv_root"), None)
+        self.assertEqual(devicetree.getDeviceByUuid("xfs-uuid"), lv_root)
+        self.assertEqual(devicetree.getDeviceByLabel("root"), lv_home)
+
+        # sysfs path changes
+        sdc = devicetree.getDeviceByName("sdc")
+        sdc.sysfsPath = "/devices/virtual/block/sdc"
+        self.assertEqual(devicetree.getDeviceBySysfsPath(sdc.sysfsPath), sdc)
+
+        # removal
+        sdc1 = devicetree.getDeviceByName("sdc1")
+        devicetree._removeDevice(sdc1, moddisk=False)
+        self.assertEqual(devicetree.getDeviceByName("sdc1"), None)
+        self.assertEqual(devicetree.getDeviceByUuid("pv-uuid-sdc"), None)
+
+        self.assertLookupsMatchScans()
+
+        # the change log can overflow; the tree then rebuilds its indexes
+        devicetree._indexSerial -= storage.changes.MAX_CHANGES + 1
+        self.assertLookupsMatchScans()
+
+    def testConcurrentChanges(self):
+        """ Verify that changes noted from several threads are all logged. """
+        import threading
+        changes = storage.changes
+        serial = changes.currentSerial()
+        objs = [object() for i in range(4)]
+        def note(obj):
+            for i in range(500):
+                changes.noteChange(obj)
+
+        threads = [threading.Thread(target=note, args=(obj,)) for obj in objs]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        (current, ids) = changes.changesSince(serial)
+        self.assertEqual(current, serial + 2000)
+        self.assertEqual(len(ids), 2000)
+        self.assertEqual(set(ids), set(id(obj) for obj in objs))
+
+    def testDuplicateUuid(self):
+        """ Verify that devices with duplicate uuids are refused. """
+        devicetree = self.storage.devicetree
+        vg = self.newDevice(device_class=LVMVolumeGroupDevice,
+                            name="other", parents=[], uuid="vg-uuid")
+        self.assertRaises(ValueError, devicetree._addDevice, vg)
+
+    def testDerivedLists(self):
+        """ Verify that the cached lists follow changes to the tree. """
+        devicetree = self.storage.devicetree
+        def check():
+            devices = devicetree._devices
+            leaves = [d for d in devices if d.isleaf]
+            self.assertEqual(devicetree.leaves, leaves)
+            self.assertEqual(devicetree.filesystems,
+                             [d.format for d in leaves
+                                if getattr(d.format, "mountpoint", None)])
+            self.assertEqual(devicetree.getDevicesByType("lvmlv"),
+                             [d for d in devices if d.type == "lvmlv"])
+            self.assertEqual(devicetree.getDevicesByInstance(LVMLogicalVolumeDevice),
+                             [d for d in devices
+                                if isinstance(d, LVMLogicalVolumeDevice)])
+            for device in devices:
+                for uuid in (device.uuid, device.format.uuid):
+                    if uuid:
+                        self.assertIs(devicetree.uuids[uuid], device)
+
+                label = getattr(device.format, "label", None)
+                if label:
+                    self.assertIs(devicetree.labels[label], device)
+
+        check()
+        self.assertEqual(devicetree.filesystems, [])
+
+        # the returned lists belong to the caller
+        devicetree.leaves.pop()
+        devicetree.getDevicesByType("lvmlv").pop()
+        devicetree.uuids.clear()
+        check()
+
+        lv_root = devicetree.getDeviceByName("Vol-Group-lv_root")
+        lv_root.format.mountpoint = "/"
+        lv_root.format.label = "slash"
+        check()
+        self.assertEqual(devicetree.filesystems, [lv_root.format])
+        self.assertEqual(devicetree.labels.get("root"), None)
+
+        lv_root.format = self.newFormat("xfs", mountpoint="/home",
+                                        uuid="xfs-uuid")
+        check()
+        self.assertEqual(devicetree.uuids.get("fs-uuid-lv_root"), None)
+
+        sdc1 = devicetree.getDeviceByName("sdc1")
+        devicetree._removeDevice(sdc1, moddisk=False)
+        check()
+
+        vg = devicetree.getDeviceByName("Vol-Group")
+        lv = self.newDevice(device_class=LVMLogicalVolumeDevice,
+                            name="lv_swap", vgdev=vg, size=1000)
+        devicetree._addDevice(lv)
+        check()
+        self.assertEqual(len(devicetree.getDevicesByType("lvmlv")), 3)
+
+    def scanDependents(self, dep):
+        """ This is how getDependentDevices used to find dependents. """
+        devicetree = self.storage.devicetree
+        logicals = []
+        if isinstance(dep, PartitionDevice) and dep.partType and \
+           dep.isExtended:
+            logicals = [p for p in devicetree.getDevicesByInstance(PartitionDevice)
+                            if p.partType and p.isLogical and p.disk == dep.disk]
+
+        return [d for d in devicetree._devices
+                    if d.dependsOn(dep) or
+                       [l for l in logicals if d.dependsOn(l)]]
+
+    def assertDependentsMatchScans(self):
+        devicetree = self.storage.devicetree
+        for device in devicetree._devices:
+            self.assertEqual(devicetree.getChildren(device),
+                             [c for c in devicetree._devices
+                                if device in c.parents])
+            self.assertEqual(devicetree.getDependentDevices(device),
+                             self.scanDependents(device))
+
+    def testDependents(self):
+        """ Verify that children and dependents follow changes to the tree. """
+        devicetree = self.storage.devicetree
+        self.assertDependentsMatchScans()
+
+        sda = devicetree.getDeviceByName("sda")
+        self.assertEqual([d.name for d in devicetree.getDependentDevices(sda)],
+                         ["sda1", "Vol-Group", "Vol-Group-lv_root",
+                          "Vol-Group-lv-home"])
+
+        # parents lists get changed in place, eg: when a vg gains a pv
+        sdc1 = devicetree.getDeviceByName("sdc1")
+        vg = devicetree.getDeviceByName("Vol-Group")
+        vg.parents.append(sdc1)
+        self.assertEqual(devicetree.getChildren(sdc1), [vg])
+        self.assertDependentsMatchScans()
+
+        vg.parents.remove(sdc1)
+        self.assertEqual(devicetree.getChildren(sdc1), [])
+        self.assertDependentsMatchScans()
+
+        # the logical partitions depend on the extended partition
+        sdc = devicetree.getDeviceByName("sdc")
+        extended = self.newDevice(device_class=PartitionDevice, exists=True,
+                                  name="sdc2", parents=[sdc], size=1000)
+        extended.partedPartition.type = parted.PARTITION_EXTENDED
+        devicetree._addDevice(extended)
+        logical = self.newDevice(device_class=PartitionDevice, exists=True,
+                                 name="sdc5", parents=[sdc], size=999)
+        logical.partedPartition.type = parted.PARTITION_LOGICAL
+        logical.format = self.newFormat("lvmpv", device=logical.path,
+                                        exists=True)
+        devicetree._addDevice(logical)
+        vg2 = self.newDevice(device_class=LVMVolumeGroupDevice, name="vg2",
+                             parents=[logical], exists=True)
+        devicetree._addDevice(vg2)
+        lv = self.newDevice(device_class=LVMLogicalVolumeDevice, name="lv",
+                            vgdev=vg2, size=900, exists=True)
+        devicetree._addDevice(lv)
+        self.assertEqual(devicetree.getDependentDevices(extended),
+                         [logical, vg2, lv])
+        self.assertDependentsMatchScans()
+
+        devicetree._removeDevice(lv)
+        self.assertEqual(devicetree.getChildren(vg2), [])
+        self.assertDependentsMatchScans()
+
+    def testDependentsOfManyDisks(self):
+        """ Verify finding the dependents of each of many disks. """
+        self.setUpStorage()
+        devicetree = self.storage.devicetree
+        disks = []
+        for i in range(250):
+            disk = self.newDevice(device_class=DiskDevice,
+                                  name="sd%d" % i, size=1000)
+            disk.format = self.newFormat("disklabel", path=disk.path,
+                                         exists=True)
+            devicetree._addDevice(disk)
+            part = self.newDevice(device_class=PartitionDevice,
+                                  name="sd%d1" % i, exists=True,
+                                  parents=[disk], size=999)
+            devicetree._addDevice(part)
+            disks.append(disk)
+
+        # this is what clearing all of the disks amounts to
+        for disk in disks:
+            self.assertEqual([d.name for d in
+                              devicetree.getDependentDevices(disk)],
+                             [disk.name + "1"])
+
+    def setUpRescan(self):
+        """ Make the tree look like populate found it in udev. """
+        devicetree = self.storage.devicetree
+        self.infos = []
+        for (i, device) in enumerate(devicetree.devices):
+            if device.type == "lvmvg":
+                continue
+            elif device.type == "lvmlv":
+                device.sysfsPath = "/devices/virtual/block/dm-%d" % i
+            elif device.type == "partition":
+                device.sysfsPath = "/devices/pci/block/%s/%s" \
+                                   % (device.disk.name, device.name)
+            else:
+                device.sysfsPath = "/devices/pci/block/%s" % device.name
+
+            info = {"name": device.sysfsPath.split("/")[-1],
+                    "sysfs_path": device.sysfsPath,
+                    "ID_FS_TYPE": device.format.type}
+            devicetree._udevSeen[device.sysfsPath] = \
+                devicetree._udevFingerprint(info)
+            self.infos.append(info)
+
+        # newDevice does not count partitions as their disks' children
+        for device in devicetree.devices:
+            device.kids = len(devicetree.getChildren(device))
+
+        devicetree.populated = True
+        self.scanned = []
+        def addUdevDevice(info):
+            devicetree._udevSeen[info["sysfs_path"]] = \
+                devicetree._udevFingerprint(info)
+            self.scanned.append(info["name"])
+
+        devicetree.addUdevDevice = addUdevDevice
+        devicetree._setupLvs = lambda: False
+        devicetree.backupConfigs = lambda restore=False: None
+        devicetree.restoreConfigs = lambda: None
+
+    def rescan(self, infos, conf=None):
+        module = storage.devicetree
+        saved = module.udev_get_block_devices
+        module.udev_get_block_devices = lambda: infos
+        try:
+            return self.storage.devicetree.rescan(conf=conf)
+        finally:
+            module.udev_get_block_devices = saved
+
+    def testRescan(self):
+        """ Verify that rescan only rescans the devices that changed. """
+        devicetree = self.storage.devicetree
+        self.setUpRescan()
+        count = len(devicetree.devices)
+
+        # nothing changed
+        self.assertTrue(self.rescan(self.infos))
+        self.assertEqual(self.scanned, [])
+        self.assertEqual(len(devicetree.devices), count)
+
+        # a "change" uevent for every device changes nothing by itself
+        infos = [dict(i) for i in self.infos]
+        for (seqnum, info) in enumerate(infos):
+            info["SEQNUM"] = str(1000 + seqnum)
+            info["USEC_INITIALIZED"] = str(5000000 + seqnum)
+        self.assertTrue(self.rescan(infos))
+        self.assertEqual(self.scanned, [])
+        self.assertEqual(len(devicetree.devices), count)
+
+        # sdc1 went away, so sdc's partition table changed
+        infos = [i for i in self.infos if i["name"] != "sdc1"]
+        self.assertTrue(self.rescan(infos))
+        self.assertEqual(self.scanned, ["sdc"])
+        self.assertEqual(devicetree.getDeviceByName("sdc"), None)
+        self.assertEqual(devicetree.getDeviceByName("sdc1"), None)
+        self.assertEqual(len(devicetree.devices), count - 2)
+
+        # a new disk shows up
+        del self.scanned[:]
+        infos.append({"name": "sdd", "sysfs_path": "/devices/pci/block/sdd"})
+        self.assertTrue(self.rescan(infos))
+        self.assertEqual(self.scanned, ["sdd"])
+
+        # a pv changed, so its vg and lvs have to be rescanned
+        del self.scanned[:]
+        infos = [dict(i) for i in infos]
+        for info in infos:
+            if info["name"] == "sda1":
+                info["ID_FS_TYPE"] = "ext4"
+        self.assertTrue(self.rescan(infos))
+        self.assertEqual(sorted(self.scanned), ["dm-7", "dm-8", "sda1"])
+        self.assertEqual(devicetree.getDeviceByName("Vol-Group"), None)
+        self.assertEqual(devicetree.getDeviceByName("sdb1").kids, 0)
+        self.assertLookupsMatchScans()
+
+    def testRescanFallback(self):
+        """ Verify that rescan refuses to throw away scheduled actions. """
+        devicetree = self.storage.devicetree
+        self.setUpRescan()
+        lv = devicetree.getDeviceByName("Vol-Group-lv_root")
+        devicetree.registerAction(storage.deviceaction.ActionDestroyFormat(lv))
+
+        infos = [dict(i) for i in self.infos]
+        for info in infos:
+            if info["name"] == "sdb1":
+                info["ID_FS_TYPE"] = "swap"
+        self.assertFalse(self.rescan(infos))
+        self.assertEqual(self.scanned, [])
+        self.assertEqual(devicetree.getDeviceByName("sdb1").kids, 1)
+
+        # a different configuration means building a new tree
+        conf = storage.StorageDiscoveryConfig()
+        conf.exclusiveDisks = ["sda"]
+        self.assertFalse(self.rescan(self.infos, conf=conf))
+
+    def testRescanExclusiveDisks(self):
+        """ Verify that rescan picks up disks added to exclusiveDisks. """
+        devicetree = self.storage.devicetree
+        self.setUpRescan()
+        conf = storage.StorageDiscoveryConfig()
+        conf.exclusiveDisks = ["sda", "sdb", "sdc"]
+        devicetree.exclusiveDisks = conf.exclusiveDisks
+        devicetree._conf = devicetree._confKey(conf)
+
+        # sdd and its partition were ignored the first time around
+        infos = list(self.infos)
+        for name in ("sdd", "sdd/sdd1", "sde"):
+            info = {"name": name.split("/")[-1],
+                    "sysfs_path": "/devices/pci/block/%s" % name}
+            devicetree._udevSeen[info["sysfs_path"]] = \
+                devicetree._udevFingerprint(info)
+            devicetree.addIgnoredDisk(info["name"])
+            infos.append(info)
+
+        conf = storage.StorageDiscoveryConfig()
+        conf.exclusiveDisks = ["sda", "sdb", "sdc", "sdd"]
+        self.assertTrue(self.rescan(infos, conf=conf))
+        self.assertEqual(sorted(self.scanned), ["sdd", "sdd1"])
+        self.assertEqual(devicetree._ignoredDisks, ["sde"])
+        self.assertEqual(devicetree.exclusiveDisks, conf.exclusiveDisks)
+
+        # the tree now follows the new configuration
+        del self.scanned[:]
+        self.assertTrue(self.rescan(infos, conf=conf))
+        self.assertEqual(self.scanned, [])
+
+        # dropping a disk still means building a new tree
+        conf = storage.StorageDiscoveryConfig()
+        conf.exclusiveDisks = ["sda", "sdb"]
+        self.assertFalse(self.rescan(infos, conf=conf))
+
+    def testPopulateLookups(self):
+        """ Verify lookups while adding devices the way populate does. """
+        self.setUpStorage()
+        devicetree = self.storage.devicetree
+        for i in range(500):
+            # this is the pattern addUdevDevice follows for every device it
+            # scans: look it up, add it, set its format, look it up again
+            name = "sd%d" % i
+            self.assertEqual(devicetree.getDeviceByName(name), None)
+            disk = DiskDevice(name, size=1000, serial="serial%d" % i,
+                              sysfsPath="/devices/%s" % name)
+            devicetree._addDevice(disk)
+            disk.format = storage.formats.getFormat("ext4",
+                                                    uuid="uuid%d" % i,
+                                                    exists=True)
+            self.assertIs(devicetree.getDeviceByUuid("uuid%d" % i), disk)
+            self.assertIs(devicetree.getDeviceBySysfsPath(disk.sysfsPath),
+                          disk)
+
+        self.assertEqual(len(devicetree.devices), 500)
+        self.assertEqual(devicetree.getDeviceByName("sd250").serial,
+                         "serial250")
+
+
+def suite():
+    return unittest.TestLoader().loadTestsFromTestCase(DeviceTreeTestCase)
+
+
+if __name__ == "__main__":
+    unittest.main()
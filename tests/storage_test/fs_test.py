@@ -0,0 +1,84 @@
+#!/usr/bin/python
+
+import unittest
+
+from storagetestcase import StorageTestCase
+import pyanaconda.storage as storage
+from pyanaconda.storage.errors import FSError
+
+""" FSTestSuite """
+
+class FSMinSizeTestCase(StorageTestCase):
+    def setUp(self):
+        """ Count the times an NTFS minimum size gets determined. """
+        self.setUpAnaconda()
+        self.fs = storage.formats.fs
+        self.fs._minSizeCache.clear()
+
+        self.calls = []
+        def getMinSize(fmt):
+            self.calls.append(fmt.uuid)
+            if fmt.uuid == "broken":
+                raise FSError("no minimum size for you")
+            return 1000
+
+        self.saved = self.fs.NTFS._getMinSize
+        self.fs.NTFS._getMinSize = getMinSize
+
+    def tearDown(self):
+        self.fs.NTFS._getMinSize = self.saved
+        self.fs._minSizeCache.clear()
+
+    def newNTFS(self, uuid, size=5000):
+        return self.newFormat("ntfs", device="/dev/sda1", uuid=uuid,
+                              size=size, exists=True)
+
+    def testLazyMinSize(self):
+        """ Verify that minimum sizes are determined once and on demand. """
+        fmt = self.newNTFS("uuid1")
+        self.assertEqual(self.calls, [])
+        self.assertEqual(fmt.minSize, 1000)
+        self.assertEqual(fmt.minSize, 1000)
+        self.assertEqual(self.calls, ["uuid1"])
+
+        # a new instance of the same filesystem, eg: after a reset
+        self.assertEqual(self.newNTFS("uuid1").minSize, 1000)
+        self.assertEqual(self.calls, ["uuid1"])
+
+        # a filesystem that has changed size is not the same anymore
+        self.assertEqual(self.newNTFS("uuid1", size=6000).minSize, 1000)
+        self.assertEqual(self.calls, ["uuid1", "uuid1"])
+
+        fmt._resetMinSize()
+        self.assertEqual(fmt.minSize, 1000)
+        self.assertEqual(len(self.calls), 3)
+
+        # filesystems that do not exist yet are not worth remembering
+        fmt = self.newFormat("ntfs", device="/dev/sda2", uuid="uuid2")
+        fmt.minSize
+        self.assertEqual(len(self.fs._minSizeCache), 2)
+
+    def testMinSizeFailure(self):
+        """ Verify that a filesystem we know nothing about is not shrunk. """
+        fmt = self.newNTFS("broken")
+        self.assertEqual(fmt.minSize, 5000)
+        self.assertEqual(self.newNTFS("broken").minSize, 5000)
+        self.assertEqual(self.calls, ["broken", "broken"])
+
+    def testPrefetch(self):
+        """ Verify that prefetched minimum sizes end up in the cache. """
+        fmts = [self.newNTFS("uuid%d" % i) for i in range(3)]
+        fmts.append(self.newFormat("ext4", device="/dev/sdb1"))
+        self.fs.prefetchMinSizes(fmts).join()
+        self.assertEqual(self.calls, ["uuid0", "uuid1", "uuid2"])
+
+        self.assertEqual([f.minSize for f in fmts[:3]], [1000] * 3)
+        self.assertEqual(len(self.calls), 3)
+
+
+def suite():
+    return unittest.TestLoader().loadTestsFromTestCase(FSMinSizeTestCase)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,95 @@
+#!/usr/bin/python
+
+import unittest
+
+from storagetestcase import StorageTestCase
+import pyanaconda.storage as storage
+import pyanaconda.storage.probe
+
+# device classes for brevity's sake -- later on, that is
+from pyanaconda.storage.devices import DiskDevice
+from pyanaconda.storage.devices import PartitionDevice
+from pyanaconda.storage.devices import LVMVolumeGroupDevice
+from pyanaconda.storage.devices import LVMLogicalVolumeDevice
+
+""" ProbeTestSuite """
+
+class ProbeTestCase(StorageTestCase):
+    def setUp(self):
+        """ Create a disk with a pv partition, a vg and a handful of lvs. """
+        self.setUpAnaconda()
+        devicetree = self.storage.devicetree
+
+        disk = self.newDevice(device_class=DiskDevice, name="sda",
+                              size=100000)
+        disk.format = self.newFormat("disklabel", path=disk.path, exists=True)
+        devicetree._addDevice(disk)
+
+        part = self.newDevice(device_class=PartitionDevice, exists=True,
+                              name="sda1", parents=[disk], size=99999)
+        part.format = self.newFormat("lvmpv", device=part.path, exists=True)
+        devicetree._addDevice(part)
+
+        vg = self.newDevice(device_class=LVMVolumeGroupDevice, name="vg",
+                            parents=[part], exists=True)
+        devicetree._addDevice(vg)
+
+        self.infos = []
+        for (i, fstype) in enumerate(["ext4", "xfs", "swap", "ext4"]):
+            lv = self.newDevice(device_class=LVMLogicalVolumeDevice,
+                                name="lv%d" % i, vgdev=vg, size=1000,
+                                exists=True)
+            devicetree._addDevice(lv)
+            self.infos.append({"name": "dm-%d" % i,
+                               "sysfs_path": "/devices/virtual/block/dm-%d" % i,
+                               "DM_NAME": lv.name,
+                               "ID_FS_TYPE": fstype,
+                               "ID_FS_UUID": "uuid-%d" % i,
+                               "ID_FS_LABEL": "label%d" % i})
+
+    def testFormatArguments(self):
+        """ Verify which devices get probed and with what arguments. """
+        probe = pyanaconda.storage.probe
+        (args, kwargs) = probe.formatArguments(self.infos[0])
+        self.assertEqual(args, ["ext4"])
+        self.assertEqual(kwargs, {"uuid": "uuid-0", "label": "label0",
+                                  "device": "/dev/mapper/vg-lv0",
+                                  "serial": None, "exists": True})
+
+        # swap is not a filesystem, so there is nothing worth probing
+        self.assertEqual(probe.formatArguments(self.infos[2]), None)
+        self.assertEqual(probe.formatArguments({"name": "sdb"}), None)
+
+        # the arguments have to match for a probed format to be used
+        result = probe.probeDevice(self.infos[0])
+        self.assertEqual(result.name, "vg-lv0")
+        self.assertIs(result.formatFor(args, kwargs), result.format)
+        self.assertEqual(result.formatFor(["efi"], kwargs), None)
+
+    def testProbedFormats(self):
+        """ Verify that the device tree uses the formats probed for it. """
+        results = pyanaconda.storage.probe.probeDevices(self.infos, 3)
+        self.assertEqual(sorted(results.keys()),
+                         ["vg-lv0", "vg-lv1", "vg-lv3"])
+
+        devicetree = self.storage.devicetree
+        devicetree._probed = dict(results)
+        for info in self.infos:
+            device = devicetree.getDeviceByName(info["DM_NAME"])
+            devicetree.handleUdevDeviceFormat(info, device)
+            self.assertEqual(device.format.type, info["ID_FS_TYPE"])
+            self.assertEqual(device.format.uuid, info["ID_FS_UUID"])
+            self.assertEqual(device.format.device, device.path)
+            if device.name in results:
+                self.assertIs(device.format, results[device.name].format)
+
+        self.assertEqual(devicetree._probed, {})
+        self.assertEqual(devicetree.getDeviceByUuid("uuid-1").name, "vg-lv1")
+
+
+def suite():
+    return unittest.TestLoader().loadTestsFromTestCase(ProbeTestCase)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,113 @@
+#!/usr/bin/python
+
+import os
+import shutil
+import threading
+import unittest
+from mock import Mock
+
+import pyanaconda.storage as storage
+
+""" RootDevicesTestSuite """
+
+class FindExistingRootDevicesTestCase(unittest.TestCase):
+    # what each filesystem has in its /etc, None for no /etc at all
+    _releases = {"sda1": "Fedora release 17 (Beefy Miracle)",
+                 "sdb1": "Fedora release 3 (Heidelberg)",
+                 "sdc1": None,
+                 "sdd1": "Fedora release 16 (Verne)"}
+
+    def setUp(self):
+        self.mounts = []
+        self.mountpoints = set()
+        self.lock = threading.Lock()
+        self.devices = [self.newDevice(n) for n in sorted(self._releases)]
+        self.devices.append(self.newDevice("sde1", mountable=False))
+        self.devices[-2].protected = True
+
+        self.anaconda = Mock()
+        self.anaconda.storage.devicetree.leaves = self.devices
+        def productUpgradable(arch, product, version):
+            return (version != "3", {"version": version != "3"})
+        self.anaconda.instClass.productUpgradable.side_effect = productUpgradable
+
+        self.execWithCapture = storage.iutil.execWithCapture
+        storage.iutil.execWithCapture = lambda *args, **kwargs: "x86_64\n"
+        storage._releaseCache.clear()
+
+    def tearDown(self):
+        storage.iutil.execWithCapture = self.execWithCapture
+        storage._releaseCache.clear()
+
+    def newDevice(self, name, mountable=True):
+        device = Mock()
+        device.name = name
+        device.protected = False
+        device.format.linuxNative = True
+        device.format.mountable = mountable
+        device.format.uuid = "uuid-" + name
+
+        def mount(options=None, mountpoint=None):
+            with self.lock:
+                self.mounts.append(name)
+                self.mountpoints.add(mountpoint)
+
+            release = self._releases[name]
+            if release is None:
+                return
+
+            os.mkdir(mountpoint + "/etc")
+            open(mountpoint + "/etc/fstab", "w").close()
+            open(mountpoint + "/etc/redhat-release", "w").write(release)
+
+        def unmount():
+            mountpoint = device.format.mount.call_args[1]["mountpoint"]
+            shutil.rmtree(mountpoint + "/etc", ignore_errors=True)
+
+        device.format.mount.side_effect = mount
+        device.format.unmount.side_effect = unmount
+        return device
+
+    def testFindRoots(self):
+        """ Verify that roots are found and remembered across resets. """
+        (roots, others) = storage.findExistingRootDevices(self.anaconda)
+        self.assertEqual([(d.name, r) for (d, r) in roots],
+                         [("sda1", "Fedora 17")])
+        self.assertEqual([o[:4] for o in others],
+                         [("Fedora", "3", "x86_64", "sdb1")])
+
+        # every filesystem got its own mountpoint, and they are all gone
+        self.assertEqual(sorted(self.mounts), ["sda1", "sdb1", "sdc1"])
+        self.assertEqual(len(self.mountpoints), 3)
+        for mountpoint in self.mountpoints:
+            self.assertFalse(os.path.exists(mountpoint))
+
+        for device in self.devices[:3]:
+            self.assertTrue(device.setup.called)
+            self.assertTrue(device.teardown.called)
+
+        # the second time around nothing needs to be mounted
+        (roots, others) = storage.findExistingRootDevices(self.anaconda,
+                                                          upgradeany=True)
+        self.assertEqual([d.name for (d, r) in roots], ["sda1", "sdb1"])
+        self.assertEqual(len(self.mounts), 3)
+
+    def testMountFailure(self):
+        """ Verify that a filesystem that failed to mount is tried again. """
+        self.devices[0].format.mount.side_effect = OSError("no can do")
+        (roots, others) = storage.findExistingRootDevices(self.anaconda)
+        self.assertEqual(roots, [])
+        self.assertEqual(self.devices[0].teardown.call_count, 1)
+
+        self.devices[0].format.mount.side_effect = None
+        storage.findExistingRootDevices(self.anaconda)
+        self.assertEqual(self.devices[0].format.mount.call_count, 2)
+        self.assertEqual(sorted(self.mounts), ["sdb1", "sdc1"])
+
+
+def suite():
+    return unittest.TestLoader().loadTestsFromTestCase(FindExistingRootDevicesTestCase)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,99 @@
+#!/usr/bin/python
+
+import os
+import tempfile
+import unittest
+
+from pyanaconda.storage.snapshot import StateLog, readSnapshots, \
+                                        findSnapshot, diffSnapshots
+
+""" SnapshotTestSuite """
+
+class FakeDevice(object):
+    def __init__(self, id, name, fmt):
+        self.id = id
+        self.name = name
+        self.fmt = fmt
+
+    @property
+    def dict(self):
+        return {"name": self.name, "format": {"type": self.fmt}}
+
+class FakeAction(object):
+    def __init__(self, id, description):
+        self.id = id
+        self.description = description
+
+    def __str__(self):
+        return self.description
+
+class StateLogTestCase(unittest.TestCase):
+    def setUp(self):
+        (fd, self.path) = tempfile.mkstemp()
+        os.close(fd)
+
+    def tearDown(self):
+        os.unlink(self.path)
+
+    def testSnapshots(self):
+        """ Verify that snapshots read back the way they were written. """
+        sda = FakeDevice(0, "sda", "disklabel")
+        sda1 = FakeDevice(1, "sda1", None)
+        sda2 = FakeDevice(2, "sda2", "ext4")
+
+        create = FakeAction(0, "[0] Create Format")
+        resize = FakeAction(1, "[1] Resize Device")
+
+        stateLog = StateLog(self.path)
+        stateLog.write("initial", [sda, sda1], actions=[create, resize])
+        sda1.fmt = "xfs"
+        stateLog.write("action.0", [sda, sda1], actions=[resize])
+        stateLog.write("final", [sda, sda1, sda2])
+
+        # unchanged devices only take a short line and actions are only
+        # logged when they enter and leave the queue
+        lines = open(self.path).readlines()
+        self.assertEqual(len(lines), 14)
+        self.assertEqual(lines[6], '{"device": 0}\n')
+        self.assertEqual(lines[8], '{"done": 0}\n')
+
+        snapshots = list(readSnapshots(self.path))
+        self.assertEqual([s[0] for s in snapshots],
+                         ["initial", "action.0", "final"])
+        self.assertEqual(snapshots[0][2][1]["format"]["type"], None)
+        self.assertEqual(snapshots[1][2][1]["format"]["type"], "xfs")
+        self.assertEqual(snapshots[0][3], [str(create), str(resize)])
+        self.assertEqual(snapshots[1][3], [str(resize)])
+        self.assertEqual(snapshots[2][3], [])
+        self.assertIs(snapshots[0][2][0]["name"], snapshots[2][2][0]["name"])
+
+        (added, removed, changed) = diffSnapshots(
+                                        findSnapshot(self.path, "initial"),
+                                        findSnapshot(self.path, "final"))
+        self.assertEqual(added, [2])
+        self.assertEqual(removed, [])
+        self.assertEqual(changed, {1: {"format.type": (None, "xfs")}})
+
+        # devices that cannot have changed are not looked at again
+        stateLog.write("action.1", [sda, sda1, sda2], changed=set([1]))
+        sda1.fmt = "vfat"
+        stateLog.write("action.2", [sda, sda1, sda2], changed=set([2]))
+        self.assertEqual(findSnapshot(self.path, "action.2")[2][1],
+                         snapshots[1][2][1])
+
+        # a new log on the same file starts over with complete records
+        stateLog.write("action.3", [sda2], actions=[create])
+        StateLog(self.path).write("initial", [sda2], actions=[resize])
+        self.assertEqual(findSnapshot(self.path, "initial")[2].keys(), [2])
+        self.assertEqual(findSnapshot(self.path, "initial")[3], [str(resize)])
+        (added, removed, changed) = diffSnapshots(snapshots[2],
+                                       findSnapshot(self.path, "initial"))
+        self.assertEqual((added, removed, changed), ([], [0, 1], {}))
+
+
+def suite():
+    return unittest.TestLoader().loadTestsFromTestCase(StateLogTestCase)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,102 @@
+#!/usr/bin/python
+
+import unittest
+
+import pyanaconda.storage.udev as udev
+from pyanaconda.storage.devices import deviceNameToDiskByPath
+
+""" UdevTestSuite """
+
+class BlockDeviceSnapshotTestCase(unittest.TestCase):
+    _devices = {
+        "/devices/sda": {"name": "sda", "sysfs_path": "/devices/sda",
+                         "symlinks": ["/dev/disk/by-path/pci-0:0:0:0",
+                                      "/dev/disk/by-id/ata-DISK"]},
+        "/devices/sda/sda1": {"name": "sda1",
+                              "sysfs_path": "/devices/sda/sda1",
+                              "ID_FS_UUID": "uuid1", "ID_FS_LABEL": "boot",
+                              "symlinks": ["/dev/disk/by-uuid/uuid1",
+                                           "/dev/disk/by-label/boot"]},
+        "/devices/dm-0": {"name": "dm-0", "sysfs_path": "/devices/dm-0",
+                          "DM_NAME": "vg-root", "ID_FS_UUID": "uuid2",
+                          "symlinks": ["/dev/mapper/vg-root",
+                                       "/dev/vg/root"]},
+    }
+
+    def setUp(self):
+        self.seqnum = 100
+        self.waits = 0
+        self.saved = dict((name, getattr(udev, name))
+                          for name in ("udev_get_uevent_seqnum",
+                                       "udev_wait_for_block_devices",
+                                       "udev_enumerate_block_devices",
+                                       "udev_get_block_device"))
+
+        def wait():
+            # this is what loading and removing scsi_wait_scan looks like
+            self.waits += 1
+            self.seqnum += 2
+
+        udev.udev_get_uevent_seqnum = lambda: self.seqnum
+        udev.udev_wait_for_block_devices = wait
+        udev.udev_enumerate_block_devices = lambda: sorted(self._devices)
+        udev.udev_get_block_device = lambda path: dict(self._devices[path])
+        udev._snapshot = None
+
+    def tearDown(self):
+        for (name, value) in self.saved.items():
+            setattr(udev, name, value)
+
+        udev._snapshot = None
+
+    def testResolveDevspec(self):
+        """ Verify that devspecs resolve the way they always have. """
+        resolve = udev.udev_resolve_devspec
+        self.assertEqual(resolve("sda1"), "sda1")
+        self.assertEqual(resolve("/dev/sda1"), "sda1")
+        self.assertEqual(resolve("LABEL=boot"), "sda1")
+        self.assertEqual(resolve("UUID=uuid2"), "vg-root")
+        self.assertEqual(resolve("/dev/mapper/vg-root"), "vg-root")
+        self.assertEqual(resolve("vg/root"), "vg-root")
+        self.assertEqual(resolve("disk/by-id/ata-DISK"), "sda")
+        self.assertEqual(resolve("LABEL=nope"), None)
+        self.assertEqual(resolve("sdz"), None)
+        self.assertEqual(resolve(""), None)
+
+        self.assertEqual(sorted(udev.udev_resolve_glob("/dev/disk/by-*/*")),
+                         ["sda", "sda", "sda1", "sda1"])
+        self.assertEqual(udev.udev_resolve_glob("sd*"), ["sda", "sda1"])
+        self.assertEqual(deviceNameToDiskByPath("sda"),
+                         "/dev/disk/by-path/pci-0:0:0:0")
+        self.assertEqual(deviceNameToDiskByPath("sda1"), "sda1")
+        self.assertEqual(self.waits, 1)
+
+    def testRefresh(self):
+        """ Verify that the snapshot is only taken again after a uevent. """
+        snapshot = udev.udev_get_block_device_snapshot()
+        self.assertIs(udev.udev_get_block_device_snapshot(), snapshot)
+        self.assertEqual(self.waits, 1)
+
+        self._devices = dict(self._devices)
+        self._devices["/devices/sdb"] = {"name": "sdb",
+                                         "sysfs_path": "/devices/sdb",
+                                         "symlinks": []}
+        self.assertEqual(udev.udev_resolve_devspec("sdb"), None)
+
+        self.seqnum += 1
+        self.assertEqual(udev.udev_resolve_devspec("sdb"), "sdb")
+        self.assertEqual(self.waits, 2)
+
+        # without a seqnum there is no telling whether anything changed
+        udev.udev_get_uevent_seqnum = lambda: None
+        udev.udev_resolve_devspec("sdb")
+        udev.udev_resolve_devspec("sdb")
+        self.assertEqual(self.waits, 4)
+
+
+def suite():
+    return unittest.TestLoader().loadTestsFromTestCase(BlockDeviceSnapshotTestCase)
+
+
+if __name__ == "__main__":
+    unittest.main()
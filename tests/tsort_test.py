@@ -30,6 +30,17 @@ class TopologicalSortTestCase(unittest.TestCase):
         graph = pyanaconda.tsort.create_graph(items, edges)
         self._tsortTest(graph)
 
+        # ties are broken by position in the item list, and the graph is
+        # left intact
+        items = range(10)
+        edges = [(9, 0), (5, 3)]
+        graph = pyanaconda.tsort.create_graph(items, edges)
+        self.assertEqual(pyanaconda.tsort.tsort(graph),
+                         [1, 2, 4, 5, 3, 6, 7, 8, 9, 0])
+        self.assertEqual(graph['edges'], edges)
+        self.assertEqual(pyanaconda.tsort.tsort(graph),
+                         [1, 2, 4, 5, 3, 6, 7, 8, 9, 0])
+
     def _tsortTest(self, graph):
         def check_order(order, graph):
             # since multiple solutions can potentially exist, just verify